@@ -144,6 +144,66 @@ void mqttConnect() {
 }
 
 
+// Send the fixes in the compact binary format on <topic>/<user>/fixes, several per message, instead of one JSON
+// message per fix on <topic>/<user>/pos. See c3toctrack/payload.py for the format.
+#define BINARY_FIXES 1
+// seconds between two fixes
+const int FIX_INTERVAL = 2;
+// fixes sent in one message; one message every FIX_INTERVAL * FIXES_PER_MESSAGE seconds
+const int FIXES_PER_MESSAGE = 5;
+const uint8_t PAYLOAD_VERSION = 1;
+
+struct __attribute__((packed)) fixesHeader {
+  uint8_t version;
+  uint8_t count;
+  uint32_t time;
+  uint16_t vbat;
+  uint16_t vbus;
+  int8_t rssi;
+  uint8_t bssid[6];
+};
+
+struct __attribute__((packed)) fix {
+  uint16_t dt;
+  int32_t lat;
+  int32_t lon;
+  uint8_t sat;
+  uint16_t speed;
+};
+
+struct __attribute__((packed)) fixesMessage {
+  struct fixesHeader header;
+  struct fix fixes[FIXES_PER_MESSAGE];
+} fixesMessage;
+
+
+void addFix(time_t now) {
+  struct fixesHeader *header = &fixesMessage.header;
+  if (header->count == 0) {
+    header->time = (uint32_t)now;
+  }
+  struct fix *f = &fixesMessage.fixes[header->count++];
+  f->dt = (uint16_t)(now - header->time);
+  f->lat = (int32_t)lround(gps.location.lat() * 1e7);
+  f->lon = (int32_t)lround(gps.location.lng() * 1e7);
+  f->sat = (uint8_t)min(gps.satellites.value(), (uint32_t)255);
+  f->speed = (uint16_t)lround(gps.speed.kmph() * 10);
+}
+
+
+void publishFixes() {
+  struct fixesHeader *header = &fixesMessage.header;
+  header->version = PAYLOAD_VERSION;
+  header->vbat = (uint16_t)PMU->getBattVoltage();
+  header->vbus = (uint16_t)PMU->getVbusVoltage();
+  header->rssi = (int8_t)WiFi.RSSI();
+  memcpy(header->bssid, WiFi.BSSID(), sizeof(header->bssid));
+  pubSubClient.publish(format_topic(topic, mqttParam.user, "fixes"), (const uint8_t *)&fixesMessage,
+    sizeof(struct fixesHeader) + header->count * sizeof(struct fix));
+  header->count = 0;
+}
+
+
 void mqttUpdate() {
   char payload[512];
   char ts[64];
@@ -157,19 +217,33 @@ void mqttUpdate() {
       delay(1000);
       continue;
     }
+
+    now = time(nullptr);
+#if BINARY_FIXES
+    addFix(now);
+    if (fixesMessage.header.count < FIXES_PER_MESSAGE) {
+      delay(FIX_INTERVAL * 1000);
+      continue;
+    }
+#endif
     Serial.print("Updating MQTT (");
     Serial.print(WiFi.RSSI());
     Serial.print(" dB; ");
     Serial.print(WiFi.BSSIDstr());
     Serial.print("): ");
 
-    now = time(nullptr);
     gmtime_r(&now, &timeinfo);
     strftime(ts, sizeof(ts), "%Y-%m-%dT%H:%M:%SZ", &timeinfo);
 
     snprintf(payload, sizeof(payload), "alive %s", ts);
     pubSubClient.publish(format_topic(topic, mqttParam.user, "status"), payload);
 
+#if BINARY_FIXES
+    publishFixes();
+    Serial.println("sent");
+
+    delay(FIX_INTERVAL * 1000);
+#else
     snprintf(payload, sizeof(payload), "{\"lat\":%.5f,\"lon\":%.5f,\"sat\":%d,\"speed\":%.1f,\"Vbat\":%.2f,\"Vbus\":%.2f,\"ts\":\"%s\",\"rssi\":%d,\"bssid\":\"%s\"}",
       gps.location.lat(),
       gps.location.lng(),
@@ -185,6 +259,7 @@ void mqttUpdate() {
     Serial.println("sent");
 
     delay(10000);
+#endif
   }
 }
 
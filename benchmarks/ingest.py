@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+Compare the per-message overhead of receiving a position, apart from snapping and ETAs, against the way
+MqttTrainReporterClient handled messages before: decoding the payload, the debug output, and finding trains to remove
+in cleanup().
+
+    poetry run python benchmarks/ingest.py
+"""
+import contextlib
+import io
+import json
+import logging
+import os
+import sys
+import time
+from datetime import datetime, timedelta, UTC
+
+from dateutil.parser import parse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from c3toctrack import TracksModel
+from c3toctrack.processor import PositionProcessor, decode, orjson
+from c3toctrack.replay import synthetic_stream
+
+logger = logging.getLogger('c3toctrack.mqttclient')
+
+
+def before(topic: str, payload: bytes, pos: dict):
+    """
+    The work handle_message and process_position did besides snapping, with all output printed to stdout.
+    :param pos: the processed position, as it was printed at the end
+    """
+    print(f'Message received for topic "{topic}": "{payload}"')
+    (_, _, name, kind) = topic.split('/')
+    if kind == 'pos':
+        decoded = json.loads(payload.decode('utf-8'))
+        print(f"snapped to {pos['trackname']} - loco {pos['trackmarker']:4.0f} - distance {1.5:4.1f}")
+        print(f'JSON {pos}')
+        return decoded
+
+
+def after(topic: str, payload: bytes, pos: dict):
+    """
+    The same work as done now, with debug logging disabled.
+    """
+    logger.debug('Message received for topic "%s": "%s"', topic, payload)
+    decoded = decode(topic, payload)
+    logger.debug('snapped to %s - loco %4.0f - distance %4.1f', pos['trackname'], pos['trackmarker'], 1.5)
+    logger.debug('JSON %s', pos)
+    return decoded
+
+
+def cleanup_before(trains: dict) -> int:
+    dropped = 0
+    for name in list(trains.keys()):
+        timestamp = parse(trains[name]['timestamp'])
+        if datetime.now(tz=UTC) - timestamp > timedelta(minutes=10):
+            dropped += 1
+    return dropped
+
+
+def cleanup_after(timestamps: dict) -> int:
+    dropped = 0
+    oldest = time.time() - 600
+    for name, timestamp in list(timestamps.items()):
+        if timestamp < oldest:
+            dropped += 1
+    return dropped
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    tracksmodel = TracksModel('data/trainlines.gpx', {})
+    processor = PositionProcessor(tracksmodel)
+    messages = []
+    trains = {}
+    timestamps = {}
+    for t, topic, payload in synthetic_stream(tracksmodel, trains=50, duration=60):
+        name, pos = decode(topic, payload)
+        pos, timestamp = processor.process(name, pos)
+        messages.append((topic, payload, pos))
+        trains[name] = pos
+        timestamps[name] = timestamp
+
+    # print to a buffer, so the speed of the terminal does not count
+    with contextlib.redirect_stdout(io.StringIO()):
+        t0 = time.perf_counter()
+        for topic, payload, pos in messages:
+            before(topic, payload, pos)
+        t1 = time.perf_counter()
+    for topic, payload, pos in messages:
+        after(topic, payload, pos)
+    t2 = time.perf_counter()
+    for topic, payload, pos in messages:
+        json.loads(payload)
+    t3 = time.perf_counter()
+    for i in range(0, 100):
+        cleanup_before(trains)
+    t4 = time.perf_counter()
+    for i in range(0, 100):
+        cleanup_after(timestamps)
+    t5 = time.perf_counter()
+
+    count = len(messages)
+    print(f'message before {(t1 - t0) / count * 1e6:7.1f} µs   after {(t2 - t1) / count * 1e6:5.1f} µs   '
+          f'({"orjson" if orjson is not None else "json"}; json alone {(t3 - t2) / count * 1e6:5.1f} µs)')
+    print(f'cleanup of {len(trains)} trains before {(t4 - t3) / 100 * 1e6:7.1f} µs   '
+          f'after {(t5 - t4) / 100 * 1e6:5.1f} µs')
+
+
+if __name__ == '__main__':
+    main()
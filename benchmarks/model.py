@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+Measure load time, memory use, and serialization time of TracksModel for a large synthetic network, and the size of
+tracks.geojson with all points, minified, and simplified for the zoom levels of the map.
+
+    poetry run python benchmarks/model.py --tracks 100 --points 1000
+    poetry run python benchmarks/model.py --tracks 100 --points 1000 --osm
+"""
+import argparse
+import gc
+import glob
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from c3toctrack import TracksModel
+from c3toctrack.lod import ZOOMS
+from synthetic import write_gpx, write_osm
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure TracksModel for a synthetic network.')
+    parser.add_argument('--tracks', type=int, default=100)
+    parser.add_argument('--points', type=int, default=1000, help='points per track')
+    parser.add_argument('--osm', action='store_true', help='load the network from OSM XML instead of GPX, with as many '
+                                                           'nodes that are not tracks as there are track nodes')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.osm:
+            gpx = os.path.join(tmp, 'synthetic.osm')
+            write_osm(gpx, args.tracks, args.points)
+        else:
+            gpx = os.path.join(tmp, 'synthetic.gpx')
+            write_gpx(gpx, args.tracks, args.points)
+
+        gc.collect()
+        t0 = time.perf_counter()
+        model = TracksModel(gpx, {})
+        t1 = time.perf_counter()
+        del model
+
+        gc.collect()
+        tracemalloc.start()
+        model = TracksModel(gpx, {})
+        (current, peak) = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        t2 = time.perf_counter()
+        model.write_json(os.path.join(tmp, 'tracks.json'))
+        t3 = time.perf_counter()
+        model.write_geojson(os.path.join(tmp, 'tracks.geojson'))
+        t4 = time.perf_counter()
+        model.write_lod(tmp, tiles=True)
+        t5 = time.perf_counter()
+        sizes = {name: os.path.getsize(os.path.join(tmp, name))
+                 for name in ['tracks.geojson', 'tracks.min.geojson', 'tracks.min.geojson.gz'] +
+                 [f'tracks-z{zoom}.geojson.gz' for zoom in ZOOMS]}
+        tiles = len(glob.glob(os.path.join(tmp, 'tiles', '*', '*', '*.geojson')))
+
+    print(f'{args.tracks * args.points} points')
+    print(f'load          {(t1 - t0) * 1000:8.0f} ms')
+    print(f'model memory  {current / 1e6:8.1f} MB (peak while loading {peak / 1e6:.1f} MB)')
+    print(f'write_json    {(t3 - t2) * 1000:8.0f} ms')
+    print(f'write_geojson {(t4 - t3) * 1000:8.0f} ms')
+    print(f'write_lod     {(t5 - t4) * 1000:8.0f} ms ({tiles} tiles)')
+    for name, size in sizes.items():
+        print(f'{name:25s} {size / 1000:8.1f} kB')
+
+
+if __name__ == '__main__':
+    main()
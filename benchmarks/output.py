@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+"""
+Measure the time to render and write trains.json and trains.geojson, and their size, as they were written before
+(indented, with json and geojson), and with the output formats of OutputFormat: indented, and compact with a gzip
+copy, and a Brotli copy if brotli is installed.
+
+    poetry run python benchmarks/output.py --trains 50
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import geojson
+from atomicwrites import atomic_write
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from c3toctrack import MqttTrainReporterClient, TracksModel
+from c3toctrack.output import COMPRESSORS, OutputFormat, orjson
+from c3toctrack.replay import synthetic_stream
+
+
+def before_json(client: MqttTrainReporterClient) -> str:
+    return json.dumps(client.trains, default=vars, ensure_ascii=False, sort_keys=True, indent=2)
+
+
+def before_geojson(client: MqttTrainReporterClient) -> str:
+    features = []
+    for name, train in client.trains['trains'].items():
+        properties = train.copy()
+        properties.update({'marker-symbol': 'rocket', 'marker-color': '#cc0', 'name': name})
+        features.append(geojson.Feature(geometry=geojson.Point((train['lon'], train['lat'])), properties=properties))
+    return geojson.dumps(geojson.FeatureCollection(features), ensure_ascii=False, sort_keys=True, indent=2)
+
+
+def measure(tmp: str, write, repeat: int) -> tuple:
+    """
+    :param write: function writing the files to a directory, and returning their names
+    :return: milliseconds per call, and the size of each file written
+    """
+    t0 = time.perf_counter()
+    for i in range(0, repeat):
+        filenames = write(tmp)
+    t1 = time.perf_counter()
+    sizes = {}
+    for filename in filenames:
+        for suffix in ('', '.gz', '.br'):
+            if os.path.exists(filename + suffix):
+                sizes[os.path.basename(filename) + suffix] = os.path.getsize(filename + suffix)
+    return (t1 - t0) / repeat * 1000, sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure writing trains.json and trains.geojson.')
+    parser.add_argument('--trains', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    tracksmodel = TracksModel('data/trainlines.gpx', {})
+    client = MqttTrainReporterClient(None, None, None, None, tracksmodel, None, None, max_flush_rate=0)
+    for t, topic, payload in synthetic_stream(tracksmodel, trains=args.trains, duration=args.trains):
+        client.handle_message(topic, payload)
+
+    def before(tmp):
+        for filename, render in (('trains.json', before_json), ('trains.geojson', before_geojson)):
+            with atomic_write(os.path.join(tmp, 'before', filename), mode='wb', overwrite=True) as f:
+                f.write(render(client).encode('utf-8'))
+        return [os.path.join(tmp, 'before', 'trains.json'), os.path.join(tmp, 'before', 'trains.geojson')]
+
+    def after(name: str, output_format: OutputFormat):
+        def write(tmp):
+            client.output_format = output_format
+            client.trains_json = os.path.join(tmp, name, 'trains.json')
+            client.trains_geojson = os.path.join(tmp, name, 'trains.geojson')
+            client.update_trains()
+            client.write_geojson()
+            return [client.trains_json, client.trains_geojson]
+        return write
+
+    variants = {
+        'before': before,
+        'pretty': after('pretty', OutputFormat()),
+        'compact': after('compact', OutputFormat(pretty=False)),
+        'compact, gzip': after('gzip', OutputFormat(pretty=False, gzip=True)),
+    }
+    if COMPRESSORS['.br'] is not None:
+        variants['compact, gzip, brotli'] = after('brotli', OutputFormat(pretty=False, gzip=True, brotli=True))
+
+    print(f'{len(client.trains["trains"])} trains, {"orjson" if orjson is not None else "json"}')
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in ('before', 'pretty', 'compact', 'gzip', 'brotli'):
+            os.makedirs(os.path.join(tmp, name))
+        for name, write in variants.items():
+            (ms, sizes) = measure(tmp, write, args.repeat)
+            print(f'{name:21s} {ms:6.2f} ms  ' + '  '.join(f'{f} {size / 1000:.1f} kB' for f, size in sizes.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+Compare the JSON position messages of the trackers with the binary payload carrying several fixes per message: bytes
+on the wire per fix, including the MQTT PUBLISH header and topic, and the time to decode them, including getting the
+time of each fix, in seconds since the epoch and as written to trains.json.
+
+    poetry run python benchmarks/payload.py --fixes 10000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from c3toctrack.payload import encode
+from c3toctrack.processor import decode_batch, orjson, position_times
+from c3toctrack.utils import format_timestamp
+
+
+def publish_size(topic: str, payload: bytes) -> int:
+    """
+    Return the size of an MQTT PUBLISH packet with QoS 0: fixed header, topic, and payload.
+    """
+    remaining = 2 + len(topic.encode('utf-8')) + len(payload)
+    length = 1
+    while remaining >= 128 ** length:
+        length += 1
+    return 1 + length + remaining
+
+
+def fixes(count: int) -> list:
+    return [(1692000000 + 2 * i, 53.03 + i * 1e-6, 13.30 + i * 1e-6, 9, 10.8) for i in range(0, count)]
+
+
+def json_message(fix: tuple) -> bytes:
+    # as the tracker formats it
+    (t, lat, lon, sat, speed) = fix
+    return (f'{{"lat":{lat:.5f},"lon":{lon:.5f},"sat":{sat},"speed":{speed:.1f},"Vbat":4.12,"Vbus":5.03,'
+            f'"ts":"{format_timestamp(t)}","rssi":-67,"bssid":"A4:2B:B0:01:02:FF"}}').encode('utf-8')
+
+
+def measure(messages: list, topic: str, count: int, repeat: int) -> tuple:
+    """
+    :return: bytes on the wire per fix, and microseconds to decode a fix
+    """
+    size = sum(publish_size(topic, payload) for payload in messages)
+    t0 = time.perf_counter()
+    for i in range(0, repeat):
+        for payload in messages:
+            position_times(decode_batch(topic, payload)[1])
+    t1 = time.perf_counter()
+    return size / count, (t1 - t0) / repeat / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare JSON and binary position messages.')
+    parser.add_argument('--fixes', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    sample = fixes(args.fixes)
+    variants = {'json': ('c3toc/train/demo/pos', [json_message(fix) for fix in sample])}
+    for batch in (1, 5, 10, 30):
+        messages = [encode(sample[i:i + batch], 4.12, 5.03, -67, 'A4:2B:B0:01:02:FF')
+                    for i in range(0, len(sample), batch)]
+        variants[f'binary, {batch} per message'] = ('c3toc/train/demo/fixes', messages)
+
+    print(f'{args.fixes} fixes, JSON decoded with {"orjson" if orjson is not None else "json"}')
+    for name, (topic, messages) in variants.items():
+        (size, us) = measure(messages, topic, args.fixes, args.repeat)
+        print(f'{name:24s} {len(messages):6d} messages  {size:6.1f} bytes per fix  {us:6.2f} µs per fix')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+"""
+Replay recorded or synthetic positions through MqttTrainReporterClient, and report throughput, latency, and the time
+spent per stage. With --broker, the messages are published through a local MQTT broker instead of being passed to the
+client directly.
+
+    poetry run python benchmarks/replay.py --trains 50 --duration 300
+    poetry run python benchmarks/replay.py --history history
+    poetry run python benchmarks/replay.py --mosquitto messages.log
+    poetry run python benchmarks/replay.py --broker --processes 4 --trains 200
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from c3toctrack import MqttTrainReporterClient, TracksModel
+from c3toctrack.broker import LocalBroker
+from c3toctrack.replay import BrokerReplay, Replay, history_stream, mosquitto_stream, synthetic_stream
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay positions through the gateway and measure it.')
+    parser.add_argument('--gpx', default='data/trainlines.gpx')
+    parser.add_argument('--trains', type=int, default=20, help='number of synthetic trains')
+    parser.add_argument('--duration', type=float, default=300, help='simulated seconds of synthetic positions')
+    parser.add_argument('--history', metavar='DIRECTORY', help='replay a recorded position history instead')
+    parser.add_argument('--mosquitto', metavar='FILE', help='replay the output of mosquitto_sub -v instead')
+    parser.add_argument('--speedup', type=float, help='replay this many times faster than real time; default: as '
+                                                      'fast as possible')
+    parser.add_argument('--workers', type=int, default=0)
+    parser.add_argument('--processes', type=int, default=0, help='process the messages in this many processes')
+    parser.add_argument('--broker', action='store_true', help='publish the messages through a local MQTT broker')
+    parser.add_argument('--max-flush-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    tracksmodel = TracksModel(args.gpx, {})
+    if args.history is not None:
+        messages = history_stream(args.history)
+    elif args.mosquitto is not None:
+        messages = mosquitto_stream(args.mosquitto)
+    else:
+        messages = synthetic_stream(tracksmodel, args.trains, args.duration)
+
+    broker = None
+    if args.broker:
+        broker = LocalBroker()
+        broker.start_thread()
+    with tempfile.TemporaryDirectory() as tmp:
+        client = MqttTrainReporterClient(None if broker is None else broker.host, None, None, 'c3toc/train/#',
+                                         tracksmodel, os.path.join(tmp, 'trains.json'),
+                                         os.path.join(tmp, 'trains.geojson'), max_flush_rate=args.max_flush_rate,
+                                         ingest_workers=args.workers, processes=args.processes,
+                                         port=1883 if broker is None else broker.port)
+        if broker is None:
+            report = Replay(client).run(messages, args.speedup)
+        else:
+            client.start()
+            while broker.subscribers('c3toc/train/x/pos') == 0:
+                time.sleep(0.01)
+            report = BrokerReplay(client, broker.host, broker.port).run(messages, args.speedup)
+            client.connection.stop()
+            broker.stop_thread()
+
+    print(f'{report["messages"]} messages in {report["seconds"]:.2f} s: {report["rate"]:.0f} messages/s')
+    latency = report['latency']
+    print(f'latency p50 {latency["p50"]:.3f} ms, p99 {latency["p99"]:.3f} ms, max {latency["max"]:.3f} ms')
+    for stage, timing in report['stages'].items():
+        per_call = timing['seconds'] / timing['calls'] * 1e6 if timing['calls'] > 0 else 0
+        print(f'{stage:10s} {timing["calls"]:8d} calls {timing["seconds"]:8.3f} s {per_call:9.1f} µs/call')
+    for part, stats in report['client'].items():
+        print(f'{part:10s} {stats}')
+
+
+if __name__ == '__main__':
+    main()
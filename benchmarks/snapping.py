@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+"""
+Compare snapping positions to tracks using the segment index, one at a time and in batches, against the brute-force
+loop that MqttTrainReporterClient.on_message used before. "tracking" snaps the positions of moving trains, starting
+from the previous position of each train.
+
+    poetry run python benchmarks/snapping.py
+"""
+import os
+import json
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from c3toctrack import Point, TracksModel
+from c3toctrack.replay import synthetic_stream
+from synthetic import positions, write_gpx
+
+
+def brute_force(tracks: list, lat: float, lon: float) -> float:
+    """
+    The snapping loop as previously found in on_message.
+    :param tracks: the points of each track, as lists of Points like Track used to keep them
+    """
+    point = Point(lat, lon)
+    distance = 1e36
+    closest = None
+    second = None
+    for points in tracks:
+        for i in range(0, len(points)):
+            d = Point.distance(point, points[i])
+            if d < distance:
+                distance = d
+                closest = points[i]
+                dp = 1e36
+                dn = 1e36
+                if i > 0:
+                    dp = Point.distance(point, points[i - 1])
+                if i < len(points) - 1:
+                    dn = Point.distance(point, points[i + 1])
+                if dp < dn:
+                    second = points[i - 1]
+                else:
+                    second = points[i + 1]
+    if second is None:
+        return closest.trackmarker
+    ab = Point.distance(closest, second)
+    bc = Point.distance(second, point)
+    ca = Point.distance(point, closest)
+    if bc == 0:
+        return second.trackmarker
+    if ca == 0:
+        return closest.trackmarker
+    d = Point.nearest_distance(ab, bc, ca)
+    if second.trackmarker > closest.trackmarker:
+        return closest.trackmarker + d
+    return closest.trackmarker - d
+
+
+def measure(label: str, tracksmodel: TracksModel, count: int):
+    tracks = [list(track.points) for track in tracksmodel.tracks.values()]
+    npoints = sum(len(points) for points in tracks)
+    fixes = positions(tracksmodel, count)
+    t0 = time.perf_counter()
+    for lat, lon in fixes:
+        brute_force(tracks, lat, lon)
+    t1 = time.perf_counter()
+    for lat, lon in fixes:
+        tracksmodel.snap(lat, lon)
+    t2 = time.perf_counter()
+    lats = np.array([lat for lat, lon in fixes] * 50)
+    lons = np.array([lon for lat, lon in fixes] * 50)
+    tracksmodel.snap_many(lats, lons)
+    t3 = time.perf_counter()
+    trains = [(topic.split('/')[2], json.loads(payload)) for t, topic, payload in
+              synthetic_stream(tracksmodel, trains=20, duration=count / 20)]
+    previous = {}
+    t4 = time.perf_counter()
+    for name, pos in trains:
+        previous[name] = tracksmodel.snap(pos['lat'], pos['lon'], previous.get(name))
+    t5 = time.perf_counter()
+    loop = (t1 - t0) / count * 1e6
+    index = (t2 - t1) / count * 1e6
+    batch = (t3 - t2) / len(lats) * 1e6
+    tracking = (t5 - t4) / len(trains) * 1e6
+    print(f'{label:24s} {npoints:7d} points   loop {loop:9.1f} µs/fix   index {index:7.1f} µs/fix   '
+          f'snap_many {batch:5.2f} µs/fix   tracking {tracking:5.1f} µs/fix')
+
+
+def main():
+    measure('camp layout', TracksModel('data/trainlines.gpx', {}), 2000)
+    with tempfile.TemporaryDirectory() as tmp:
+        for tracks, points in ((10, 200), (40, 500), (100, 1000)):
+            filename = os.path.join(tmp, f'synthetic-{tracks}x{points}.gpx')
+            write_gpx(filename, tracks, points)
+            measure(f'synthetic {tracks}x{points}', TracksModel(filename, {}), 200)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Helpers to generate synthetic track networks for the benchmarks.
+"""
+import random
+from math import cos, sin, pi
+
+from c3toctrack import Point
+
+
+def _meander(rnd: random.Random, points: int, spacing: float):
+    """
+    Generate the coordinates of a random, meandering track around the camp site.
+    """
+    lat = 53.03 + rnd.uniform(-0.05, 0.05)
+    lon = 13.30 + rnd.uniform(-0.08, 0.08)
+    heading = rnd.uniform(0, 2 * pi)
+    for p in range(0, points):
+        yield lat, lon
+        heading += rnd.uniform(-0.3, 0.3)
+        lat += cos(heading) * spacing * Point.degree_per_meter_lat
+        lon += sin(heading) * spacing * Point.degree_per_meter_lon
+
+
+def write_gpx(filename: str, tracks: int, points: int, spacing: float = 10.0, seed: int = 23):
+    """
+    Write a GPX file with a number of random, meandering tracks around the camp site.
+    :param filename: the file to write
+    :param tracks: number of tracks
+    :param points: number of points per track
+    :param spacing: distance between consecutive points, in meters
+    :param seed: seed for the random number generator, so runs are repeatable
+    """
+    rnd = random.Random(seed)
+    with open(filename, 'w', encoding='utf8') as f:
+        print('<?xml version="1.0" encoding="UTF-8"?>', file=f)
+        print('<gpx version="1.1" creator="c3toctrack benchmark" xmlns="http://www.topografix.com/GPX/1/1">', file=f)
+        for t in range(0, tracks):
+            print(f'  <trk><name>Track {t}</name><trkseg>', file=f)
+            for p, (lat, lon) in enumerate(_meander(rnd, points, spacing)):
+                name = ''
+                if p % 50 == 25:
+                    name = f'<name>Hp S{t}x{p} Stop {t}/{p}</name>'
+                print(f'    <trkpt lat="{lat:.7f}" lon="{lon:.7f}">{name}</trkpt>', file=f)
+            print('  </trkseg></trk>', file=f)
+        print('</gpx>', file=f)
+
+
+def write_osm(filename: str, tracks: int, points: int, spacing: float = 10.0, other: int = 1, seed: int = 23):
+    """
+    Write the same network as write_gpx as OSM XML, with the stops tagged like in OpenStreetMap, and nodes and ways
+    that are not tracks, like a regional extract would have.
+    :param other: number of nodes that are not part of a track, per node of a track
+    """
+    rnd = random.Random(seed)
+    with open(filename, 'w', encoding='utf8') as f:
+        print('<?xml version="1.0" encoding="UTF-8"?>', file=f)
+        print('<osm version="0.6" generator="c3toctrack benchmark">', file=f)
+        ways = []
+        id = 1
+        for t in range(0, tracks):
+            refs = []
+            for p, (lat, lon) in enumerate(_meander(rnd, points, spacing)):
+                tags = ''
+                if p % 50 == 25:
+                    tags = (f'<tag k="name" v="Stop {t}/{p}"/><tag k="railway" v="halt"/>'
+                            f'<tag k="railway:ref" v="S{t}x{p}"/>')
+                print(f'  <node id="{id}" lat="{lat:.7f}" lon="{lon:.7f}">{tags}</node>', file=f)
+                refs.append(id)
+                id += 1
+                for o in range(0, other):
+                    print(f'  <node id="{id}" lat="{lat + 0.001:.7f}" lon="{lon:.7f}"/>', file=f)
+                    id += 1
+            ways.append((f'Track {t}', 'narrow_gauge', refs))
+            ways.append((f'Road {t}', None, list(range(refs[0] + 1, id, other + 1)) if other > 0 else []))
+        for w, (name, railway, refs) in enumerate(ways):
+            print(f'  <way id="{w + 1}">', file=f)
+            for ref in refs:
+                print(f'    <nd ref="{ref}"/>', file=f)
+            print(f'    <tag k="name" v="{name}"/>', file=f)
+            if railway is not None:
+                print(f'    <tag k="railway" v="{railway}"/>', file=f)
+            else:
+                print('    <tag k="highway" v="residential"/>', file=f)
+            print('  </way>', file=f)
+        print('</osm>', file=f)
+
+
+def positions(tracksmodel, count: int, noise: float = 5.0, seed: int = 42) -> list:
+    """
+    Return a list of (lat, lon) positions close to random points of the tracks.
+    :param noise: maximum offset from the track, in meters
+    """
+    rnd = random.Random(seed)
+    points = [point for track in tracksmodel.tracks.values() for point in track.points]
+    result = []
+    for i in range(0, count):
+        point = rnd.choice(points)
+        result.append((point.lat + rnd.uniform(-noise, noise) * Point.degree_per_meter_lat,
+                       point.lon + rnd.uniform(-noise, noise) * Point.degree_per_meter_lon))
+    return result
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+Measure how long it takes to build the travel time statistics from days of recorded positions, and to learn from a
+single position as it is processed.
+
+    poetry run python benchmarks/traveltimes.py --trains 50 --days 3
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from c3toctrack import TracksModel
+from c3toctrack.history import RECORD
+from c3toctrack.traveltimes import SegmentStatistics
+
+
+def history(tracksmodel: TracksModel, trains: int, seconds: int, seed: int = 23) -> np.ndarray:
+    """
+    Generate positions, one per train and second, of trains going from stop to stop in a straight line at 3 m/s and
+    staying at every stop for 20 to 60 seconds, in random order, as read from the history.
+    """
+    rng = np.random.default_rng(seed)
+    stops = tracksmodel.stops.stops
+    parts = []
+    for train in range(0, trains):
+        lats = []
+        lons = []
+        length = 0
+        stop = stops[rng.integers(len(stops))]
+        while length < seconds:
+            dwell = int(rng.integers(20, 61))
+            lats.append(np.full(dwell, stop.lat))
+            lons.append(np.full(dwell, stop.lon))
+            following = stops[rng.integers(len(stops))]
+            dy = (following.lat - stop.lat) / 8.99e-6
+            dx = (following.lon - stop.lon) / 1.49e-5
+            steps = max(int(np.hypot(dx, dy) / 3.0), 1)
+            lats.append(np.linspace(stop.lat, following.lat, steps, endpoint=False))
+            lons.append(np.linspace(stop.lon, following.lon, steps, endpoint=False))
+            length += dwell + steps
+            stop = following
+        records = np.zeros(seconds, dtype=RECORD)
+        records['timestamp'] = 1692000000.0 + np.arange(0, seconds) + train / trains
+        records['lat'] = np.concatenate(lats)[:seconds] + rng.normal(0, 3e-5, seconds)
+        records['lon'] = np.concatenate(lons)[:seconds] + rng.normal(0, 4e-5, seconds)
+        records['speed'] = 10.8
+        records['train'] = f'train{train}'.encode('utf-8')
+        parts.append(records)
+    records = np.concatenate(parts)
+    # in the order they were written
+    return records[np.argsort(records['timestamp'], kind='stable')]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure building travel time statistics.')
+    parser.add_argument('--trains', type=int, default=50)
+    parser.add_argument('--days', type=float, default=1)
+    args = parser.parse_args()
+
+    tracksmodel = TracksModel('data/trainlines.gpx', {})
+    records = history(tracksmodel, args.trains, int(args.days * 86400))
+
+    t0 = time.perf_counter()
+    batch = SegmentStatistics(tracksmodel)
+    batch.add_history(records)
+    t1 = time.perf_counter()
+
+    live = SegmentStatistics(tracksmodel)
+    count = min(len(records), 200000)
+    sample = [(train.decode('utf-8'), float(t), float(lat), float(lon), 3.0)
+              for train, t, lat, lon in zip(records['train'][:count], records['timestamp'][:count],
+                                            records['lat'][:count], records['lon'][:count])]
+    t2 = time.perf_counter()
+    for position in sample:
+        live.record(*position)
+    t3 = time.perf_counter()
+
+    print(f'{len(records)} positions of {args.trains} trains over {args.days} days')
+    print(f'batch  {t1 - t0:8.2f} s ({len(batch.legs)} legs, {len(batch.dwells)} stops)')
+    print(f'live   {(t3 - t2) / count * 1e6:8.2f} µs per position')
+    for row in batch.summary()[:5]:
+        quantiles = '  '.join(f'p{int(q * 100)} {value:5.0f} s' for q, value in row['quantiles'].items())
+        print(f'{row["kind"]:5s} {row["origin"]:>16s} -> {row["destination"]:16s} {row["count"]:5d}  {quantiles}')
+
+
+if __name__ == '__main__':
+    main()
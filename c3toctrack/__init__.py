@@ -1,3 +1,4 @@
+from .history import HistoryReader, HistoryWriter
 from .mqttclient import MqttTrainReporterClient
 from .point import Point
 from .track import Track
@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import struct
+import threading
+
+CONNECT = 1
+PUBLISH = 3
+PUBREL = 6
+SUBSCRIBE = 8
+UNSUBSCRIBE = 10
+PINGREQ = 12
+DISCONNECT = 14
+
+
+def topic_matches(pattern: str, topic: str) -> bool:
+    """
+    Return True if topic matches the subscription pattern, which may contain the wildcards + and #.
+    """
+    patterns = pattern.split('/')
+    levels = topic.split('/')
+    for i, p in enumerate(patterns):
+        if p == '#':
+            return True
+        if i >= len(levels) or (p != '+' and p != levels[i]):
+            return False
+    return len(patterns) == len(levels)
+
+
+def _packet(kind: int, flags: int, body: bytes) -> bytes:
+    length = len(body)
+    header = bytearray([kind << 4 | flags])
+    while True:
+        byte = length % 128
+        length //= 128
+        header.append(byte | 0x80 if length > 0 else byte)
+        if length == 0:
+            break
+    return bytes(header) + body
+
+
+def _string(data: bytes, offset: int) -> tuple:
+    (length,) = struct.unpack_from('!H', data, offset)
+    return data[offset + 2:offset + 2 + length], offset + 2 + length
+
+
+class _Connection:
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        # subscribed topic patterns
+        self.patterns = set()
+
+
+class LocalBroker:
+    """
+    A minimal MQTT 3.1.1 broker, to test and benchmark the gateway without a real broker. It accepts any client and
+    any credentials, and delivers every message published to all clients with a matching subscription, at QoS 0.
+    Retained messages, wills and persistent sessions are not supported.
+
+    drop_connections() closes all client connections at once, like a broker restart or a network outage would.
+    """
+
+    def __init__(self, host: str = 'localhost', port: int = 0):
+        """
+        :param port: port to listen on; 0 picks a free port, see self.port once started
+        """
+        self.host = host
+        self.port = port
+        self.connections = 0
+        self.published = 0
+        self.delivered = 0
+        self._clients = set()
+        self._server = None
+        self._loop = None
+        self._thread = None
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        self._drop()
+        await self._server.wait_closed()
+
+    def start_thread(self):
+        """
+        Run the broker in a new thread with its own event loop, and return once it accepts connections.
+        """
+        started = threading.Event()
+
+        async def serve():
+            await self.start()
+            started.set()
+            try:
+                await self._server.serve_forever()
+            except asyncio.CancelledError:
+                pass
+
+        self._thread = threading.Thread(target=lambda: asyncio.run(serve()), name='broker', daemon=True)
+        self._thread.start()
+        started.wait()
+
+    def stop_thread(self):
+        asyncio.run_coroutine_threadsafe(self.stop(), self._loop).result()
+        self._thread.join()
+
+    def drop_connections(self):
+        """
+        Close the connections of all clients, without a DISCONNECT. The broker keeps accepting new connections.
+        """
+        self._loop.call_soon_threadsafe(self._drop)
+
+    def subscribers(self, topic: str) -> int:
+        """
+        Return the number of clients subscribed to the topic.
+        """
+        return sum(1 for client in list(self._clients)
+                   if any(topic_matches(pattern, topic) for pattern in list(client.patterns)))
+
+    def _drop(self):
+        for client in list(self._clients):
+            client.writer.transport.abort()
+        self._clients.clear()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        client = _Connection(writer)
+        try:
+            while True:
+                first = await reader.readexactly(1)
+                length = 0
+                for shift in range(0, 28, 7):
+                    byte = (await reader.readexactly(1))[0]
+                    length += (byte & 0x7f) << shift
+                    if byte & 0x80 == 0:
+                        break
+                body = await reader.readexactly(length)
+                kind = first[0] >> 4
+                flags = first[0] & 0x0f
+                if kind == CONNECT:
+                    self.connections += 1
+                    self._clients.add(client)
+                    writer.write(_packet(2, 0, b'\x00\x00'))
+                elif client not in self._clients:
+                    # anything before CONNECT, or after the connection has been dropped
+                    break
+                elif kind == PUBLISH:
+                    self._publish(client, flags, body)
+                elif kind == PUBREL:
+                    writer.write(_packet(7, 0, body[:2]))
+                elif kind == SUBSCRIBE:
+                    offset = 2
+                    granted = bytearray()
+                    while offset < len(body):
+                        (pattern, offset) = _string(body, offset)
+                        client.patterns.add(pattern.decode('utf-8'))
+                        offset += 1
+                        granted.append(0)
+                    writer.write(_packet(9, 0, body[:2] + bytes(granted)))
+                elif kind == UNSUBSCRIBE:
+                    offset = 2
+                    while offset < len(body):
+                        (pattern, offset) = _string(body, offset)
+                        client.patterns.discard(pattern.decode('utf-8'))
+                    writer.write(_packet(11, 0, body[:2]))
+                elif kind == PINGREQ:
+                    writer.write(_packet(13, 0, b''))
+                elif kind == DISCONNECT:
+                    break
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        except Exception as e:
+            logging.error('Broker: unable to handle client: %s', e)
+        finally:
+            self._clients.discard(client)
+            writer.close()
+
+    def _publish(self, client: _Connection, flags: int, body: bytes):
+        (topic, offset) = _string(body, 0)
+        qos = (flags >> 1) & 0x03
+        if qos > 0:
+            packet_id = body[offset:offset + 2]
+            offset += 2
+            # PUBACK for QoS 1, PUBREC for QoS 2
+            client.writer.write(_packet(4 if qos == 1 else 5, 0, packet_id))
+        self.published += 1
+        name = topic.decode('utf-8')
+        packet = _packet(PUBLISH, 0, body[:2 + len(topic)] + body[offset:])
+        for other in self._clients:
+            if any(topic_matches(pattern, name) for pattern in other.patterns):
+                other.writer.write(packet)
+                self.delivered += 1
@@ -0,0 +1,95 @@
+import logging
+import random
+import threading
+
+import paho.mqtt.client as mqtt
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionSupervisor:
+    """
+    Keeps a paho MQTT client connected to its broker, running the network loop of the client in a thread of its own.
+
+    When the connection cannot be established or is lost, the supervisor waits and tries again, forever. The wait
+    doubles with every failed attempt, up to max_delay, and is randomized to between half and all of that, so clients
+    that lost their connection at the same time do not all come back at the same moment. The wait starts over once
+    the broker has accepted the connection.
+
+    Subscriptions are not restored by the supervisor: the client should subscribe in its on_connect callback, which
+    is called after every successful connection.
+    """
+
+    FIRST_RECONNECT_DELAY = 1.0
+    RECONNECT_RATE = 2
+    MAX_RECONNECT_DELAY = 60.0
+
+    def __init__(self, client: mqtt.Client, hostname: str, port: int = 1883, keepalive: int = 60,
+                 name: str = 'mqtt'):
+        """
+        :param keepalive: seconds between pings to the broker when there are no other messages
+        :param name: name of the thread
+        """
+        self.client = client
+        self.client.connect_async(hostname, port, keepalive)
+        self.hostname = hostname
+        self.name = name
+        self.first_delay = self.FIRST_RECONNECT_DELAY
+        self.max_delay = self.MAX_RECONNECT_DELAY
+        # attempts to connect since the last successful connection
+        self.attempts = 0
+        self._delay = self.first_delay
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._delay = self.first_delay
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Disconnect from the broker and stop the thread.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.client.disconnect()
+
+    def connected(self):
+        """
+        Record that the broker has accepted the connection; call this from on_connect.
+        """
+        self.attempts = 0
+        self._delay = self.first_delay
+
+    def _wait(self):
+        """
+        Wait before the next attempt to connect, and increase the wait for the attempt after that.
+        """
+        delay = random.uniform(self._delay / 2, self._delay)
+        self._delay = min(self._delay * self.RECONNECT_RATE, self.max_delay)
+        logger.info('Reconnecting to %s in %.1f seconds', self.hostname, delay)
+        self._stop.wait(delay)
+
+    def _run(self):
+        connecting = True
+        while not self._stop.is_set():
+            if connecting:
+                self.attempts += 1
+                try:
+                    self.client.reconnect()
+                    connecting = False
+                except (OSError, ValueError) as e:
+                    logger.error('Unable to connect to %s: %s', self.hostname, e)
+                    self._wait()
+                    continue
+            rc = self.client.loop(timeout=1.0)
+            if rc != mqtt.MQTT_ERR_SUCCESS and not self._stop.is_set():
+                logger.warning('Connection to %s lost: %s', self.hostname, mqtt.error_string(rc))
+                connecting = True
+                self._wait()
@@ -0,0 +1,207 @@
+"""
+Events for the staff at level crossings ("Bü"): when a train approaches a crossing, when it is on it, and when it has
+cleared it, worked out from the trackmarker the positions of the train are snapped to.
+
+Around every crossing, there is a protection zone of `approach` meters either way along its track. A train entering
+the zone is approaching the crossing, within `occupied` meters of it, it is occupying the crossing, and once it is
+more than `occupied` + `hysteresis` meters past it, or has left the zone, the crossing is cleared. The hysteresis keeps
+the GPS error of a train standing at the edge of the crossing from flipping it between occupied and cleared.
+"""
+import threading
+from bisect import bisect_left, bisect_right
+from collections import deque
+
+from .tracksmodel import TracksModel
+
+APPROACHING = 'approaching'
+OCCUPYING = 'occupying'
+CLEARED = 'cleared'
+
+
+class IntervalIndex:
+    """
+    Intervals on a line, to find those containing a point with a bisect: the intervals are sorted by their start, and
+    an interval containing x must start between x minus the length of the longest interval and x.
+    """
+
+    def __init__(self, intervals):
+        """
+        :param intervals: tuples of start, end and a value for each interval
+        """
+        intervals = sorted(intervals, key=lambda interval: interval[0])
+        self.starts = [start for start, end, value in intervals]
+        self.ends = [end for start, end, value in intervals]
+        self.values = [value for start, end, value in intervals]
+        self.longest = max((end - start for start, end, value in intervals), default=0)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def at(self, x: float) -> list:
+        """
+        Return the values of all intervals containing x, ends included.
+        """
+        first = bisect_left(self.starts, x - self.longest)
+        last = bisect_right(self.starts, x)
+        return [self.values[i] for i in range(first, last) if self.ends[i] >= x]
+
+
+class CrossingMonitor:
+    """
+    Tracks which trains are near which level crossings, and turns their positions into events.
+
+    Pass every snapped position to update(), or register on_position() as a listener of MqttTrainReporterClient. The
+    zones of the crossings are kept in one IntervalIndex per track, so a position is looked up with a bisect, however
+    many crossings there are; only the few crossings a train is near are kept per train.
+    """
+
+    def __init__(self, tracksmodel: TracksModel, approach: float = 200.0, occupied: float = 15.0,
+                 hysteresis: float = 5.0, keep: int = 100):
+        """
+        :param approach: how far before and after a crossing, in meters along the track, its protection zone reaches
+        :param occupied: how close to the crossing, in meters, a train is occupying it
+        :param hysteresis: how much further a train has to be from the crossing, in meters, to have cleared it
+        :param keep: how many of the latest events are kept for the feed
+        """
+        self.approach = approach
+        self.occupied = occupied
+        self.hysteresis = hysteresis
+        # crossing name -> position, and trackmarker on each track it is on
+        self.crossings = {}
+        # track name -> IntervalIndex of the zones, with (crossing name, trackmarker) as value
+        self.zones = {}
+        for trackname, track in tracksmodel.tracks.items():
+            zones = []
+            for waypoint in track.waypoints.values():
+                if waypoint.type == 'Bü':
+                    crossing = self.crossings.setdefault(waypoint.name, {'lat': waypoint.lat, 'lon': waypoint.lon,
+                                                                         'tracks': {}})
+                    crossing['tracks'][trackname] = waypoint.trackmarker
+                    zones.append((waypoint.trackmarker - approach, waypoint.trackmarker + approach,
+                                  (waypoint.name, waypoint.trackmarker)))
+            if len(zones) > 0:
+                self.zones[trackname] = IntervalIndex(zones)
+        # train name -> crossing name -> (state, distance, timestamp)
+        self.states = {}
+        self.seq = 0
+        self.events = deque(maxlen=keep)
+        self.lock = threading.Lock()
+
+    def update(self, train: str, trackname: str, trackmarker: float, timestamp: str | None = None) -> list:
+        """
+        Work out the state of the crossings near a train from a new position.
+        :param trackname: the track the position was snapped to
+        :param trackmarker: the trackmarker the position was snapped to
+        :param timestamp: the time of the position, as in trains.json
+        :return: the events for the crossings whose state changed, as dicts with the sequence number of the event
+                 'seq', the 'crossing', the 'train', its new 'state', its 'distance' from the crossing in meters along
+                 the track, negative before its trackmarker, and the 'timestamp' of the position
+        """
+        index = self.zones.get(trackname)
+        near = {} if index is None else {name: trackmarker - marker for name, marker in index.at(trackmarker)}
+        with self.lock:
+            current = self.states.get(train)
+            if current is None:
+                if len(near) == 0:
+                    return []
+                current = self.states[train] = {}
+            events = []
+            for name in [name for name in current if name not in near]:
+                (state, distance, since) = current.pop(name)
+                if state != CLEARED:
+                    events.append(self._event(train, name, CLEARED, distance, timestamp))
+            for name, distance in near.items():
+                previous = current.get(name, (None,))[0]
+                state = self._state(previous, abs(distance))
+                current[name] = (state, distance, timestamp if state != previous else current[name][2])
+                if state != previous:
+                    events.append(self._event(train, name, state, distance, timestamp))
+            if len(current) == 0:
+                del self.states[train]
+            return events
+
+    def _state(self, previous: str | None, distance: float) -> str:
+        """
+        Return the state of a crossing for a train in its zone.
+        :param previous: the state before, or None if the train has just entered the zone
+        :param distance: how far the train is from the crossing, in meters
+        """
+        if distance <= self.occupied:
+            return OCCUPYING
+        if previous == OCCUPYING:
+            return OCCUPYING if distance <= self.occupied + self.hysteresis else CLEARED
+        if previous is None:
+            return APPROACHING
+        return previous
+
+    def _event(self, train: str, crossing: str, state: str, distance: float, timestamp: str | None) -> dict:
+        """
+        Record an event. Must be called with the lock held.
+        """
+        self.seq += 1
+        event = {
+            'seq': self.seq,
+            'crossing': crossing,
+            'train': train,
+            'state': state,
+            'distance': round(distance),
+            'timestamp': timestamp,
+        }
+        self.events.append(event)
+        return event
+
+    def forget(self, train: str, timestamp: str | None = None) -> list:
+        """
+        Drop a train that is no longer reporting, clearing the crossings it was near.
+        :return: the events for the crossings it was approaching or occupying
+        """
+        with self.lock:
+            current = self.states.pop(train, {})
+            return [self._event(train, name, CLEARED, distance, timestamp)
+                    for name, (state, distance, since) in current.items() if state != CLEARED]
+
+    def snapshot(self) -> dict:
+        """
+        Return the state of the trains near the crossings and the latest events, to restore() them after a restart.
+        """
+        with self.lock:
+            return {
+                'states': {train: dict(current) for train, current in self.states.items()},
+                'seq': self.seq,
+                'events': list(self.events),
+            }
+
+    def restore(self, snapshot: dict):
+        """
+        Restore the state from snapshot(), for the crossings that still exist.
+        """
+        with self.lock:
+            for train, current in snapshot['states'].items():
+                current = {name: value for name, value in current.items() if name in self.crossings}
+                if len(current) > 0:
+                    self.states[train] = current
+            self.seq = max(self.seq, snapshot['seq'])
+            self.events.extend(snapshot['events'])
+
+    def on_position(self, name: str, pos: dict) -> list:
+        """
+        Update the crossings from a position as processed by PositionProcessor.
+        """
+        return self.update(name, pos['trackname'], pos['trackmarker'], pos.get('timestamp'))
+
+    def feed(self, since: int | None = None) -> dict:
+        """
+        Return the state of all crossings and the latest events.
+        :param since: if set, only the events after this sequence number
+        :return: a dict with the sequence number of the latest event 'seq', 'crossings' with the position of each
+                 crossing, its trackmarker on each track, and the state of the trains near it since when, and
+                 'events'
+        """
+        with self.lock:
+            crossings = {name: dict(crossing, trains={}) for name, crossing in self.crossings.items()}
+            for train, current in self.states.items():
+                for name, (state, distance, changed) in current.items():
+                    crossings[name]['trains'][train] = {'state': state, 'distance': round(distance),
+                                                        'since': changed}
+            events = [event for event in self.events if since is None or event['seq'] > since]
+            return {'seq': self.seq, 'crossings': crossings, 'events': events}
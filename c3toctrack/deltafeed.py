@@ -0,0 +1,100 @@
+import time
+from collections import OrderedDict, deque
+
+
+class DeltaFeed:
+    """
+    Keeps track of which trains changed, so clients can fetch only those instead of the state of all trains.
+
+    Changes are collected with changed() and removed(), and commit() turns them into a new version with the next
+    sequence number. For every train that changed within the last `window` seconds, the feed keeps its latest state
+    (or that it has been removed) and the sequence number of that change. A client that has seen version n asks for
+    since(n) and gets the trains that changed after that; if n is too old for the window, it has to fetch the full
+    state again, which carries the sequence number it corresponds to.
+    """
+
+    def __init__(self, window: float = 30.0):
+        """
+        :param window: seconds for which changes are kept
+        """
+        self.window = window
+        self.seq = 0
+        self._changed = set()
+        self._removed = set()
+        # train name -> (seq, state or None if removed), oldest change first
+        self._latest = OrderedDict()
+        # (seq, time) of each commit in the window
+        self._commits = deque()
+
+    def changed(self, name: str):
+        self._removed.discard(name)
+        self._changed.add(name)
+
+    def removed(self, name: str):
+        self._changed.discard(name)
+        self._removed.add(name)
+
+    def commit(self, trains: dict, now: float | None = None) -> bool:
+        """
+        Record the current state of all trains that changed since the last commit as a new version.
+        :param trains: the current state of all trains, by name
+        :return: False if nothing had changed, and no new version was created
+        """
+        if now is None:
+            now = time.monotonic()
+        while len(self._commits) > 1 and self._commits[0][1] < now - self.window:
+            self._commits.popleft()
+        if len(self._changed) == 0 and len(self._removed) == 0:
+            return False
+        self.seq += 1
+        self._commits.append((self.seq, now))
+        for name in self._changed:
+            self._latest[name] = (self.seq, dict(trains[name]))
+            self._latest.move_to_end(name)
+        for name in self._removed:
+            self._latest[name] = (self.seq, None)
+            self._latest.move_to_end(name)
+        self._changed.clear()
+        self._removed.clear()
+        while len(self._latest) > 0 and next(iter(self._latest.values()))[0] < self.first:
+            self._latest.popitem(last=False)
+        return True
+
+    @property
+    def first(self) -> int:
+        """
+        The oldest version in the window. Clients that have seen the version before it, or a later one, can catch up
+        from the feed.
+        """
+        if len(self._commits) == 0:
+            return self.seq + 1
+        return self._commits[0][0]
+
+    def since(self, seq: int | None = None) -> dict:
+        """
+        Return the changes after version seq.
+        :param seq: the last version the client has seen; if None, all changes in the window
+        :return: a dict with the current version 'seq', the oldest version in the window 'first', and 'trains' and
+                 'removed' with the changes. If 'reset' is true, the client is too far behind and has to fetch the full
+                 state instead.
+        """
+        if seq is None:
+            seq = self.first - 1
+        trains = {}
+        removed = []
+        reset = seq < self.first - 1 or seq > self.seq
+        if not reset:
+            for name, (changed, state) in reversed(self._latest.items()):
+                if changed <= seq:
+                    break
+                if state is None:
+                    removed.append(name)
+                else:
+                    trains[name] = state
+        return {
+            'seq': self.seq,
+            'first': self.first,
+            'reset': reset,
+            'trains': trains,
+            'removed': sorted(removed),
+        }
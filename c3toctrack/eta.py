@@ -0,0 +1,107 @@
+from .motion import TrainState
+from .tracksmodel import TracksModel
+from .utils import format_timestamp
+from .waypoint import Waypoint
+
+
+class TravelTimes:
+    """
+    Historical travel times between stops, for EtaEngine. This one does not know any; subclasses fill them in from
+    recorded positions, see SegmentStatistics.
+    """
+
+    def record(self, train: str, timestamp: float, lat: float, lon: float, speed: float):
+        """
+        Learn from a position of a train as it is processed. This one ignores it.
+        :param timestamp: time of the position, in seconds since the epoch
+        :param speed: the estimated speed of the train, in m/s
+        """
+        pass
+
+    def leg(self, origin: Waypoint, destination: Waypoint) -> float | None:
+        """
+        Return the typical time from leaving origin to arriving at destination, the next stop after it, in seconds, or
+        None if it is not known.
+        """
+        return None
+
+    def dwell(self, stop: Waypoint) -> float | None:
+        """
+        Return the typical time trains stay at a stop, in seconds, or None if it is not known.
+        """
+        return None
+
+    def speed(self) -> float | None:
+        """
+        Return the typical speed of moving trains, in m/s, to estimate when a train that is standing arrives, or None
+        if it is not known.
+        """
+        return None
+
+
+class EtaEngine:
+    """
+    Estimates when a train arrives at each of the stops ahead of it.
+
+    The time to the next stop is the distance along the tracks divided by the current speed of the train. From there
+    on, each leg takes its historical travel time if the TravelTimes know it, and distance divided by speed otherwise,
+    plus the historical dwell time at the stop in between. For a train that is standing, the typical speed of moving
+    trains is used instead of its own, as if it left right now; without one, it has no ETAs.
+    """
+
+    # below this speed, in m/s, a train is considered to be standing
+    MIN_SPEED = 0.3
+
+    def __init__(self, tracksmodel: TracksModel, travel_times: TravelTimes | None = None, limit: int = 20):
+        """
+        :param travel_times: historical travel times, if any
+        :param limit: the maximum number of stops to estimate
+        """
+        self.tracksmodel = tracksmodel
+        self.travel_times = TravelTimes() if travel_times is None else travel_times
+        self.limit = limit
+
+    def stops_ahead(self, state: TrainState):
+        """
+        Return an iterator over the stops ahead of the train, each once, as tuples of the stop and the distance to it.
+        For a train that is not on the track graph, only the next stop by trackmarker is known, and the distance is the
+        difference in trackmarkers.
+        """
+        if state.edge >= 0:
+            return self.tracksmodel.graph.upcoming(state.edge, state.snap.trackmarker, state.direction or 1)
+        stop = self.tracksmodel.stops.next_stop(state.snap.trackmarker)
+        if stop is None:
+            return iter(())
+        return iter(((stop, abs(stop.trackmarker - state.snap.trackmarker)),))
+
+    def upcoming(self, state: TrainState) -> list:
+        """
+        Return the stops ahead of a train with their ETAs, in the order the train reaches them.
+        :return: a list of dicts with the stop's ds100, name, trackmarker and type, the distance to it in meters, and
+                 the ETA as an ISO 8601 time in UTC, or None
+        """
+        result = []
+        eta = None
+        previous = None
+        speed = state.speed if state.speed >= self.MIN_SPEED else self.travel_times.speed()
+        for stop, distance in self.stops_ahead(state):
+            if len(result) >= self.limit:
+                break
+            if previous is None:
+                if speed is not None:
+                    eta = state.timestamp + distance / speed
+            elif eta is not None:
+                leg = self.travel_times.leg(previous[0], stop)
+                if leg is None:
+                    leg = (distance - previous[1]) / speed
+                eta += (self.travel_times.dwell(previous[0]) or 0) + leg
+            result.append({
+                'distance': int(distance),
+                'ds100': stop.ds100,
+                'eta': None if eta is None else format_timestamp(eta),
+                'name': stop.name,
+                'trackmarker': stop.trackmarker,
+                'type': stop.type
+            })
+            previous = (stop, distance)
+        return result
@@ -0,0 +1,194 @@
+import glob
+import math
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+# One record per snapped position. Train names are stored as UTF-8 and truncated to 16 bytes.
+RECORD = np.dtype([
+    ('timestamp', '<f8'),
+    ('lat', '<f8'),
+    ('lon', '<f8'),
+    ('trackmarker', '<f4'),
+    ('speed', '<f4'),
+    ('train', 'S16'),
+])
+_RECORD = struct.Struct('<dddff16s')
+
+# Segment header: magic, version, record size, and the range of timestamps in the segment. The range is NaN while the
+# segment is being written, and filled in when it is closed.
+MAGIC = b'C3TH'
+VERSION = 1
+_HEADER = struct.Struct('<4sHHdd8x')
+HEADER_SIZE = _HEADER.size
+
+
+class HistoryWriter:
+    """
+    Appends snapped positions to segment files in a directory. Each segment is a fixed-size header followed by
+    fixed-size records, so it can be read with a memory map without parsing it.
+
+    Records are collected in a buffer and written when the buffer is full or flush_interval seconds have passed. A
+    new segment is started when the current one reaches rotate_bytes or is older than rotate_seconds.
+    """
+
+    def __init__(self, directory: str, rotate_bytes: int = 64 * 1024 * 1024, rotate_seconds: float = 3600,
+                 buffer_size: int = 64 * 1024, flush_interval: float = 5.0, prefix: str = 'positions'):
+        self.directory = directory
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.prefix = prefix
+        self.records = 0
+        self._lock = threading.Lock()
+        self._buffer = bytearray()
+        self._file = None
+        self._filename = None
+        self._size = 0
+        self._opened = 0
+        self._flushed = 0
+        # range of timestamps in the current segment, and in the buffer
+        self._min = math.inf
+        self._max = -math.inf
+        self._buffer_min = math.inf
+        self._buffer_max = -math.inf
+        os.makedirs(directory, exist_ok=True)
+
+    def append(self, train: str, timestamp: float, lat: float, lon: float, trackmarker: float, speed: float):
+        """
+        Add a position to the history.
+        :param train: name of the train
+        :param timestamp: time of the fix, in seconds since the epoch
+        """
+        record = _RECORD.pack(timestamp, lat, lon, trackmarker, speed, train.encode('utf-8')[:16])
+        with self._lock:
+            self._buffer += record
+            self._buffer_min = min(self._buffer_min, timestamp)
+            self._buffer_max = max(self._buffer_max, timestamp)
+            self.records += 1
+            now = time.monotonic()
+            if len(self._buffer) >= self.buffer_size or now - self._flushed >= self.flush_interval:
+                self._write(now)
+
+    def flush(self):
+        with self._lock:
+            self._write(time.monotonic())
+
+    def flush_if_due(self):
+        """
+        Write the buffered records if the last write was more than flush_interval seconds ago. Call this regularly,
+        so records do not stay in the buffer when no new positions arrive.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now - self._flushed >= self.flush_interval:
+                self._write(now)
+
+    def close(self):
+        """
+        Write all buffered records and close the current segment.
+        """
+        with self._lock:
+            self._write(time.monotonic())
+            self._close()
+
+    def _write(self, now: float):
+        self._flushed = now
+        if len(self._buffer) == 0:
+            return
+        if self._file is not None and (self._size >= self.rotate_bytes or now - self._opened >= self.rotate_seconds):
+            self._close()
+        if self._file is None:
+            self._open(now)
+        self._file.write(self._buffer)
+        self._file.flush()
+        self._size += len(self._buffer)
+        self._buffer.clear()
+        self._min = min(self._min, self._buffer_min)
+        self._max = max(self._max, self._buffer_max)
+        self._buffer_min = math.inf
+        self._buffer_max = -math.inf
+
+    def _open(self, now: float):
+        stamp = time.strftime('%Y%m%dT%H%M%S', time.gmtime())
+        n = 0
+        while True:
+            self._filename = os.path.join(self.directory, f'{self.prefix}-{stamp}-{n:03d}.seg')
+            if not os.path.exists(self._filename):
+                break
+            n += 1
+        self._file = open(self._filename, 'wb')
+        self._file.write(_HEADER.pack(MAGIC, VERSION, RECORD.itemsize, math.nan, math.nan))
+        self._size = HEADER_SIZE
+        self._opened = now
+
+    def _close(self):
+        if self._file is None:
+            return
+        self._file.seek(0)
+        self._file.write(_HEADER.pack(MAGIC, VERSION, RECORD.itemsize, self._min, self._max))
+        self._file.close()
+        self._file = None
+        self._min = math.inf
+        self._max = -math.inf
+
+
+class HistoryReader:
+    """
+    Reads the segments written by HistoryWriter.
+    """
+
+    def __init__(self, directory: str, prefix: str = 'positions'):
+        self.directory = directory
+        self.prefix = prefix
+
+    def segments(self) -> list:
+        return sorted(glob.glob(os.path.join(self.directory, f'{self.prefix}-*.seg')))
+
+    @staticmethod
+    def open_segment(filename: str) -> tuple:
+        """
+        Map a segment into memory.
+        :return: a tuple of the records as a NumPy array, and the first and last timestamp in the segment (NaN if the
+                 segment has not been closed yet)
+        """
+        with open(filename, 'rb') as f:
+            (magic, version, size, first, last) = _HEADER.unpack(f.read(HEADER_SIZE))
+        if magic != MAGIC or version != VERSION or size != RECORD.itemsize:
+            raise Exception(f'{filename} is not a position history segment')
+        # a segment that is still being written may end in a partial record
+        count = (os.path.getsize(filename) - HEADER_SIZE) // RECORD.itemsize
+        if count == 0:
+            return np.empty(0, dtype=RECORD), first, last
+        return np.memmap(filename, dtype=RECORD, mode='r', offset=HEADER_SIZE, shape=(count,)), first, last
+
+    def read(self, train: str | None = None, start: float | None = None, end: float | None = None) -> np.ndarray:
+        """
+        Return all records matching the filter, in the order they were written.
+        :param train: only return records for this train
+        :param start: only return records with a timestamp at or after this time, in seconds since the epoch
+        :param end: only return records with a timestamp before this time, in seconds since the epoch
+        """
+        found = []
+        for filename in self.segments():
+            records, first, last = self.open_segment(filename)
+            # skip closed segments that lie completely outside the time range
+            if start is not None and last < start:
+                continue
+            if end is not None and first >= end:
+                continue
+            mask = np.ones(len(records), dtype=bool)
+            if train is not None:
+                mask &= records['train'] == train.encode('utf-8')[:16]
+            if start is not None:
+                mask &= records['timestamp'] >= start
+            if end is not None:
+                mask &= records['timestamp'] < end
+            found.append(np.array(records[mask]))
+        if len(found) == 0:
+            return np.empty(0, dtype=RECORD)
+        return np.concatenate(found)
@@ -0,0 +1,296 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+from urllib.parse import parse_qs
+
+from .tracksmodel import TracksModel
+
+CONTENT_TYPES = {
+    '.dokuwiki': 'text/plain; charset=utf-8',
+    '.geojson': 'application/geo+json; charset=utf-8',
+    '.html': 'text/html; charset=utf-8',
+    '.js': 'text/javascript; charset=utf-8',
+    '.json': 'application/json; charset=utf-8',
+    '.png': 'image/png',
+    '.prom': 'text/plain; version=0.0.4; charset=utf-8',
+}
+
+REASONS = {
+    200: 'OK',
+    304: 'Not Modified',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+}
+
+
+class Document:
+    """
+    A response body with its content type and entity tag.
+    """
+
+    def __init__(self, content_type: str, body: bytes):
+        self.content_type = content_type
+        self.body = body
+        self.etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+class TrainServer:
+    """
+    Serves the track model, the live train state, and optionally the static files of the map over HTTP, straight from
+    memory. Responses carry an ETag, and requests with a matching If-None-Match get a 304 without a body.
+
+    /events is a Server-Sent Events stream that pushes every position as soon as it has been processed. Each viewer
+    has a small queue; if a viewer does not keep up, positions are dropped for that viewer only.
+
+    /metrics has the metrics of the client in the Prometheus text format, if it records them.
+
+    The server runs its own asyncio event loop, either in a thread started with start_thread(), or in an existing
+    loop with start().
+    """
+
+    def __init__(self, client, tracksmodel: TracksModel | None = None, static_dir: str | None = None,
+                 host: str = 'localhost', port: int = 8080, queue_size: int = 100, heartbeat: float = 15.0):
+        """
+        :param client: the MqttTrainReporterClient with the train state
+        :param tracksmodel: serve tracks.json, tracks.geojson and stations.dokuwiki from this model
+        :param static_dir: serve the files in this directory, for example data/ with the map
+        :param host: address to listen on
+        :param port: port to listen on; 0 picks a free port, see self.port once started
+        :param queue_size: maximum number of events waiting to be sent to one viewer
+        :param heartbeat: seconds after which an idle event stream gets a comment, to keep the connection open
+        """
+        self.client = client
+        self.static_dir = static_dir
+        self.host = host
+        self.port = port
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+        self.requests = 0
+        self.not_modified = 0
+        self.dropped = 0
+        self._documents = {}
+        if tracksmodel is not None:
+            self._documents['/tracks.json'] = self._document('.json', tracksmodel.to_json(client.output_format))
+            self._documents['/tracks.geojson'] = self._document(
+                '.geojson', tracksmodel.to_geojson(output_format=client.output_format))
+            self._documents['/stations.dokuwiki'] = self._document('.dokuwiki', tracksmodel.to_station_table())
+        # path -> (revision, Document) of the documents rendered from the train state
+        self._rendered = {}
+        self._render_lock = threading.Lock()
+        self._subscribers = set()
+        self._server = None
+        self._loop = None
+        self._thread = None
+
+    @staticmethod
+    def _document(extension: str, body: str | bytes) -> Document:
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        return Document(CONTENT_TYPES.get(extension, 'application/octet-stream'), body)
+
+    @property
+    def viewers(self) -> int:
+        return len(self._subscribers)
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self.client.add_listener(self._on_position)
+
+    async def stop(self):
+        self.client.listeners.remove(self._on_position)
+        self._server.close()
+        await self._server.wait_closed()
+
+    def start_thread(self):
+        """
+        Run the server in a new thread with its own event loop, and return once it accepts connections.
+        """
+        started = threading.Event()
+
+        async def serve():
+            await self.start()
+            started.set()
+            await self._server.serve_forever()
+
+        def run():
+            try:
+                asyncio.run(serve())
+            except asyncio.CancelledError:
+                pass
+
+        self._thread = threading.Thread(target=run, name='http', daemon=True)
+        self._thread.start()
+        started.wait()
+
+    def stop_thread(self):
+        future = asyncio.run_coroutine_threadsafe(self.stop(), self._loop)
+        future.result()
+        self._thread.join()
+
+    def _on_position(self, name: str, pos: dict):
+        """
+        Called by the client on its processing thread; serialize there, and hand the event to the event loop.
+        """
+        data = json.dumps({'name': name, **pos}, default=vars, ensure_ascii=False, separators=(',', ':'))
+        event = f'event: position\ndata: {data}\n\n'.encode('utf-8')
+        try:
+            self._loop.call_soon_threadsafe(self._broadcast, event)
+        except RuntimeError:
+            # the event loop has been shut down
+            pass
+
+    def _broadcast(self, event: bytes):
+        for queue in self._subscribers:
+            if queue.full():
+                self.dropped += 1
+            else:
+                queue.put_nowait(event)
+
+    def _rendered_document(self, path: str, extension: str, render) -> Document:
+        """
+        Return a document rendered from the train state, rendering it again only if the trains have changed.
+        """
+        revision = self.client.revision
+        cached = self._rendered.get(path)
+        if cached is not None and cached[0] == revision:
+            return cached[1]
+        with self._render_lock:
+            document = self._document(extension, render())
+            self._rendered[path] = (revision, document)
+        return document
+
+    def _static_document(self, path: str) -> Document | None:
+        if self.static_dir is None:
+            return None
+        filename = os.path.normpath(os.path.join(self.static_dir, path.lstrip('/')))
+        if not filename.startswith(os.path.normpath(self.static_dir) + os.sep) or not os.path.isfile(filename):
+            return None
+        mtime = os.stat(filename).st_mtime_ns
+        cached = self._rendered.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with open(filename, 'rb') as f:
+            document = self._document(os.path.splitext(filename)[1], f.read())
+        self._rendered[path] = (mtime, document)
+        return document
+
+    def lookup(self, path: str, query: str) -> Document | None:
+        """
+        Return the document for a path, or None if there is none.
+        """
+        if path == '/':
+            path = '/index.html'
+        if path in self._documents:
+            return self._documents[path]
+        match path:
+            case '/trains.json':
+                return self._rendered_document(path, '.json', self.client.trains_to_json)
+            case '/trains.geojson':
+                return self._rendered_document(path, '.geojson', self.client.trains_to_geojson)
+            case '/trains-delta.json':
+                since = parse_qs(query).get('since')
+                return self._document('.json', self.client.delta_to_json(int(since[0]) if since else None))
+            case '/crossings.json':
+                if self.client.crossings is not None:
+                    return self._document('.json', self.client.crossings_to_json())
+            case '/metrics':
+                if self.client.metrics.enabled:
+                    return self._document('.prom', self.client.metrics.render())
+        return self._static_document(path)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    break
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    (method, target, version) = lines[0].split(' ', 2)
+                except ValueError:
+                    await self._respond(writer, 400, {}, b'', 'GET')
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    if ':' in line:
+                        (key, value) = line.split(':', 1)
+                        headers[key.strip().lower()] = value.strip()
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                (path, _, query) = target.partition('?')
+                self.requests += 1
+                if method not in ('GET', 'HEAD'):
+                    # the body of the request, if any, is not read, so the connection cannot be used any more
+                    await self._respond(writer, 405, {'Allow': 'GET, HEAD', 'Connection': 'close'}, b'', method)
+                    break
+                elif path == '/events':
+                    await self._events(writer)
+                    break
+                else:
+                    await self._serve(writer, method, path, query, headers)
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        except Exception as e:
+            logging.error('HTTP: unable to handle request: %s', e)
+        finally:
+            writer.close()
+
+    async def _serve(self, writer: asyncio.StreamWriter, method: str, path: str, query: str, headers: dict):
+        try:
+            document = self.lookup(path, query)
+        except ValueError:
+            await self._respond(writer, 400, {}, b'', method)
+            return
+        if document is None:
+            await self._respond(writer, 404, {'Content-Type': 'text/plain'}, b'Not found\n', method)
+            return
+        response = {
+            'Cache-Control': 'no-cache',
+            'Content-Type': document.content_type,
+            'ETag': document.etag,
+        }
+        if document.etag in [tag.strip() for tag in headers.get('if-none-match', '').split(',')]:
+            self.not_modified += 1
+            await self._respond(writer, 304, response, b'', method)
+        else:
+            await self._respond(writer, 200, response, document.body, method)
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: int, headers: dict, body: bytes, method: str):
+        head = [f'HTTP/1.1 {status} {REASONS[status]}', 'Access-Control-Allow-Origin: *']
+        head += [f'{key}: {value}' for key, value in headers.items()]
+        if status != 304:
+            head.append(f'Content-Length: {len(body)}')
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+        if method != 'HEAD':
+            writer.write(body)
+        await writer.drain()
+
+    async def _events(self, writer: asyncio.StreamWriter):
+        queue = asyncio.Queue(self.queue_size)
+        self._subscribers.add(queue)
+        try:
+            writer.write(b'HTTP/1.1 200 OK\r\n'
+                         b'Access-Control-Allow-Origin: *\r\n'
+                         b'Cache-Control: no-cache\r\n'
+                         b'Content-Type: text/event-stream\r\n'
+                         b'\r\n'
+                         b': connected\n\n')
+            await writer.drain()
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    event = b': keep-alive\n\n'
+                writer.write(event)
+                await writer.drain()
+        finally:
+            self._subscribers.discard(queue)
@@ -0,0 +1,126 @@
+import logging
+import threading
+import zlib
+from collections import deque
+
+
+class _Shard:
+    """
+    The part of the queue drained by one worker.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.items = deque()
+        self.latest = {}
+        self.received = 0
+        self.processed = 0
+        self.superseded = 0
+        self.dropped = 0
+        self.errors = 0
+
+
+class IngestQueue:
+    """
+    A bounded queue between the MQTT network thread and a pool of worker threads that process the messages.
+
+    Items are assigned to a worker by their key (the train name), so all items for one train are handled by the same
+    worker, in the order they were received. When the queue is full, an item marked as superseding replaces the
+    pending item with the same key that was marked the same way, instead of being dropped: there is no point in
+    processing an old position of a train when a newer one is already waiting. Anything else is dropped when the
+    queue is full, so the network thread never blocks.
+    """
+
+    def __init__(self, handler, maxsize: int = 1000, workers: int = 1, name: str = 'ingest'):
+        """
+        :param handler: function called by the workers with the arguments passed to put
+        :param maxsize: maximum number of pending items, split evenly between the workers
+        :param workers: number of worker threads
+        :param name: prefix for the names of the worker threads
+        """
+        self.handler = handler
+        self.shard_size = max(1, -(-maxsize // workers))
+        self.name = name
+        self._shards = [_Shard() for i in range(0, workers)]
+        self._threads = []
+        self._running = False
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        for i, shard in enumerate(self._shards):
+            thread = threading.Thread(target=self._run, args=(shard,), name=f'{self.name}-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """
+        Stop the workers once they have processed all pending items.
+        """
+        self._running = False
+        for shard in self._shards:
+            with shard.condition:
+                shard.condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def put(self, key: str, *args, supersede: bool = False) -> bool:
+        """
+        Queue an item for processing.
+        :param key: items with the same key are processed in order by the same worker
+        :param args: arguments for the handler
+        :param supersede: if the queue is full, replace the pending item with the same key that was also queued with
+                          supersede set
+        :return: False if the item was dropped because the queue is full
+        """
+        shard = self._shards[zlib.crc32(key.encode('utf-8')) % len(self._shards)]
+        with shard.condition:
+            shard.received += 1
+            if len(shard.items) >= self.shard_size:
+                entry = shard.latest.get(key) if supersede else None
+                if entry is None:
+                    shard.dropped += 1
+                    return False
+                entry[1] = args
+                shard.superseded += 1
+                return True
+            entry = [key, args]
+            shard.items.append(entry)
+            if supersede:
+                shard.latest[key] = entry
+            shard.condition.notify()
+        return True
+
+    @property
+    def depth(self) -> int:
+        return sum(len(shard.items) for shard in self._shards)
+
+    def stats(self) -> dict:
+        return {
+            'depth': self.depth,
+            'received': sum(shard.received for shard in self._shards),
+            'processed': sum(shard.processed for shard in self._shards),
+            'superseded': sum(shard.superseded for shard in self._shards),
+            'dropped': sum(shard.dropped for shard in self._shards),
+            'errors': sum(shard.errors for shard in self._shards),
+        }
+
+    def _run(self, shard: _Shard):
+        while True:
+            with shard.condition:
+                while self._running and len(shard.items) == 0:
+                    shard.condition.wait()
+                if len(shard.items) == 0:
+                    return
+                entry = shard.items.popleft()
+                if shard.latest.get(entry[0]) is entry:
+                    del shard.latest[entry[0]]
+                args = entry[1]
+            try:
+                self.handler(*args)
+            except Exception as e:
+                shard.errors += 1
+                logging.error('%s: unable to process item for %s: %s', self.name, entry[0], e)
+            shard.processed += 1
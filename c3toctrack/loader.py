@@ -0,0 +1,143 @@
+"""
+Streaming readers for the track network, from GPX as exported by JOSM, or straight from the OSM XML edited in JOSM.
+
+Both read the file with iterparse and drop each element once it has been read, so the memory used does not grow with
+the size of the file, and yield one tuple of track name, latitude, longitude, and label per point. The label is the
+name of the waypoint at that point, like "Hp GH Himmel", or None.
+"""
+import logging
+import xml.etree.ElementTree as ElementTree
+
+logger = logging.getLogger(__name__)
+
+# values of the railway tag of OSM ways that are tracks
+RAILWAYS = ('rail', 'narrow_gauge', 'light_rail', 'tram', 'miniature', 'subway', 'monorail', 'funicular')
+
+# waypoint type for the values of the railway tag of OSM nodes, for names without a type
+WAYPOINT_TYPES = {
+    'level_crossing': 'Bü',
+    'crossing': 'Bü',
+    'platform': 'Hp',
+    'halt': 'Hp',
+    'stop': 'Hp',
+    'station': 'Bf',
+    'switch': 'W',
+}
+
+
+def _local(tag: str) -> str:
+    """
+    Return the tag without its namespace.
+    """
+    return tag.rpartition('}')[2]
+
+
+def read_gpx(filename: str):
+    """
+    Read the points of the tracks in a GPX file. Tracks without a name are skipped.
+    :return: a generator of tuples of track name, latitude, longitude, and the name of the point or None
+    """
+    with open(filename, 'rb') as f:
+        # the elements that have been started but not ended yet
+        open_elements = []
+        trackname = None
+        for event, element in ElementTree.iterparse(f, events=('start', 'end')):
+            if event == 'start':
+                open_elements.append(element)
+                continue
+            open_elements.pop()
+            tag = _local(element.tag)
+            if tag == 'name' and _local(open_elements[-1].tag) == 'trk':
+                trackname = (element.text or '').strip() or None
+            elif tag == 'trkpt':
+                if trackname is not None:
+                    label = None
+                    for child in element:
+                        if _local(child.tag) == 'name':
+                            label = (child.text or '').strip() or None
+                    yield trackname, float(element.get('lat')), float(element.get('lon')), label
+            elif tag == 'trk':
+                trackname = None
+            if tag in ('trkpt', 'trk', 'wpt', 'rte', 'metadata'):
+                # drop what has been read; it is the only child of its parent left by now
+                open_elements[-1].remove(element)
+
+
+def _tags(element) -> dict:
+    return {tag.get('k'): tag.get('v') for tag in element if tag.tag == 'tag'}
+
+
+def _label(tags: dict) -> str | None:
+    """
+    Return the label of the waypoint for the tags of an OSM node, or None if it is not a named waypoint. Names may
+    already start with the type and the DS100 designation, like in the GPX export; otherwise, they are added from the
+    railway tag, and the railway:ref or ref tag.
+    """
+    name = tags.get('name')
+    if name is None:
+        return None
+    kind = WAYPOINT_TYPES.get(tags.get('railway'))
+    if kind is None or name.split(' ', 1)[0] in WAYPOINT_TYPES.values():
+        return name
+    if kind in ('Hp', 'Bf'):
+        ref = tags.get('railway:ref') or tags.get('ref')
+        if ref is None:
+            return None
+        return f'{kind} {ref} {name}'
+    return f'{kind} {name}'
+
+
+def _osm_elements(filename: str):
+    """
+    Generate the node and way elements of an OSM file. Each is cleared once the caller has moved on to the next.
+    """
+    with open(filename, 'rb') as f:
+        context = ElementTree.iterparse(f, events=('start', 'end'))
+        (_, root) = next(context)
+        for event, element in context:
+            if event == 'end' and element.tag in ('node', 'way', 'relation'):
+                if element.tag != 'relation':
+                    yield element
+                element.clear()
+                root.clear()
+
+
+def read_osm(filename: str, railways: tuple = RAILWAYS):
+    """
+    Read the points of the named railway ways in an OSM XML file, in the order of the ways in the file.
+
+    The file is read twice: first to find the nodes the tracks use, then to keep only those nodes while reading the
+    ways, so the memory used only grows with the size of the track network, not with everything else in the file.
+    Nodes that a way references but that are not in the file, as in exports of a bounding box, are skipped with a
+    warning.
+    :param railways: values of the railway tag of the ways to read
+    :return: a generator of tuples of track name, latitude, longitude, and the label of the waypoint at the point or None
+    """
+    used = set()
+    for element in _osm_elements(filename):
+        if element.tag == 'way':
+            tags = _tags(element)
+            if tags.get('railway') in railways and tags.get('name'):
+                used.update(nd.get('ref') for nd in element if nd.tag == 'nd')
+
+    # node id -> (lat, lon, label)
+    nodes = {}
+    for element in _osm_elements(filename):
+        if element.tag == 'node':
+            ref = element.get('id')
+            if ref in used:
+                nodes[ref] = (float(element.get('lat')), float(element.get('lon')), _label(_tags(element)))
+        else:
+            tags = _tags(element)
+            name = tags.get('name')
+            if tags.get('railway') not in railways or not name:
+                continue
+            for nd in element:
+                if nd.tag == 'nd':
+                    node = nodes.get(nd.get('ref'))
+                    if node is None:
+                        logger.warning('Way %s (%s) references node %s, which is not in %s', element.get('id'), name,
+                                       nd.get('ref'), filename)
+                        continue
+                    (lat, lon, label) = node
+                    yield name, lat, lon, label
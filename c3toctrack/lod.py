@@ -0,0 +1,148 @@
+"""
+Simplified geometries of the tracks for showing them on a map zoomed out, and tiles of them, so the map does not have
+to load every point of every track.
+
+Zoom levels and tiles are those of the web maps: at zoom level z, the world is 2^z by 2^z tiles of 256 by 256 pixels.
+"""
+from math import asinh, atan, cos, degrees, floor, pi, radians, sinh, tan
+
+import numpy as np
+
+from .point import Point
+
+# length of the equator in meters, as used by the web maps
+EARTH_CIRCUMFERENCE = 40075016.686
+# width and height of a tile, in pixels
+TILE_SIZE = 256
+# zoom levels to write simplified tracks for; from about 16 on, the tracks are shown with all their points
+ZOOMS = (10, 12, 14)
+
+
+def meters_per_pixel(zoom: int, lat: float) -> float:
+    """
+    Return how many meters one pixel of the map covers at a zoom level and latitude.
+    """
+    return EARTH_CIRCUMFERENCE * cos(radians(lat)) / (TILE_SIZE << zoom)
+
+
+def tolerance(zoom: int, lat: float) -> float:
+    """
+    Return how far, in meters, a simplified track may be from the actual one to look the same at a zoom level: half a
+    pixel.
+    """
+    return meters_per_pixel(zoom, lat) / 2
+
+
+def simplify(lats, lons, tolerance: float, keep=()) -> list:
+    """
+    Simplify a line with the Douglas-Peucker algorithm: keep the first and last point, then the point farthest from
+    the line between them if it is more than tolerance meters away, and so on for the parts before and after it.
+    :param lats: latitudes of the points, as a sequence or NumPy array
+    :param lons: longitudes of the points, of the same length
+    :param tolerance: the largest distance of a dropped point from the simplified line, in meters
+    :param keep: indices of points that are always kept, like waypoints
+    :return: the indices of the points that are kept, in order
+    """
+    n = len(lats)
+    if n <= 2 or tolerance <= 0:
+        return list(range(0, n))
+    y = np.asarray(lats, dtype=np.float64) / Point.degree_per_meter_lat
+    x = np.asarray(lons, dtype=np.float64) / Point.degree_per_meter_lon
+    kept = np.zeros(n, dtype=bool)
+    kept[0] = kept[-1] = True
+    kept[list(keep)] = True
+    anchors = np.flatnonzero(kept)
+    # parts of the line still to simplify, as pairs of the indices of their first and last point
+    parts = list(zip(anchors[:-1].tolist(), anchors[1:].tolist()))
+    while len(parts) > 0:
+        (first, last) = parts.pop()
+        if last - first < 2:
+            continue
+        dx = x[last] - x[first]
+        dy = y[last] - y[first]
+        px = x[first + 1:last] - x[first]
+        py = y[first + 1:last] - y[first]
+        # distance from the segment between first and last, not from the line through them, so points beyond the
+        # ends, as in loops, are measured correctly
+        length2 = dx * dx + dy * dy
+        t = np.zeros_like(px) if length2 == 0 else np.clip((px * dx + py * dy) / length2, 0.0, 1.0)
+        distances = np.hypot(px - t * dx, py - t * dy)
+        i = int(np.argmax(distances))
+        if distances[i] > tolerance:
+            i += first + 1
+            kept[i] = True
+            parts.append((first, i))
+            parts.append((i, last))
+    return np.flatnonzero(kept).tolist()
+
+
+def tile(zoom: int, lat: float, lon: float) -> tuple:
+    """
+    Return the x and y of the tile a position is on at a zoom level.
+    """
+    n = 1 << zoom
+    x = floor((lon + 180.0) / 360.0 * n)
+    y = floor((1.0 - asinh(tan(radians(lat))) / pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_bounds(zoom: int, x: int, y: int) -> tuple:
+    """
+    Return the west, south, east and north edge of a tile, in degrees.
+    """
+    n = 1 << zoom
+
+    def lat(y):
+        return degrees(atan(sinh(pi * (1 - 2 * y / n))))
+
+    return x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y)
+
+
+def _runs(indices: list) -> list:
+    """
+    Split sorted indices of segments into runs of consecutive segments.
+    :return: a list of the first and last segment of each run
+    """
+    runs = []
+    for i in indices:
+        if len(runs) > 0 and runs[-1][1] == i - 1:
+            runs[-1][1] = i
+        else:
+            runs.append([i, i])
+    return runs
+
+
+def tiles(features: list, zoom: int) -> dict:
+    """
+    Cut GeoJSON features into the tiles of a zoom level. Lines are cut between their points: each tile gets the
+    segments that may cross it, so the lines continue to the next point beyond the edge of the tile, and tiles next
+    to each other join up.
+    :param features: features with Point and LineString geometries
+    :return: a dict of the features on each tile, by the x and y of the tile
+    """
+    cut = {}
+    for feature in features:
+        geometry = feature['geometry']
+        if geometry['type'] == 'Point':
+            (lon, lat) = geometry['coordinates']
+            cut.setdefault(tile(zoom, lat, lon), []).append(feature)
+            continue
+        coordinates = geometry['coordinates']
+        # tile -> indices of the segments that may cross it
+        segments = {}
+        for i in range(0, len(coordinates) - 1):
+            (lon0, lat0) = coordinates[i]
+            (lon1, lat1) = coordinates[i + 1]
+            (x0, y0) = tile(zoom, max(lat0, lat1), min(lon0, lon1))
+            (x1, y1) = tile(zoom, min(lat0, lat1), max(lon0, lon1))
+            for x in range(x0, x1 + 1):
+                for y in range(y0, y1 + 1):
+                    segments.setdefault((x, y), []).append(i)
+        for xy, indices in segments.items():
+            lines = [coordinates[first:last + 2] for (first, last) in _runs(indices)]
+            if len(lines) == 1:
+                part = {'type': 'LineString', 'coordinates': lines[0]}
+            else:
+                part = {'type': 'MultiLineString', 'coordinates': lines}
+            cut.setdefault(xy, []).append({'type': 'Feature', 'geometry': part, 'properties': feature['properties']})
+    return cut
@@ -0,0 +1,264 @@
+import os
+import threading
+from bisect import bisect_left
+
+from atomicwrites import atomic_write
+
+# upper bounds of the histogram buckets, in seconds, from 10 µs to 1 s
+BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+           0.5, 1.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(label: str | None, value, extra: str = '') -> str:
+    labels = [] if value is None else [f'{label}="{_escape(str(value))}"']
+    if extra:
+        labels.append(extra)
+    return '{' + ','.join(labels) + '}' if labels else ''
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    """
+    A value that only goes up, optionally one per value of a label.
+    """
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, label: str | None = None):
+        self.name = name
+        self.help = help
+        self.label = label
+        # label value -> count
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value=None, amount: float = 1):
+        """
+        :param value: the value of the label, if the counter has one
+        """
+        with self._lock:
+            self.values[value] = self.values.get(value, 0) + amount
+
+    def take(self) -> dict:
+        with self._lock:
+            (values, self.values) = (self.values, {})
+        return values
+
+    def merge(self, values: dict):
+        for value, amount in values.items():
+            self.inc(value, amount)
+
+    def render(self) -> list:
+        with self._lock:
+            return [f'{self.name}{_labels(self.label, value)} {_number(count)}' for value, count in self.values.items()]
+
+
+class Gauge:
+    """
+    A value that goes up and down. It is either set, or read from a function whenever the metrics are rendered.
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, label: str | None = None, function=None):
+        """
+        :param function: function without arguments that returns the current value
+        """
+        self.name = name
+        self.help = help
+        self.label = label
+        self.function = function
+        self.values = {}
+
+    def set(self, amount: float, value=None):
+        self.values[value] = amount
+
+    def take(self) -> dict:
+        return {}
+
+    def merge(self, values: dict):
+        pass
+
+    def render(self) -> list:
+        values = dict(self.values)
+        if self.function is not None:
+            values[None] = self.function()
+        return [f'{self.name}{_labels(self.label, value)} {_number(amount)}' for value, amount in values.items()]
+
+
+class Histogram:
+    """
+    Counts how many observations fall into each of a fixed set of buckets, and their sum, optionally one set per value
+    of a label. Observing is a binary search and a few additions.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, label: str | None = None, buckets: tuple = BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = buckets
+        # label value -> [count per bucket, with one more for the values above the largest bucket], sum, count
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, amount: float, value=None):
+        """
+        :param value: the value of the label, if the histogram has one
+        """
+        i = bisect_left(self.buckets, amount)
+        with self._lock:
+            series = self.values.get(value)
+            if series is None:
+                series = self.values[value] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += amount
+            series[2] += 1
+
+    def take(self) -> dict:
+        with self._lock:
+            (values, self.values) = (self.values, {})
+        return values
+
+    def merge(self, values: dict):
+        with self._lock:
+            for value, (counts, total, count) in values.items():
+                series = self.values.get(value)
+                if series is None:
+                    series = self.values[value] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                for i, n in enumerate(counts):
+                    series[0][i] += n
+                series[1] += total
+                series[2] += count
+
+    def render(self) -> list:
+        lines = []
+        with self._lock:
+            for value, (counts, total, count) in self.values.items():
+                cumulative = 0
+                for bound, n in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += n
+                    le = 'le="' + _number(bound) + '"'
+                    lines.append(f'{self.name}_bucket{_labels(self.label, value, le)} {cumulative}')
+                lines.append(f'{self.name}_sum{_labels(self.label, value)} {_number(total)}')
+                lines.append(f'{self.name}_count{_labels(self.label, value)} {count}')
+        return lines
+
+
+class _Null:
+    """
+    Stands in for every metric when metrics are disabled.
+    """
+
+    def inc(self, value=None, amount: float = 1):
+        pass
+
+    def set(self, amount: float, value=None):
+        pass
+
+    def observe(self, amount: float, value=None):
+        pass
+
+
+class Metrics:
+    """
+    A set of counters, gauges and histograms, rendered in the Prometheus text format.
+
+    Metrics are created on first use with counter(), gauge() and histogram(), and asking for the same name again
+    returns the same metric, so they can be looked up once and kept by the code updating them.
+    """
+
+    enabled = True
+
+    def __init__(self, prefix: str = 'c3toctrack_'):
+        self.prefix = prefix
+        # name -> metric, in the order they were created
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(self.prefix + name, *args, **kwargs)
+            return metric
+
+    def counter(self, name: str, help: str, label: str | None = None) -> Counter:
+        return self._get(Counter, name, help, label)
+
+    def gauge(self, name: str, help: str, label: str | None = None, function=None) -> Gauge:
+        return self._get(Gauge, name, help, label, function)
+
+    def histogram(self, name: str, help: str, label: str | None = None, buckets: tuple = BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, label, buckets)
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines += metric.render()
+        return '\n'.join(lines) + '\n'
+
+    def write(self, filename: str):
+        """
+        Write the metrics to a file, for example for the textfile collector of the Prometheus node exporter.
+        """
+        with atomic_write(filename, overwrite=True, encoding='utf8') as f:
+            os.fchmod(f.fileno(), 0o664)
+            f.write(self.render())
+
+    def take(self) -> dict:
+        """
+        Return the counts of all counters and histograms since the last call, and reset them, to be merged into the
+        metrics of another process.
+        """
+        taken = {}
+        for name, metric in list(self.metrics.items()):
+            values = metric.take()
+            if len(values) > 0:
+                taken[name] = values
+        return taken
+
+    def merge(self, taken: dict):
+        """
+        Add counts returned by take() in another process. Only metrics that exist here are merged.
+        """
+        for name, values in taken.items():
+            metric = self.metrics.get(name)
+            if metric is not None:
+                metric.merge(values)
+
+
+class NullMetrics(Metrics):
+    """
+    Metrics that are not recorded: every metric is a shared object whose methods do nothing.
+    """
+
+    enabled = False
+    _null = _Null()
+
+    def counter(self, name: str, help: str, label: str | None = None):
+        return self._null
+
+    def gauge(self, name: str, help: str, label: str | None = None, function=None):
+        return self._null
+
+    def histogram(self, name: str, help: str, label: str | None = None, buckets: tuple = BUCKETS):
+        return self._null
+
+    def render(self) -> str:
+        return ''
+
+    def take(self) -> dict:
+        return {}
@@ -0,0 +1,104 @@
+from math import atan2, degrees
+
+from .spatialindex import Snap
+from .tracksmodel import TracksModel
+
+
+class TrainState:
+    """
+    What is known about a train from its previous positions: where it is on the track graph, which way it is going,
+    and how fast.
+
+    Speed is estimated from the distance the train travels along the tracks, not from the speed reported by the GPS
+    receiver, which jumps around a lot at the low speeds of the trains. The distance, counted forward in the direction
+    of travel, is smoothed with an alpha-beta filter, a Kalman filter with fixed gains: each fix, position and speed
+    are predicted from the previous estimate, and corrected by a fraction of the difference between prediction and
+    measurement. The direction of travel only changes once the estimated speed has become clearly negative, so GPS
+    noise does not make a standing train turn around.
+    """
+
+    __slots__ = ('snap', 'edge', 'direction', 'timestamp', 'measured', 'odometer', 'speed', 'heading')
+
+    # gains of the filter for the position and for the speed
+    ALPHA = 0.5
+    BETA = 0.1
+    # the estimated speed has to be this far below zero, in m/s, for the train to change direction
+    MIN_SPEED = 0.5
+    # after a gap of this many seconds between fixes, the filter starts over
+    MAX_GAP = 30.0
+
+    def __init__(self, tracksmodel: TracksModel, snap: Snap, timestamp: float, speed: float = 0.0):
+        """
+        :param snap: the first position of the train
+        :param timestamp: time of the fix, in seconds since the epoch
+        :param speed: speed reported by the receiver, in km/h, used as the initial estimate
+        """
+        self.snap = snap
+        self.edge = tracksmodel.graph.edge_of(snap.segment)
+        # 1 or -1 along the edge, or 0 until the train has moved for the first time
+        self.direction = 0
+        self.timestamp = timestamp
+        # distance travelled as measured, and as estimated by the filter, in meters
+        self.measured = 0.0
+        self.odometer = 0.0
+        # estimated speed, in m/s
+        self.speed = max(speed, 0) / 3.6
+        self.heading = 0
+        self.heading = self._heading(tracksmodel)
+
+    def update(self, tracksmodel: TracksModel, snap: Snap, timestamp: float):
+        """
+        Move the train to a new position.
+        :param timestamp: time of the fix, in seconds since the epoch
+        """
+        edge = tracksmodel.graph.edge_of(snap.segment)
+        advanced = tracksmodel.graph.advance(self.edge, self.snap.trackmarker, self.direction or 1, edge,
+                                             snap.trackmarker)
+        if self.direction == 0 and advanced is not None:
+            # assume the train is going the way it has just moved
+            advanced = (abs(advanced[0]), advanced[1] if advanced[0] >= 0 else -advanced[1])
+        dt = timestamp - self.timestamp
+        if advanced is None or dt > self.MAX_GAP:
+            # the train has been gone for a while, or has jumped somewhere else
+            if advanced is not None:
+                self.direction = advanced[1] if advanced[0] >= 0 else -advanced[1]
+            self.speed = abs(advanced[0]) / dt if advanced is not None and dt > 0 else 0.0
+            self.measured = self.odometer = 0.0
+        else:
+            (moved, self.direction) = advanced
+            self.measured += moved
+            if dt > 0:
+                predicted = self.odometer + self.speed * dt
+                residual = self.measured - predicted
+                self.odometer = predicted + self.ALPHA * residual
+                self.speed += self.BETA * residual / dt
+            if self.speed < -self.MIN_SPEED:
+                # the train has been going backwards for a while, so it has changed direction
+                self.direction = -self.direction
+                self.speed = -self.speed
+                self.odometer = -self.odometer
+                self.measured = -self.measured
+        self.snap = snap
+        self.edge = edge
+        self.timestamp = max(self.timestamp, timestamp)
+        self.heading = self._heading(tracksmodel)
+
+    def _heading(self, tracksmodel: TracksModel) -> int:
+        """
+        Return the direction of the track at the train in the direction of travel, in degrees; 0 is north, 90 is east.
+        """
+        index = tracksmodel.index
+        (dx, dy) = (index.dx[self.snap.segment], index.dy[self.snap.segment])
+        if dx == 0 and dy == 0:
+            return self.heading
+        if self.direction < 0:
+            (dx, dy) = (-dx, -dy)
+        return int(degrees(atan2(dx, dy)) % 360)
+
+    @property
+    def kmh(self) -> float:
+        """
+        The estimated speed in km/h. While the train is about to change direction, the estimate can be slightly
+        negative; that is reported as standing still.
+        """
+        return max(self.speed, 0.0) * 3.6
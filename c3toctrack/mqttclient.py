@@ -1,194 +1,450 @@
-import json
 import logging
 import os
+import threading
 import time
-from datetime import datetime, timedelta, UTC
-from dateutil.parser import parse
 
-import geojson
 import paho.mqtt.client as mqtt
-from atomicwrites import atomic_write
 
-from .point import Point
+from .connection import ConnectionSupervisor
+from .crossings import CrossingMonitor
+from .deltafeed import DeltaFeed
+from .eta import TravelTimes
+from .history import HistoryWriter
+from .ingest import IngestQueue
+from .metrics import Metrics, NullMetrics
+from .output import COMPACT, PRETTY, OutputFormat
+from .processor import PositionProcessor, decode_batch, train_name
+from .shards import ShardPool
+from .snapshot import fingerprint, read_snapshot, write_snapshot
 from .tracksmodel import TracksModel
+from .utils import format_timestamp
+from .writer import CoalescingWriter
+
+logger = logging.getLogger(__name__)
 
 
 class MqttTrainReporterClient:
-    FIRST_RECONNECT_DELAY = 1
-    RECONNECT_RATE = 2
-    MAX_RECONNECT_COUNT = 12
-    MAX_RECONNECT_DELAY = 60
+    # trains are removed after this many seconds without a position
+    MAX_AGE = 600
+    # topic the events of a level crossing are published to
+    CROSSING_TOPIC = 'c3toc/crossing/{crossing}'
 
     def __init__(self, hostname, username, password, topic, tracksmodel: TracksModel, trains_json: str,
-                 trains_geojson: str):
+                 trains_geojson: str, max_flush_rate: float = 1.0, flush_debounce: float = 0.0,
+                 ingest_workers: int = 0, ingest_queue_size: int = 1000, history: HistoryWriter | None = None,
+                 trains_delta: str | None = None, delta_window: float = 30.0,
+                 travel_times: TravelTimes | None = None, processes: int = 0, port: int = 1883,
+                 metrics: Metrics | None = None, output_format: OutputFormat = PRETTY,
+                 crossings: CrossingMonitor | None = None, crossings_json: str | None = None,
+                 snapshot: str | None = None, snapshot_interval: float = 10.0):
+        """
+        :param hostname: MQTT broker to connect to once started, see start(); if None, the client does not connect, and
+                         messages can be passed to on_message or handle_message directly
+        :param max_flush_rate: how many times per second trains.json and trains.geojson are written at most; 0 writes
+                               them after every message
+        :param flush_debounce: how many seconds to wait after a change before writing, to collect more changes
+        :param ingest_workers: number of threads processing messages; with 0, messages are processed on the MQTT
+                               network thread
+        :param ingest_queue_size: maximum number of messages waiting for the ingest workers
+        :param history: if set, all snapped positions are recorded there
+        :param trains_json: file to write the trains to, or None to only keep them in memory
+        :param trains_geojson: file to write the trains as GeoJSON to, or None
+        :param trains_delta: if set, write the trains that changed recently to this file, see DeltaFeed
+        :param delta_window: how many seconds of changes the delta feed covers
+        :param travel_times: historical travel times between stops, to estimate the arrival at stops further ahead
+        :param processes: number of processes snapping the positions, see ShardPool; ingest_workers is ignored then.
+                          With 0, they are processed in this process, on the MQTT network thread or the ingest
+                          workers
+        :param port: port of the MQTT broker
+        :param metrics: where to record counters and timings, see Metrics; by default, nothing is recorded
+        :param output_format: whether trains.json and trains.geojson are indented, and which compressed copies of
+                              them and of the delta feed are written, see OutputFormat. The delta feed is always
+                              compact.
+        :param crossings: if set, work out the events at the level crossings from every position, and publish them
+                          to CROSSING_TOPIC
+        :param crossings_json: if set, write the state of the level crossings and their latest events to this file
+        :param snapshot: if set, restore the trains from this file on start, if it exists, and save them there every
+                         snapshot_interval seconds (see cleanup()) and on stop(), see save_snapshot()
+        :param snapshot_interval: seconds between two snapshots
+        """
+        self.tracksmodel = tracksmodel
+        self.metrics = NullMetrics() if metrics is None else metrics
+        self._received = self.metrics.counter('messages_received_total', 'Messages received, per train', 'train')
+        self._processed = self.metrics.counter('messages_processed_total', 'Positions processed, per train', 'train')
+        self._failed = self.metrics.counter('messages_failed_total', 'Messages that could not be processed, per train',
+                                            'train')
+        self._write_seconds = self.metrics.histogram('output_write_seconds',
+                                                     'Time to render and write an output file, in seconds', 'file')
+        self._write_bytes = self.metrics.gauge('output_bytes', 'Size of the output file last written', 'file')
+        self._evictions = self.metrics.counter('cleanup_evictions_total',
+                                               'Trains removed because they stopped reporting')
+        self._disconnects = self.metrics.counter('mqtt_disconnects_total', 'Connections to the broker lost')
+        self._reconnects = self.metrics.counter('mqtt_reconnects_total', 'Connections to the broker reestablished')
+        self.metrics.gauge('queue_depth', 'Messages waiting to be processed', function=self.queue_depth)
+        self.metrics.gauge('trains', 'Trains currently shown', function=lambda: len(self.trains['trains']))
+        self.processor = PositionProcessor(tracksmodel, travel_times, self.metrics)
+        self.shards = None
+        if processes > 0:
+            # start the processes first, so they do not inherit the connection to the broker or any threads
+            self.shards = ShardPool(tracksmodel, processes, self.apply_positions, self.on_error, travel_times,
+                                    metrics=self.metrics)
+            self.shards.start()
         self.client = mqtt.Client()
         self.client.on_connect = self.on_connect
         self.client.on_disconnect = self.on_disconnect
         self.client.on_message = self.on_message
-        self.client.username_pw_set(username, password)
-        self.client.connect(hostname, 1883, 60)
-        self.client.subscribe(topic)
+        self.topic = topic
+        self.connection = None
+        if hostname is not None:
+            self.client.username_pw_set(username, password)
+            self.connection = ConnectionSupervisor(self.client, hostname, port)
+        # number of times the broker has accepted the connection
+        self.connections = 0
         self.trains = {
+            'seq': 0,
+            # True while the connection to the broker is down, and the trains may have moved on
+            'stale': hostname is not None,
             'trains': {}
         }
-        self.tracksmodel = tracksmodel
+        self.delta = DeltaFeed(delta_window)
+        self.trains_delta = trains_delta
+        # incremented whenever self.trains changes
+        self.revision = 0
+        # train name -> time of the last position, in seconds since the epoch
+        self.timestamps = {}
+        # messages received, positions recorded, and messages that could not be processed
+        self.received = 0
+        self.processed = 0
+        self.errors = 0
+        self.listeners = []
+        self.lock = threading.RLock()
+        self.writer = CoalescingWriter(self.write_outputs, max_flush_rate, flush_debounce, 'trains-writer')
+        self.writer.start()
+        self.history = history
+        self.ingest = None
+        if ingest_workers > 0 and self.shards is None:
+            self.ingest = IngestQueue(self.handle_message, ingest_queue_size, ingest_workers, 'ingest')
+            self.ingest.start()
         self.trains_json = trains_json
         self.trains_geojson = trains_geojson
-        self.waypoints = []
-        for trackmarker, point in sorted(tracksmodel.waypoints.items()):
-            if point.is_stop():
-                self.waypoints.append(point)
+        self.output_format = output_format
+        self.crossings = crossings
+        self.crossings_json = crossings_json
+        if crossings is not None:
+            self.add_listener(self.update_crossings)
+        self.snapshot = snapshot
+        self.snapshot_interval = snapshot_interval
+        self._snapshot_saved = time.monotonic()
+        if snapshot is not None:
+            self._fingerprint = fingerprint(tracksmodel)
+            self.restore_snapshot()
+
+    def start(self):
+        """
+        Connect to the broker in the background, and keep reconnecting whenever the connection is lost.
+        """
+        if self.connection is not None:
+            self.connection.start()
+
+    def stop(self):
+        """
+        Disconnect from the broker, and write any pending changes and the buffered history.
+        """
+        if self.connection is not None:
+            self.connection.stop()
+        if self.shards is not None:
+            self.shards.stop()
+        if self.ingest is not None:
+            self.ingest.stop()
+        self.writer.stop()
+        if self.history is not None:
+            self.history.close()
+        if self.snapshot is not None:
+            self.save_snapshot()
 
     def on_connect(self, client, userdata, flags, rc):
-        print("Connected with result code " + str(rc))
+        logger.info('Connected with result code %s', rc)
+        if rc != 0:
+            return
+        self.connection.connected()
+        # the broker may have forgotten the subscription with the previous connection
+        self.client.subscribe(self.topic)
+        if self.connections > 0:
+            self._reconnects.inc()
+        self.connections += 1
+        self.set_stale(False)
+
+    def on_disconnect(self, client, userdata, rc):
+        logger.info('Disconnected with result code %s', rc)
+        self._disconnects.inc()
+        self.set_stale(True)
+
+    def set_stale(self, stale: bool):
+        """
+        Mark the trains as possibly out of date, while no positions can be received, or as current again.
+        """
+        with self.lock:
+            if self.trains['stale'] == stale:
+                return
+            self.trains['stale'] = stale
+            self.revision += 1
+        self.writer.mark_dirty()
 
     def on_message(self, client, userdata, msg):
-        print(f'Message received for topic "{msg.topic}": "{msg.payload}"')
+        self.received += 1
+        name = train_name(msg.topic)
+        self._received.inc(name)
+        if self.shards is not None:
+            self.shards.put(name, msg.topic, msg.payload)
+        elif self.ingest is None:
+            self.handle_message(msg.topic, msg.payload)
+        elif not self.ingest.put(name, msg.topic, msg.payload, supersede=msg.topic.endswith('/pos')):
+            logger.warning('Ingest queue full, dropping message for topic "%s"', msg.topic)
+
+    def handle_message(self, topic: str, payload: bytes):
+        logger.debug('Message received for topic "%s": "%s"', topic, payload)
         try:
-            (_, _, name, kind) = msg.topic.split('/')
-            if kind == 'pos':
-                pos = json.loads(msg.payload.decode('utf-8'))
-                point = Point(pos['lat'], pos['lon'])
-                distance = 1e36
-                closest = None
-                second = None
-                trackname = None
-                for track in self.tracksmodel.tracks.values():
-                    for i in range(0, len(track.points)):
-                        d = Point.distance(point, track.points[i])
-                        if d < distance:
-                            distance = d
-                            closest = track.points[i]
-                            trackname = track.name
-                            dp = 1e36
-                            dn = 1e36
-                            if i > 0:
-                                dp = Point.distance(point, track.points[i - 1])
-                            if i < len(track.points) - 1:
-                                dn = Point.distance(point, track.points[i + 1])
-                            if dp < dn:
-                                second = track.points[i - 1]
-                            else:
-                                second = track.points[i + 1]
-                if second is None:
-                    pos['trackmarker'] = closest.trackmarker
-                else:
-                    ab = Point.distance(closest, second)
-                    bc = Point.distance(second, point)
-                    ca = Point.distance(point, closest)
-                    if bc == 0:
-                        pos['trackmarker'] = second.trackmarker
-                    elif ca == 0:
-                        pos['trackmarker'] = closest.trackmarker
-                    else:
-                        d = Point.nearest_distance(ab, bc, ca)
-                        if second.trackmarker > closest.trackmarker:
-                            pos['trackmarker'] = closest.trackmarker + d
-                        else:
-                            pos['trackmarker'] = closest.trackmarker - d
-                pos['trackmarker'] = int(pos['trackmarker'])
-                pos['trackname'] = trackname
-                if 'ts' in pos:
-                    pos['timestamp'] = pos['ts']
-                    del pos['ts']
-                else:
-                    pos['timestamp'] = datetime.now(tz=UTC).isoformat()
-                print(
-                    f"closest {closest.trackmarker:4.0f} - loco {pos['trackmarker']:4.0f} - second {second.trackmarker:4.0f}")
-
-                if name in self.trains['trains']:
-                    lastpos = self.trains['trains'][name]
-                    lastpoint = Point(lastpos['lat'], lastpos['lon'])
-                    if Point.distance(lastpoint, point) < 2:
-                        pos['dir'] = lastpos['dir']
-                    else:
-                        pos['dir'] = int(lastpoint.angle(point))
-                else:
-                    pos['dir'] = 0
-                next_stop = self.find_next_stop(pos)
-                eta = None
-                if pos['speed'] > 0:
-                    eta = (datetime.utcnow()
-                           + timedelta(
-                                seconds=int(abs(pos['trackmarker'] - next_stop.trackmarker) / (pos['speed'] / 3.6)))
-                           ).isoformat() + 'Z'
-                if next_stop is not None:
-                    pos['next_stop'] = {
-                        'ds100': next_stop.ds100,
-                        'eta': eta,
-                        'name': next_stop.name,
-                        'trackmarker': next_stop.trackmarker,
-                        'type': next_stop.type
-                    }
-                print(f'JSON {pos}')
-                self.trains['trains'][name] = pos
-                self.update_trains()
-                self.write_geojson()
-                self.log(pos)
+            decoded = decode_batch(topic, payload)
+            if decoded is not None:
+                self.process_positions(*decoded)
         except Exception as e:
-            print(f'Unable to process message: {e}')
+            self.on_error(topic, str(e))
+
+    def on_error(self, topic: str, message: str):
+        logger.error('Unable to process message for topic "%s": %s', topic, message)
+        self._failed.inc(train_name(topic))
+        with self.lock:
+            self.errors += 1
 
-    def find_next_stop(self, pos: dict) -> 'Waypoint':
+    def process_position(self, name: str, pos: dict):
         """
-        Given the trains current position on the track, find the next stop.
-        :return:
+        Snap a position reported by a train to the tracks, work out its direction and next stop, and record it.
         """
-        stop = None
-        # search for stops after current position
-        for waypoint in self.waypoints:
-            if waypoint.trackmarker > pos['trackmarker']:
-                stop = waypoint
-                break
-        if stop is None:
-            stop = self.waypoints[0]
-        return stop
+        self.apply_position(name, *self.processor.process(name, pos))
 
-    def update_trains(self):
-        with atomic_write(self.trains_json, overwrite=True, encoding='utf8') as f:
-            os.fchmod(f.fileno(), 0o664)
-            json.dump(self.trains, f, default=vars, ensure_ascii=False, sort_keys=True, indent=2)
+    def process_positions(self, name: str, positions: list):
+        """
+        Process several positions of a train, oldest first, as from one binary message, and record them in one go.
+        """
+        self.apply_positions(name, self.processor.process_batch(name, positions))
 
-    def write_geojson(self):
+    def apply_position(self, name: str, pos: dict, timestamp: float):
+        """
+        Record a processed position, and pass it on to the outputs.
+        :param timestamp: the time of the position, in seconds since the epoch
+        """
+        self.apply_positions(name, [(pos, timestamp)])
+
+    def apply_positions(self, name: str, results: list):
+        """
+        Record processed positions of a train, and pass them on to the outputs. Only the latest one is shown in the
+        outputs; listeners and the history get all of them.
+        :param results: tuples of the position and its time in seconds since the epoch, oldest first
+        """
+        if len(results) == 0:
+            return
+        (pos, timestamp) = results[-1]
+        logger.debug('JSON %s', pos)
+        with self.lock:
+            self.trains['trains'][name] = pos
+            self.timestamps[name] = timestamp
+            self.delta.changed(name)
+            self.revision += 1
+            self.processed += len(results)
+        self._processed.inc(name, len(results))
+        self.writer.mark_dirty()
+        for (pos, timestamp) in results:
+            for listener in self.listeners:
+                listener(name, pos)
+            self.log(name, pos, timestamp)
+
+    def stats(self) -> dict:
+        """
+        Return the counters of the messages, the writer and, if enabled, the ingest queue or the shards.
+        """
+        stats = {
+            'messages': {'received': self.received, 'processed': self.processed, 'errors': self.errors},
+            'writer': self.writer.stats()
+        }
+        if self.ingest is not None:
+            stats['ingest'] = self.ingest.stats()
+        if self.shards is not None:
+            stats['shards'] = self.shards.stats()
+        return stats
+
+    def queue_depth(self) -> int:
+        """
+        Return the number of messages received but not processed yet.
+        """
+        if self.shards is not None:
+            stats = self.shards.stats()
+            return stats['received'] - stats['processed']
+        if self.ingest is not None:
+            return self.ingest.depth
+        return 0
+
+    def write_outputs(self):
+        """
+        Write trains.json and trains.geojson. This is called by the writer, which merges changes from many messages
+        into a single call.
+        """
+        with self.lock:
+            self.delta.commit(self.trains['trains'])
+            self.trains['seq'] = self.delta.seq
+        self.update_trains()
+        self.write_geojson()
+        if self.trains_delta is not None:
+            self.write_delta()
+        if self.crossings_json is not None:
+            self.write_file(self.crossings_json, self.crossings_to_json)
+
+    def add_listener(self, listener):
+        """
+        Register a function that is called with the name of the train and the position for every position processed.
+        The function is called on the thread processing the message, and must not block.
+        """
+        self.listeners.append(listener)
+
+    def update_crossings(self, name: str, pos: dict):
+        """
+        Work out the events at the level crossings from a position, see CrossingMonitor, and publish them.
+        """
+        events = self.crossings.on_position(name, pos)
+        if len(events) > 0:
+            self.publish_crossing_events(events)
+            # the trains may have been written already, before the events
+            self.writer.mark_dirty()
+
+    def publish_crossing_events(self, events: list):
+        if self.connection is None:
+            return
+        for event in events:
+            # + and # are wildcards, and / separates levels of the topic
+            crossing = event['crossing'].translate(str.maketrans('/+#', '___'))
+            self.client.publish(self.CROSSING_TOPIC.format(crossing=crossing), COMPACT.dumps(event), qos=1)
+
+    def crossings_to_json(self) -> str:
+        return self.output_format.dumps(self.crossings.feed())
+
+    def delta_to_json(self, seq: int | None = None) -> str:
+        with self.lock:
+            delta = self.delta.since(seq)
+            delta['stale'] = self.trains['stale']
+            return COMPACT.dumps(delta)
+
+    def trains_to_json(self) -> str:
+        with self.lock:
+            return self.output_format.dumps(self.trains, default=vars)
+
+    def trains_to_geojson(self) -> str:
         features = []
-        for name, train in self.trains['trains'].items():
-            properties = train.copy()
-            properties.update({
-                'marker-symbol': 'rocket',  # no good loco in Maki set
-                'marker-color': '#cc0',
-                'name': name,
-            })
-            features.append(
-                geojson.Feature(geometry=geojson.Point((train['lon'], train['lat'])), properties=properties))
-        feature_collection = geojson.FeatureCollection(features)
-
-        with atomic_write(self.trains_geojson, overwrite=True, encoding='utf8') as f:
-            os.fchmod(f.fileno(), 0o664)
-            geojson.dump(feature_collection, f, ensure_ascii=False, sort_keys=True, indent=2)
+        with self.lock:
+            for name, train in self.trains['trains'].items():
+                properties = train.copy()
+                properties.update({
+                    'marker-symbol': 'rocket',  # no good loco in Maki set
+                    'marker-color': '#cc0',
+                    'name': name,
+                })
+                # the same as geojson.Feature, which takes longer to validate the feature than to serialize it
+                features.append({
+                    'geometry': {'coordinates': [round(train['lon'], 6), round(train['lat'], 6)], 'type': 'Point'},
+                    'properties': properties,
+                    'type': 'Feature',
+                })
+        return self.output_format.dumps({'features': features, 'type': 'FeatureCollection'})
 
-    def on_disconnect(self, client, userdata, rc):
-        logging.info("Disconnected with result code: %s", rc)
-        reconnect_count, reconnect_delay = 0, MqttTrainReporterClient.FIRST_RECONNECT_DELAY
-        while reconnect_count < MqttTrainReporterClient.MAX_RECONNECT_COUNT:
-            logging.info("Reconnecting in %d seconds...", reconnect_delay)
-            time.sleep(reconnect_delay)
+    def write_file(self, filename: str, render):
+        """
+        Atomically replace a file and its compressed copies with what render returns, and record how long that took
+        and the size of the file.
+        :param render: function without arguments returning the contents of the file as a string
+        """
+        t0 = time.perf_counter()
+        data = render().encode('utf-8')
+        self.output_format.write(filename, data)
+        label = os.path.basename(filename)
+        self._write_seconds.observe(time.perf_counter() - t0, label)
+        self._write_bytes.set(len(data), label)
 
-            try:
-                self.client.reconnect()
-                logging.info("Reconnected successfully!")
-                return
-            except Exception as err:
-                logging.error("%s. Reconnect failed. Retrying...", err)
+    def write_delta(self):
+        self.write_file(self.trains_delta, self.delta_to_json)
 
-            reconnect_delay *= MqttTrainReporterClient.RECONNECT_RATE
-            reconnect_delay = min(reconnect_delay, MqttTrainReporterClient.MAX_RECONNECT_DELAY)
-            reconnect_count += 1
-        logging.info("Reconnect failed after %s attempts. Exiting...", reconnect_count)
+    def update_trains(self):
+        if self.trains_json is None:
+            return
+        self.write_file(self.trains_json, self.trains_to_json)
 
-    def log(self, pos):
-        pass
-        # with open('mqtt.log', 'a') as f:
-        #     json.dump(pos, f, default=vars, ensure_ascii=False, sort_keys=True)
-        #     f.write('\n')
+    def write_geojson(self):
+        if self.trains_geojson is None:
+            return
+        self.write_file(self.trains_geojson, self.trains_to_geojson)
+
+    def save_snapshot(self) -> bool:
+        """
+        Save the trains, the time of their last position, and what is known about their motion and the level crossings
+        near them, to the snapshot file. With processes, the motion of the trains is kept in the processes, and is not
+        saved.
+        :return: True if the file has been written, False if nothing has changed since the last snapshot
+        """
+        self._snapshot_saved = time.monotonic()
+        with self.lock:
+            state = {
+                'tracks': self._fingerprint,
+                'trains': dict(self.trains['trains']),
+                'timestamps': dict(self.timestamps),
+            }
+        if self.shards is None:
+            state['tracking'] = dict(self.processor.tracking)
+        if self.crossings is not None:
+            state['crossings'] = self.crossings.snapshot()
+        return write_snapshot(self.snapshot, state)
+
+    def restore_snapshot(self) -> int:
+        """
+        Restore the trains from the snapshot file. Restored trains are marked as 'stale' until they report again, and
+        removed by cleanup() like any other train that no longer reports. Trains that would be removed right away are
+        not restored, and the motion of the trains is only restored if the tracks have not changed.
+        :return: the number of trains restored
+        """
+        t0 = time.perf_counter()
+        state = read_snapshot(self.snapshot)
+        if state is None:
+            return 0
+        same_tracks = state['tracks'] == self._fingerprint
+        tracking = state.get('tracking', {}) if same_tracks and self.shards is None else {}
+        oldest = time.time() - self.MAX_AGE
+        restored = 0
+        with self.lock:
+            for name, pos in state['trains'].items():
+                timestamp = state['timestamps'].get(name, 0)
+                if timestamp < oldest or name in self.trains['trains']:
+                    continue
+                self.trains['trains'][name] = dict(pos, stale=True)
+                self.timestamps[name] = timestamp
+                self.delta.changed(name)
+                if name in tracking:
+                    self.processor.tracking[name] = tracking[name]
+                restored += 1
+            if restored > 0:
+                self.revision += 1
+        if self.crossings is not None and same_tracks and 'crossings' in state:
+            crossings = state['crossings']
+            crossings['states'] = {name: current for name, current in crossings['states'].items()
+                                   if name in self.timestamps}
+            self.crossings.restore(crossings)
+        logger.info('Restored %d trains from %s in %.3f seconds', restored, self.snapshot, time.perf_counter() - t0)
+        if restored > 0:
+            self.writer.mark_dirty()
+        return restored
+
+    def log(self, name: str, pos: dict, timestamp: float):
+        """
+        Record the position in the history, if one has been configured.
+        """
+        if self.history is None:
+            return
+        self.history.append(name, timestamp, pos['lat'], pos['lon'], pos['trackmarker'], pos.get('speed', 0))
 
     def cleanup(self):
         """
@@ -196,12 +452,33 @@ class MqttTrainReporterClient:
         :return:
         """
         mod = False
-        for name in list(self.trains['trains'].keys()):
-            train = self.trains['trains'][name]
-            timestamp = parse(train['timestamp'])
-            if datetime.now(tz=UTC) - timestamp > timedelta(minutes=10):
-                print(f'Dropping train {name} due to no more GPS fixes {timestamp}')
-                del self.trains['trains'][name]
-                mod = True
+        oldest = time.time() - self.MAX_AGE
+        forgotten = []
+        with self.lock:
+            for name, timestamp in list(self.timestamps.items()):
+                if timestamp < oldest:
+                    logger.info('Dropping train %s due to no more GPS fixes %s', name,
+                                self.trains['trains'][name]['timestamp'])
+                    del self.trains['trains'][name]
+                    del self.timestamps[name]
+                    self._evictions.inc()
+                    if self.shards is not None:
+                        self.shards.forget(name)
+                    else:
+                        self.processor.forget(name)
+                    self.delta.removed(name)
+                    self.revision += 1
+                    forgotten.append(name)
+                    mod = True
+        if self.crossings is not None:
+            for name in forgotten:
+                self.publish_crossing_events(self.crossings.forget(name, format_timestamp(time.time())))
         if mod:
-            self.update_trains()
+            self.writer.mark_dirty()
+        if self.history is not None:
+            self.history.flush_if_due()
+        if self.snapshot is not None and time.monotonic() - self._snapshot_saved >= self.snapshot_interval:
+            try:
+                self.save_snapshot()
+            except OSError as e:
+                logger.error('Unable to save snapshot %s: %s', self.snapshot, e)
@@ -0,0 +1,139 @@
+import gzip
+import hashlib
+import json
+import os
+
+from atomicwrites import atomic_write
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def file_hash(filename: str) -> str | None:
+    """
+    Return the SHA-256 of the contents of a file, or None if it does not exist.
+    """
+    try:
+        with open(filename, 'rb') as f:
+            return hashlib.file_digest(f, 'sha256').hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def write_if_changed(filename: str, data: str | bytes) -> bool:
+    """
+    Atomically replace a file with new contents, but only if the contents differ from what is already there. This
+    keeps the modification time, and with it the caches of web servers and browsers, when nothing has changed.
+    :param filename: the file to write
+    :param data: the new contents; strings are written as UTF-8
+    :return: True if the file has been written
+    """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    if hashlib.sha256(data).hexdigest() == file_hash(filename):
+        return False
+    _replace(filename, data)
+    return True
+
+
+def _replace(filename: str, data: bytes):
+    with atomic_write(filename, mode='wb', overwrite=True) as f:
+        os.fchmod(f.fileno(), 0o664)
+        f.write(data)
+
+
+def _gzip(data: bytes) -> bytes:
+    # without a timestamp, so the copy only changes when the contents do
+    return gzip.compress(data, compresslevel=OutputFormat.GZIP_LEVEL, mtime=0)
+
+
+def _brotli(data: bytes) -> bytes:
+    return brotli.compress(data, quality=OutputFormat.BROTLI_QUALITY)
+
+
+# suffix of the compressed copies -> function to compress with, or None if the package is not installed
+COMPRESSORS = {'.gz': _gzip, '.br': None if brotli is None else _brotli}
+
+
+class OutputFormat:
+    """
+    How the JSON files are written: indented for reading them, or compact, and with copies compressed with gzip
+    (filename.gz) or Brotli (filename.br) next to them, for web servers that send those to browsers that accept them
+    instead of compressing the file on every request, like nginx with gzip_static and brotli_static.
+
+    Each file is replaced atomically, the compressed copies before the file itself. Copies in formats that are not
+    enabled are removed, so they cannot be served with outdated contents.
+
+    JSON is serialized with orjson if it is installed, which is several times faster than json, and with json for data
+    that orjson cannot serialize, like dicts with keys that are not strings. Both give the same result.
+    """
+
+    GZIP_LEVEL = 6
+    BROTLI_QUALITY = 5
+
+    def __init__(self, pretty: bool = True, gzip: bool = False, brotli: bool = False):
+        """
+        :param pretty: indent the JSON; otherwise, it is written without any whitespace
+        :param gzip: also write a copy compressed with gzip
+        :param brotli: also write a copy compressed with Brotli; this needs the brotli package
+        """
+        if brotli and COMPRESSORS['.br'] is None:
+            raise ValueError('Brotli compression needs the brotli package')
+        self.pretty = pretty
+        self.gzip = gzip
+        self.brotli = brotli
+        self._orjson_options = 0
+        if orjson is not None:
+            self._orjson_options = orjson.OPT_SORT_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+        # suffix -> function to compress the data with, or None if the copy is not written
+        self.compressors = {'.gz': COMPRESSORS['.gz'] if gzip else None, '.br': COMPRESSORS['.br'] if brotli else None}
+
+    def dumps(self, data, default=None) -> str:
+        """
+        Serialize data as JSON, with sorted keys, and without escaping characters that are not ASCII.
+        :param default: function returning a serializable version of objects that cannot be serialized otherwise
+        """
+        if orjson is not None:
+            try:
+                return orjson.dumps(data, default=default, option=self._orjson_options).decode('utf-8')
+            except TypeError:
+                pass
+        if self.pretty:
+            return json.dumps(data, default=default, ensure_ascii=False, sort_keys=True, indent=2)
+        return json.dumps(data, default=default, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+
+    def write(self, filename: str, data: str | bytes, only_if_changed: bool = False) -> bool:
+        """
+        Atomically replace a file and its compressed copies.
+        :param data: the new contents; strings are written as UTF-8
+        :param only_if_changed: leave the files alone if the file already has these contents, and exactly the copies
+                                that are enabled exist, see write_if_changed()
+        :return: True if the files have been written
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if only_if_changed and hashlib.sha256(data).hexdigest() == file_hash(filename) and \
+                all(os.path.exists(filename + suffix) == (compress is not None)
+                    for suffix, compress in self.compressors.items()):
+            return False
+        for suffix, compress in self.compressors.items():
+            if compress is not None:
+                _replace(filename + suffix, compress(data))
+            else:
+                try:
+                    os.unlink(filename + suffix)
+                except FileNotFoundError:
+                    pass
+        _replace(filename, data)
+        return True
+
+
+# the JSON files as they have always been written, and minified with a gzip copy, for the variants of the tracks
+PRETTY = OutputFormat()
+COMPACT = OutputFormat(pretty=False, gzip=True)
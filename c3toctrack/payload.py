@@ -0,0 +1,78 @@
+"""
+The compact binary payload trackers can publish instead of one JSON message per fix, to c3toc/train/<name>/fixes.
+
+A message carries several fixes of one tracker, so a tracker can take a fix every few seconds and still send one
+message every ten. All numbers are little-endian. The header is
+
+    version     uint8   VERSION
+    count       uint8   number of fixes that follow
+    time        uint32  time of the first fix, in seconds since the epoch
+    Vbat        uint16  battery voltage, in mV
+    Vbus        uint16  USB voltage, in mV
+    rssi        int8    Wi-Fi signal strength, in dBm
+    bssid       6 bytes the access point
+
+followed by count fixes of
+
+    dt          uint16  seconds after the time in the header
+    lat         int32   latitude, in 1e-7 degrees
+    lon         int32   longitude, in 1e-7 degrees
+    sat         uint8   number of satellites
+    speed       uint16  speed over ground, in 0.1 km/h
+
+That is 30 bytes for one fix, and 13 bytes for every further fix, compared to about 150 bytes for a JSON message.
+"""
+import struct
+
+VERSION = 1
+HEADER = struct.Struct('<BBIHHb6s')
+FIX = struct.Struct('<HiiBH')
+
+
+def encode(fixes: list, vbat: float = 0.0, vbus: float = 0.0, rssi: int = 0,
+           bssid: str = '00:00:00:00:00:00') -> bytes:
+    """
+    Encode fixes as a tracker does.
+    :param fixes: tuples of time in seconds since the epoch, latitude, longitude, number of satellites and speed in km/h,
+                  oldest first
+    :param vbat: battery voltage, in V
+    :param vbus: USB voltage, in V
+    :param rssi: Wi-Fi signal strength, in dBm
+    :param bssid: the access point, as six hex bytes separated by colons
+    """
+    if not 0 < len(fixes) < 256:
+        raise ValueError(f'Between 1 and 255 fixes can be sent in one message, not {len(fixes)}')
+    start = int(fixes[0][0])
+    data = bytearray(HEADER.pack(VERSION, len(fixes), start, round(vbat * 1000), round(vbus * 1000), rssi,
+                                 bytes.fromhex(bssid.replace(':', ''))))
+    for (t, lat, lon, sat, speed) in fixes:
+        data += FIX.pack(int(t) - start, round(lat * 1e7), round(lon * 1e7), sat, round(speed * 10))
+    return bytes(data)
+
+
+def decode(payload: bytes) -> list:
+    """
+    Decode a binary message into positions, as they would have been sent as JSON, oldest first, except for the time
+    of each fix: instead of formatting it as 'ts', only for the processor to parse it again, it is kept as 'time', in
+    seconds since the epoch, see processor.position_times().
+    :raise ValueError: if the payload is of an unknown version, or too short or too long for the number of fixes
+    """
+    if len(payload) < HEADER.size:
+        raise ValueError(f'Payload of {len(payload)} bytes is too short')
+    (version, count, start, vbat, vbus, rssi, bssid) = HEADER.unpack_from(payload)
+    if version != VERSION:
+        raise ValueError(f'Unknown payload version {version}')
+    if len(payload) != HEADER.size + count * FIX.size:
+        raise ValueError(f'Payload of {len(payload)} bytes does not match {count} fixes')
+    common = {
+        'Vbat': vbat / 1000,
+        'Vbus': vbus / 1000,
+        'rssi': rssi,
+        'bssid': bssid.hex(':').upper(),
+    }
+    positions = []
+    for (dt, lat, lon, sat, speed) in FIX.iter_unpack(memoryview(payload)[HEADER.size:]):
+        pos = {'lat': lat / 1e7, 'lon': lon / 1e7, 'sat': sat, 'speed': speed / 10, 'time': start + dt}
+        pos.update(common)
+        positions.append(pos)
+    return positions
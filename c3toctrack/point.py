@@ -6,16 +6,28 @@ class Point:
     A point along a track. Not to be confused with a turnout or switch.
     """
 
+    __slots__ = ('lat', 'lon', 'step', 'trackmarker', 'waypoint')
+
     degree_per_meter_lon = 1.4910240353067286e-05
     degree_per_meter_lat = 8.989572096375368e-06
 
     def __init__(self, lat: float, lon: float):
         self.lat = lat
         self.lon = lon
-        self.distance = 0
+        # distance from the previous point along the track; called distance in tracks.json
+        self.step = 0
         self.trackmarker = 0
         self.waypoint = None
 
+    def to_dict(self) -> dict:
+        return {
+            'distance': self.step,
+            'lat': self.lat,
+            'lon': self.lon,
+            'trackmarker': self.trackmarker,
+            'waypoint': None if self.waypoint is None else self.waypoint.to_dict(),
+        }
+
     def angle(self, b: "Point") -> float:
         """
         Compute the angle from self to point b
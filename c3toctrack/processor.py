@@ -0,0 +1,184 @@
+import json
+import logging
+import time
+from datetime import datetime, UTC
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from .eta import EtaEngine, TravelTimes
+from .metrics import Metrics, NullMetrics
+from .motion import TrainState
+from .payload import decode as decode_fixes
+from .tracksmodel import TracksModel
+from .utils import format_timestamp
+
+logger = logging.getLogger(__name__)
+# orjson decodes positions about twice as fast as json, if it is installed
+loads = json.loads if orjson is None else orjson.loads
+
+
+def train_name(topic: str) -> str:
+    """
+    Return the name of the train a message is from, or the topic if it is not from a train.
+    """
+    parts = topic.split('/')
+    return parts[2] if len(parts) == 4 else topic
+
+
+def decode(topic: str, payload: bytes) -> tuple | None:
+    """
+    Decode an MQTT message from a tracker.
+    :return: a tuple of the train name and the position, or None if the message is not a position
+    """
+    (_, _, name, kind) = topic.split('/')
+    if kind != 'pos':
+        return None
+    return name, loads(payload)
+
+
+def decode_batch(topic: str, payload: bytes) -> tuple | None:
+    """
+    Decode an MQTT message from a tracker, either a JSON position on c3toc/train/<name>/pos, or several fixes in the
+    binary payload on c3toc/train/<name>/fixes, see payload.py.
+    :return: a tuple of the train name and a list of its positions, oldest first, or None if the message is not a
+             position
+    """
+    (_, _, name, kind) = topic.split('/')
+    if kind == 'pos':
+        return name, [loads(payload)]
+    if kind == 'fixes':
+        return name, decode_fixes(payload)
+    return None
+
+
+# formatting a time takes longer than the rest of decoding a binary fix, so the start of the minute of the latest
+# one is kept, as the time in seconds since the epoch and formatted up to the seconds, and only the seconds are added
+_minute = (0, '1970-01-01T00:00:')
+
+
+def position_times(positions: list) -> list:
+    """
+    Take the times off positions as reported by the trackers: 'time' in seconds since the epoch, as decoded from the
+    binary payload, or 'ts' as sent in JSON, see _parse_ts().
+    :return: a list of tuples of the time as written to trains.json, and in seconds since the epoch, for each position
+    """
+    global _minute
+    times = []
+    (minute, prefix) = _minute
+    for pos in positions:
+        t = pos.pop('time', None)
+        if t is not None:
+            second = int(t) - minute
+            if not 0 <= second < 60:
+                minute = int(t) // 60 * 60
+                prefix = format_timestamp(t)[:-3]
+                _minute = (minute, prefix)
+                second = int(t) - minute
+            times.append((f'{prefix}{second:02d}Z', t))
+        else:
+            times.append(_parse_ts(pos.pop('ts', None)))
+    return times
+
+
+def _parse_ts(ts: str | None) -> tuple:
+    """
+    Parse the time a tracker sent; a time without an offset is in UTC. If there is none, or it cannot be parsed, the
+    time it is processed is used instead.
+    :return: a tuple of the time as written to trains.json, and in seconds since the epoch
+    """
+    if ts is not None:
+        try:
+            parsed = datetime.fromisoformat(ts)
+            if parsed.tzinfo is None:
+                parsed = parsed.replace(tzinfo=UTC)
+            return ts, parsed.timestamp()
+        except (TypeError, ValueError) as e:
+            logger.debug('unable to parse ts %r: %s', ts, e)
+    now = datetime.now(tz=UTC)
+    return now.isoformat(), now.timestamp()
+
+
+class PositionProcessor:
+    """
+    Turns the positions reported by the trains into what is published about them: snaps them to the tracks, keeps
+    track of the motion of each train, and estimates when it arrives at the stops ahead.
+
+    A processor only needs the track model and its own state, so the trains can be split between several processors,
+    see ShardPool.
+    """
+
+    def __init__(self, tracksmodel: TracksModel, travel_times: TravelTimes | None = None,
+                 metrics: Metrics | None = None):
+        """
+        :param travel_times: historical travel times between stops, to estimate the arrival at stops further ahead
+        :param metrics: where to record the time it takes to snap positions
+        """
+        self.tracksmodel = tracksmodel
+        metrics = NullMetrics() if metrics is None else metrics
+        self._snap_seconds = metrics.histogram('snap_seconds', 'Time to snap a position to the tracks, in seconds')
+        self.eta = EtaEngine(tracksmodel, travel_times)
+        # train name -> TrainState, what is known about each train from its previous positions
+        self.tracking = {}
+
+    def process(self, name: str, pos: dict) -> tuple:
+        """
+        Snap a position reported by a train to the tracks, and work out its direction, speed, and the stops ahead.
+        :param pos: the position as reported by the train; it is updated in place
+        :return: a tuple of pos and the time of the position in seconds since the epoch
+        """
+        ((formatted, timestamp),) = position_times([pos])
+        return self._process(name, pos, formatted, timestamp)
+
+    def process_batch(self, name: str, positions: list) -> list:
+        """
+        Process several positions of the same train, oldest first, see process(). The times of all positions are
+        taken off them at once, see position_times().
+        :return: a list of tuples of pos and the time of the position in seconds since the epoch
+        """
+        return [self._process(name, pos, formatted, timestamp)
+                for pos, (formatted, timestamp) in zip(positions, position_times(positions))]
+
+    def _process(self, name: str, pos: dict, formatted: str, timestamp: float) -> tuple:
+        """
+        :param formatted: the time of the position as written to trains.json
+        :param timestamp: the time of the position in seconds since the epoch
+        """
+        state = self.tracking.get(name)
+        t0 = time.perf_counter()
+        snap = self.tracksmodel.snap(pos['lat'], pos['lon'], None if state is None else state.snap)
+        self._snap_seconds.observe(time.perf_counter() - t0)
+        pos['trackmarker'] = int(snap.trackmarker)
+        pos['trackname'] = snap.trackname
+        pos['timestamp'] = formatted
+        logger.debug('snapped to %s - loco %4.0f - distance %4.1f', snap.trackname, pos['trackmarker'],
+                     snap.distance)
+
+        pos['gps_speed'] = pos.get('speed', 0)
+        if state is None:
+            state = TrainState(self.tracksmodel, snap, timestamp, pos['gps_speed'])
+            self.tracking[name] = state
+        else:
+            state.update(self.tracksmodel, snap, timestamp)
+        pos['speed'] = round(state.kmh, 1)
+        pos['dir'] = state.heading
+        self.eta.travel_times.record(name, timestamp, pos['lat'], pos['lon'], state.speed)
+        self.update_next_stop(pos, state)
+        return pos, timestamp
+
+    def update_next_stop(self, pos: dict, state: TrainState):
+        """
+        Add the stops ahead of the train and the estimated times of arrival there to the position.
+        """
+        upcoming = self.eta.upcoming(state)
+        if len(upcoming) > 0:
+            pos['next_stop'] = upcoming[0]
+            pos['upcoming'] = upcoming
+
+    def forget(self, name: str):
+        """
+        Drop what is known about a train, once it has been removed.
+        """
+        self.tracking.pop(name, None)
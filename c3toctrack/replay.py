@@ -0,0 +1,272 @@
+import contextlib
+import json
+import os
+import random
+import threading
+import time
+from bisect import bisect_right
+
+import paho.mqtt.client as mqtt
+
+from .history import HistoryReader
+from .point import Point
+from .track import Track
+from .tracksmodel import TracksModel
+from .utils import format_timestamp
+
+
+class FakeMessage:
+    """
+    Stands in for paho's MQTTMessage, with just the attributes MqttTrainReporterClient uses.
+    """
+
+    def __init__(self, topic: str, payload: bytes):
+        self.topic = topic
+        self.payload = payload
+
+
+def position_on(track: Track, trackmarker: float) -> tuple:
+    """
+    Return latitude and longitude of the point at trackmarker along the track.
+    """
+    markers = track.trackmarkers
+    i = min(max(bisect_right(markers, trackmarker), 1), len(track) - 1)
+    f = 0
+    if markers[i] > markers[i - 1]:
+        f = min(max((trackmarker - markers[i - 1]) / (markers[i] - markers[i - 1]), 0), 1)
+    return (track.lats[i - 1] + f * (track.lats[i] - track.lats[i - 1]),
+            track.lons[i - 1] + f * (track.lons[i] - track.lons[i - 1]))
+
+
+def synthetic_stream(tracksmodel: TracksModel, trains: int = 10, duration: float = 600, interval: float = 1.0,
+                     speed: float = 10.0, noise: float = 3.0, start: float | None = None, seed: int = 23):
+    """
+    Generate position messages for trains going back and forth on random tracks.
+    :param trains: number of trains
+    :param duration: simulated time, in seconds
+    :param interval: seconds between two reports of the same train
+    :param speed: speed of the trains, in km/h
+    :param noise: maximum GPS error, in meters
+    :param start: time of the first message, in seconds since the epoch; defaults to now
+    :param seed: seed for the random number generator, so runs are repeatable
+    :return: a generator of tuples of time, topic and payload
+    """
+    rnd = random.Random(seed)
+    tracks = [track for track in tracksmodel.tracks.values() if len(track) > 1]
+    state = []
+    for i in range(0, trains):
+        track = rnd.choice(tracks)
+        first = track.trackmarkers[0]
+        last = track.trackmarkers[-1]
+        state.append([f'train{i}', track, rnd.uniform(first, last), rnd.choice((-1, 1))])
+    if start is None:
+        start = time.time()
+    step = speed / 3.6 * interval
+    for n in range(0, int(duration / interval)):
+        t = start + n * interval
+        for train in state:
+            (name, track, trackmarker, direction) = train
+            first = track.trackmarkers[0]
+            last = track.trackmarkers[-1]
+            trackmarker += direction * step
+            if trackmarker > last or trackmarker < first:
+                direction = -direction
+                trackmarker = min(max(trackmarker, first), last)
+            train[2] = trackmarker
+            train[3] = direction
+            lat, lon = position_on(track, trackmarker)
+            payload = {
+                'lat': lat + rnd.uniform(-noise, noise) * Point.degree_per_meter_lat,
+                'lon': lon + rnd.uniform(-noise, noise) * Point.degree_per_meter_lon,
+                'sat': 9,
+                'speed': speed,
+                'ts': format_timestamp(t),
+            }
+            yield t, f'c3toc/train/{name}/pos', json.dumps(payload).encode('utf-8')
+
+
+def history_stream(directory: str, train: str | None = None, start: float | None = None, end: float | None = None):
+    """
+    Generate position messages from a position history recorded with HistoryWriter, ordered by time.
+    :return: a generator of tuples of time, topic and payload
+    """
+    records = HistoryReader(directory).read(train, start, end)
+    records = records[records['timestamp'].argsort(kind='stable')]
+    for record in records:
+        t = float(record['timestamp'])
+        payload = {
+            'lat': float(record['lat']),
+            'lon': float(record['lon']),
+            'speed': float(record['speed']),
+            'ts': format_timestamp(t),
+        }
+        yield t, f'c3toc/train/{record["train"].decode("utf-8")}/pos', json.dumps(payload).encode('utf-8')
+
+
+def mosquitto_stream(filename: str):
+    """
+    Generate messages from a log written by `mosquitto_sub -v`, which has one message per line: the topic, a space,
+    and the payload. The log has no times, so the messages are replayed as fast as possible.
+    :return: a generator of tuples of time (always None), topic and payload
+    """
+    with open(filename, 'rb') as f:
+        for line in f:
+            line = line.rstrip(b'\r\n')
+            if b' ' not in line:
+                continue
+            (topic, payload) = line.split(b' ', 1)
+            yield None, topic.decode('utf-8'), payload
+
+
+class StageTimer:
+    """
+    Accumulates the time spent in functions wrapped with wrap().
+    """
+
+    def __init__(self):
+        self.seconds = {}
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            self.seconds[stage] = self.seconds.get(stage, 0) + seconds
+            self.calls[stage] = self.calls.get(stage, 0) + 1
+
+    def wrap(self, stage: str, function):
+        def timed(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - t0)
+
+        return timed
+
+
+def percentile(values: list, q: float) -> float:
+    if len(values) == 0:
+        return 0
+    return values[min(int(q * len(values)), len(values) - 1)]
+
+
+class Replay:
+    """
+    Feeds messages to an MqttTrainReporterClient without a broker, and measures how fast they are processed.
+
+    The client should be created with hostname None. Snapping, next stop and ETA computation, and writing the trains
+    files are timed separately by temporarily wrapping the methods doing that work. If the client processes the
+    messages in several processes, snapping and ETAs are not timed, as they are done in the other processes.
+    """
+
+    STAGES = (
+        ('snap', 'tracksmodel', 'snap'),
+        ('eta', 'processor', 'update_next_stop'),
+        ('serialize', None, 'update_trains'),
+        ('serialize', None, 'write_geojson'),
+        ('serialize', None, 'write_delta'),
+    )
+
+    def __init__(self, client):
+        self.client = client
+
+    def run(self, messages, speedup: float | None = None, quiet: bool = True) -> dict:
+        """
+        Process the messages and return a report.
+        :param messages: an iterable of tuples of time, topic and payload, as returned by the stream functions
+        :param speedup: replay at this multiple of the time between the messages; if None, as fast as possible
+        :param quiet: suppress the output of the client while replaying
+        :return: a dict with the number of messages, elapsed seconds, messages per second, per-message latency
+                 percentiles in milliseconds, seconds spent per stage, and the client statistics
+        """
+        timer = StageTimer()
+        wrapped = []
+        for stage, owner, method in self.STAGES:
+            target = self.client if owner is None else getattr(self.client, owner)
+            setattr(target, method, timer.wrap(stage, getattr(target, method)))
+            wrapped.append((target, method))
+        latencies = []
+        output = open(os.devnull, 'w') if quiet else None
+        try:
+            with contextlib.redirect_stdout(output) if quiet else contextlib.nullcontext():
+                started = time.perf_counter()
+                first = None
+                for (t, topic, payload) in messages:
+                    if speedup is not None and t is not None:
+                        if first is None:
+                            first = t
+                        delay = started + (t - first) / speedup - time.perf_counter()
+                        if delay > 0:
+                            time.sleep(delay)
+                    t0 = time.perf_counter()
+                    self.deliver(topic, payload)
+                    latencies.append(time.perf_counter() - t0)
+                self.wait(len(latencies))
+                elapsed = time.perf_counter() - started
+        finally:
+            for (target, method) in wrapped:
+                delattr(target, method)
+            if output is not None:
+                output.close()
+        latencies.sort()
+        return {
+            'messages': len(latencies),
+            'seconds': elapsed,
+            'rate': len(latencies) / elapsed if elapsed > 0 else 0,
+            'latency': {
+                'p50': percentile(latencies, 0.50) * 1000,
+                'p99': percentile(latencies, 0.99) * 1000,
+                'max': percentile(latencies, 1.0) * 1000,
+            },
+            'stages': {stage: {'calls': timer.calls.get(stage, 0), 'seconds': timer.seconds.get(stage, 0)}
+                       for stage, owner, method in self.STAGES},
+            'client': self.client.stats(),
+        }
+
+    def deliver(self, topic: str, payload: bytes):
+        """
+        Pass a message to the client.
+        """
+        self.client.on_message(None, None, FakeMessage(topic, payload))
+
+    def wait(self, sent: int):
+        """
+        Wait until the client has processed everything, then stop its writer, which writes any pending changes.
+        :param sent: the number of messages delivered
+        """
+        while self.client.received < sent:
+            time.sleep(0.001)
+        ingest = self.client.ingest
+        if ingest is not None:
+            while True:
+                stats = ingest.stats()
+                if stats['processed'] + stats['superseded'] + stats['dropped'] >= stats['received']:
+                    break
+                time.sleep(0.001)
+        if self.client.shards is not None:
+            self.client.shards.stop()
+        self.client.writer.stop()
+
+
+class BrokerReplay(Replay):
+    """
+    Like Replay, but publishes the messages to an MQTT broker the client is subscribed to, to include receiving them in
+    the measurement, see LocalBroker. The latencies are the time it takes to publish a message.
+    """
+
+    def __init__(self, client, hostname: str, port: int = 1883):
+        super().__init__(client)
+        self.publisher = mqtt.Client()
+        self.publisher.connect(hostname, port, 60)
+        self.publisher.loop_start()
+        self._last = None
+
+    def deliver(self, topic: str, payload: bytes):
+        self._last = self.publisher.publish(topic, payload)
+
+    def wait(self, sent: int):
+        if self._last is not None:
+            self._last.wait_for_publish()
+        self.publisher.disconnect()
+        self.publisher.loop_stop()
+        super().wait(sent)
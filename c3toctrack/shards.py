@@ -0,0 +1,203 @@
+import logging
+import multiprocessing
+import threading
+import zlib
+
+from .eta import TravelTimes
+from .metrics import Metrics, NullMetrics
+from .processor import PositionProcessor, decode_batch
+from .tracksmodel import TracksModel
+
+
+def _work(inbox, outbox, tracksmodel: TracksModel, travel_times: TravelTimes | None, metrics: bool):
+    """
+    Main loop of a shard process: process batches of messages from inbox, and send the results to outbox as batches
+    of ('batch', name, [(pos, timestamp), ...]) and ('error', topic, message). If metrics is set, each batch ends with
+    ('metrics', None, counts), the metrics recorded while processing it.
+    """
+    recorded = Metrics() if metrics else NullMetrics()
+    processor = PositionProcessor(tracksmodel, travel_times, recorded)
+    while True:
+        batch = inbox.get()
+        if batch is None:
+            break
+        results = []
+        for item in batch:
+            if item[0] == 'forget':
+                processor.forget(item[1])
+                continue
+            (_, topic, payload) = item
+            try:
+                decoded = decode_batch(topic, payload)
+                if decoded is not None:
+                    results.append(('batch', decoded[0], processor.process_batch(*decoded)))
+                else:
+                    results.append(('ignored', topic, None))
+            except Exception as e:
+                results.append(('error', topic, str(e)))
+        if metrics:
+            results.append(('metrics', None, recorded.take()))
+        if len(results) > 0:
+            outbox.put(results)
+    outbox.put(None)
+
+
+class ShardPool:
+    """
+    Processes messages in several processes, to use more than one core.
+
+    Each process owns the trains whose names hash to it, with their own PositionProcessor, so positions of the same
+    train are always processed in order by the same process. The track model is only read, and passed to the processes
+    when they start; where processes are forked, it is shared with the parent without being copied.
+
+    Messages are sent to the processes in batches, to keep the overhead of passing them between processes low. A batch
+    is sent once it is full, or after max_delay seconds. The results are passed to on_result in the parent process, on
+    a single thread, so all outputs can be written there, one message at a time with all of its positions.
+
+    The travel times the processes learn from the positions stay in each process: each one learns from its own trains.
+    """
+
+    def __init__(self, tracksmodel: TracksModel, processes: int, on_result, on_error=None,
+                 travel_times: TravelTimes | None = None, batch_size: int = 64, max_delay: float = 0.005,
+                 name: str = 'shard', metrics: Metrics | None = None):
+        """
+        :param processes: number of processes
+        :param on_result: function called with the train name and a list of tuples of the processed position and its
+                          time in seconds since the epoch, oldest first, for every message, as
+                          MqttTrainReporterClient.apply_positions()
+        :param on_error: function called with the topic and the error message of messages that could not be processed
+        :param travel_times: historical travel times between stops, see EtaEngine; it is copied to every process
+        :param batch_size: maximum number of messages sent to a process at once
+        :param max_delay: maximum time in seconds a message waits for its batch to fill up
+        :param metrics: where to add the metrics recorded by the processes
+        """
+        self.tracksmodel = tracksmodel
+        self.on_result = on_result
+        self.on_error = on_error
+        self.travel_times = travel_times
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.name = name
+        self.metrics = NullMetrics() if metrics is None else metrics
+        methods = multiprocessing.get_all_start_methods()
+        self._context = multiprocessing.get_context('fork' if 'fork' in methods else 'spawn')
+        self._inboxes = [self._context.Queue() for i in range(0, processes)]
+        self._outbox = self._context.Queue()
+        self._pending = [[] for i in range(0, processes)]
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._processes = []
+        self._threads = []
+        self._running = False
+        self.received = 0
+        self.processed = 0
+        self.errors = 0
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        for i, inbox in enumerate(self._inboxes):
+            process = self._context.Process(target=_work, name=f'{self.name}-{i}', daemon=True,
+                                            args=(inbox, self._outbox, self.tracksmodel, self.travel_times,
+                                                  self.metrics.enabled))
+            process.start()
+            self._processes.append(process)
+        for target, name in ((self._receive, 'receiver'), (self._flush_periodically, 'flusher')):
+            thread = threading.Thread(target=target, name=f'{self.name}-{name}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """
+        Stop the processes once they have processed all pending messages, and wait for their results.
+        """
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+            for i in range(0, len(self._inboxes)):
+                self._send(i)
+                self._inboxes[i].put(None)
+            self._wakeup.notify_all()
+        for thread in self._threads:
+            thread.join()
+        for process in self._processes:
+            process.join()
+        self._threads = []
+        self._processes = []
+
+    def shard(self, name: str) -> int:
+        """
+        Return the number of the process that handles the train.
+        """
+        return zlib.crc32(name.encode('utf-8')) % len(self._inboxes)
+
+    def put(self, name: str, topic: str, payload: bytes):
+        """
+        Queue a message for processing by the process that owns the train.
+        """
+        self.received += 1
+        self._add(name, ('msg', topic, payload))
+
+    def forget(self, name: str):
+        """
+        Drop what is known about a train in the process that owns it.
+        """
+        self._add(name, ('forget', name))
+
+    def stats(self) -> dict:
+        return {
+            'processes': len(self._inboxes),
+            'received': self.received,
+            'processed': self.processed,
+            'errors': self.errors,
+        }
+
+    def _add(self, name: str, item: tuple):
+        i = self.shard(name)
+        with self._lock:
+            pending = self._pending[i]
+            pending.append(item)
+            if len(pending) >= self.batch_size:
+                self._send(i)
+            elif len(pending) == 1:
+                self._wakeup.notify()
+
+    def _send(self, i: int):
+        if len(self._pending[i]) > 0:
+            self._inboxes[i].put(self._pending[i])
+            self._pending[i] = []
+
+    def _flush_periodically(self):
+        with self._lock:
+            while self._running:
+                if not any(self._pending):
+                    self._wakeup.wait()
+                    continue
+                self._wakeup.wait(self.max_delay)
+                for i in range(0, len(self._pending)):
+                    self._send(i)
+
+    def _receive(self):
+        running = len(self._processes)
+        while running > 0:
+            batch = self._outbox.get()
+            if batch is None:
+                running -= 1
+                continue
+            for (kind, key, value) in batch:
+                if kind == 'metrics':
+                    self.metrics.merge(value)
+                    continue
+                try:
+                    if kind == 'batch':
+                        self.on_result(key, value)
+                    elif kind == 'error':
+                        self.errors += 1
+                        if self.on_error is not None:
+                            self.on_error(key, value)
+                except Exception as e:
+                    self.errors += 1
+                    logging.error('%s: unable to handle result for %s: %s', self.name, key, e)
+                self.processed += 1
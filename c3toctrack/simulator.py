@@ -0,0 +1,255 @@
+"""
+A simulated fleet of trains, to load test the gateway with as many trackers as it may ever see.
+
+FleetSimulator drives virtual trains along the tracks of a TracksModel: each train shuttles back and forth on one
+track at its own speed, stops at every stop and station on the way for a while, and reports its position like a
+tracker does, with GPS noise, and with dropouts where it reports nothing for a while. The messages are generated in
+simulated time, so they can be fed to Replay, or published to a broker in real time or faster with publish().
+"""
+import heapq
+import json
+import random
+import threading
+import time
+from collections import deque
+
+import paho.mqtt.client as mqtt
+
+from .payload import encode
+from .point import Point
+from .replay import position_on
+from .tracksmodel import TracksModel
+from .utils import format_timestamp
+
+
+class VirtualTrain:
+    """
+    Where a simulated train is, and what it is doing.
+    """
+
+    __slots__ = ('name', 'track', 'stops', 'trackmarker', 'direction', 'speed', 'dwell_until', 'dropout_until',
+                 'fixes')
+
+    def __init__(self, name: str, track, trackmarker: float, direction: int, speed: float):
+        """
+        :param track: the Track the train shuttles on
+        :param speed: speed of the train while moving, in m/s
+        """
+        self.name = name
+        self.track = track
+        # trackmarkers of the stops on the track, in order
+        self.stops = sorted(waypoint.trackmarker for waypoint in track.waypoints.values() if waypoint.is_stop())
+        self.trackmarker = trackmarker
+        self.direction = direction
+        self.speed = speed
+        # the train is standing at a stop until then
+        self.dwell_until = 0.0
+        # the tracker has no fix until then
+        self.dropout_until = 0.0
+        # fixes not sent yet, for binary messages with several fixes
+        self.fixes = []
+
+    def move(self, t: float, dt: float, dwell: float) -> float:
+        """
+        Move the train for dt seconds, until time t. It stops at the first stop it reaches, or turns around at the end
+        of the track.
+        :param dwell: how long to stay at a stop, in seconds
+        :return: the speed of the train, in km/h
+        """
+        if t < self.dwell_until:
+            return 0.0
+        moving = min(dt, t - self.dwell_until)
+        first = self.track.trackmarkers[0]
+        last = self.track.trackmarkers[-1]
+        target = self.trackmarker + self.direction * self.speed * moving
+        # the next stop ahead, not the one the train is leaving
+        if self.direction > 0:
+            ahead = [stop for stop in self.stops if self.trackmarker < stop <= target]
+            stop = ahead[0] if len(ahead) > 0 else None
+        else:
+            ahead = [stop for stop in self.stops if target <= stop < self.trackmarker]
+            stop = ahead[-1] if len(ahead) > 0 else None
+        if stop is not None:
+            self.trackmarker = stop
+            self.dwell_until = t + dwell
+            return 0.0
+        if target > last or target < first:
+            self.direction = -self.direction
+            target = min(max(target, first), last)
+        self.trackmarker = target
+        return self.speed * 3.6
+
+
+class FleetSimulator:
+    """
+    Generates the messages of a fleet of virtual trains, see the module documentation.
+    """
+
+    def __init__(self, tracksmodel: TracksModel, trains: int = 100, speed: tuple = (8.0, 15.0),
+                 dwell: tuple = (20.0, 60.0), interval: float = 10.0, noise: float = 3.0, dropout: float = 0.01,
+                 dropout_duration: tuple = (10.0, 60.0), fixes_per_message: int = 1, status: bool = True,
+                 seed: int = 23):
+        """
+        :param trains: number of trains
+        :param speed: lowest and highest speed of the trains, in km/h; each train gets a random speed in between
+        :param dwell: shortest and longest time a train stays at a stop, in seconds
+        :param interval: seconds between two fixes of a train
+        :param noise: standard deviation of the GPS error, in meters
+        :param dropout: probability that the tracker loses its fix, for each fix
+        :param dropout_duration: shortest and longest time the fix is lost for, in seconds
+        :param fixes_per_message: with 1, every fix is sent as JSON on c3toc/train/<name>/pos; with more, that many
+                                  fixes are sent at once in the binary payload on c3toc/train/<name>/fixes
+        :param status: also send the "alive" status message a tracker sends with each position message
+        :param seed: seed for the random number generator, so runs are repeatable
+        """
+        self.rnd = random.Random(seed)
+        self.dwell = dwell
+        self.interval = interval
+        self.noise = noise
+        self.dropout = dropout
+        self.dropout_duration = dropout_duration
+        self.fixes_per_message = fixes_per_message
+        self.status = status
+        tracks = [track for track in tracksmodel.tracks.values() if len(track) > 1]
+        self.trains = []
+        for i in range(0, trains):
+            track = self.rnd.choice(tracks)
+            self.trains.append(VirtualTrain(f'sim{i}', track,
+                                            self.rnd.uniform(track.trackmarkers[0], track.trackmarkers[-1]),
+                                            self.rnd.choice((-1, 1)), self.rnd.uniform(*speed) / 3.6))
+
+    def messages(self, duration: float, start: float | None = None):
+        """
+        Generate the messages of all trains, in the order of their time.
+        :param duration: simulated time, in seconds
+        :param start: time of the first message, in seconds since the epoch; defaults to now
+        :return: a generator of tuples of time, topic and payload
+        """
+        if start is None:
+            start = time.time()
+        # the trackers are not in step: every train has its own phase
+        queue = [(start + self.rnd.uniform(0, self.interval), i) for i in range(0, len(self.trains))]
+        heapq.heapify(queue)
+        end = start + duration
+        while len(queue) > 0 and queue[0][0] < end:
+            (t, i) = heapq.heappop(queue)
+            heapq.heappush(queue, (t + self.interval, i))
+            yield from self._report(self.trains[i], t)
+
+    def _report(self, train: VirtualTrain, t: float):
+        speed = train.move(t, self.interval, self.rnd.uniform(*self.dwell))
+        if t < train.dropout_until:
+            return
+        if self.rnd.random() < self.dropout:
+            train.dropout_until = t + self.rnd.uniform(*self.dropout_duration)
+            return
+        (lat, lon) = position_on(train.track, train.trackmarker)
+        lat += self.rnd.gauss(0, self.noise) * Point.degree_per_meter_lat
+        lon += self.rnd.gauss(0, self.noise) * Point.degree_per_meter_lon
+        sat = self.rnd.randint(5, 12)
+        if self.fixes_per_message > 1:
+            train.fixes.append((t, lat, lon, sat, speed))
+            if len(train.fixes) < self.fixes_per_message:
+                return
+            payload = encode(train.fixes, 4.1, 5.0, -70)
+            train.fixes = []
+            kind = 'fixes'
+        else:
+            payload = json.dumps({
+                'lat': round(lat, 5),
+                'lon': round(lon, 5),
+                'sat': sat,
+                'speed': round(speed, 1),
+                'Vbat': 4.1,
+                'Vbus': 5.0,
+                'ts': format_timestamp(t),
+            }).encode('utf-8')
+            kind = 'pos'
+        if self.status:
+            yield t, f'c3toc/train/{train.name}/status', f'alive {format_timestamp(t)}'.encode('utf-8')
+        yield t, f'c3toc/train/{train.name}/{kind}', payload
+
+
+def publish(messages, hostname: str, port: int = 1883, connections: int = 10, compression: float = 1.0,
+            rate: float | None = None, report=None, stop: threading.Event | None = None,
+            max_backlog: int = 1000) -> dict:
+    """
+    Publish messages to a broker, paced by their time, from several connections, like many trackers would.
+
+    Publishing is asynchronous: the network threads of the connections send the messages, while this function only
+    queues them on time. paho does not limit its queue for messages without QoS, so the messages queued but not sent
+    yet are counted, and once a connection has max_backlog of them, publishing waits for the oldest one to be sent. If
+    the messages cannot be sent as fast as they are due, the backlog fills up, and then the lag grows.
+    :param messages: an iterable of tuples of time, topic and payload, as from FleetSimulator.messages()
+    :param connections: number of connections to the broker; the messages of each train always use the same one
+    :param compression: how many times faster than real time to publish; 60 sends the messages of a minute in a second
+    :param rate: if set, publish this many messages per second instead, however far apart they are in time
+    :param report: if set, function called about once a second with the statistics so far
+    :param stop: if set, stop publishing once it is set
+    :param max_backlog: how many messages each connection may have queued but not sent
+    :return: a dict with the number of messages 'sent', the 'seconds' it took, the 'rate' achieved, the 'lag': how
+             many seconds the last message was queued after its time, and the 'backlog' of messages queued but not
+             sent yet, which is 0 once all have been sent at the end
+    """
+    clients = []
+    for i in range(0, connections):
+        client = mqtt.Client()
+        client.connect(hostname, port, 60)
+        client.loop_start()
+        clients.append(client)
+    stats = {'sent': 0, 'seconds': 0.0, 'rate': 0.0, 'lag': 0.0, 'backlog': 0}
+    started = time.perf_counter()
+    reported = started
+    first = None
+    # the messages queued on each connection that have not been sent yet, oldest first
+    pending = [deque() for i in range(0, connections)]
+    try:
+        for (t, topic, payload) in messages:
+            if stop is not None and stop.is_set():
+                break
+            if rate is not None:
+                due = started + stats['sent'] / rate
+            else:
+                if first is None:
+                    first = t
+                due = started + (t - first) / compression
+            now = time.perf_counter()
+            if due - now > 0.001:
+                time.sleep(due - now)
+                now = due
+            connection = hash(topic.split('/')[2]) % connections
+            queue = pending[connection]
+            if len(queue) >= max_backlog and _sent(queue) >= max_backlog:
+                # the connection cannot send the messages as fast as they are due
+                queue.popleft().wait_for_publish()
+            queue.append(clients[connection].publish(topic, payload))
+            stats['sent'] += 1
+            stats['lag'] = max(now - due, 0.0)
+            if report is not None and now - reported >= 1.0:
+                stats['seconds'] = now - started
+                stats['rate'] = stats['sent'] / stats['seconds']
+                stats['backlog'] = sum(_sent(queue) for queue in pending)
+                report(dict(stats))
+                reported = now
+        for queue in pending:
+            for message in queue:
+                message.wait_for_publish()
+            queue.clear()
+    finally:
+        for client in clients:
+            client.disconnect()
+            client.loop_stop()
+    stats['seconds'] = time.perf_counter() - started
+    stats['rate'] = stats['sent'] / stats['seconds'] if stats['seconds'] > 0 else 0
+    stats['backlog'] = sum(len(queue) for queue in pending)
+    return stats
+
+
+def _sent(queue: deque) -> int:
+    """
+    Drop the messages that have been sent from the start of a queue of MQTTMessageInfo.
+    :return: the number of messages still waiting to be sent
+    """
+    while len(queue) > 0 and queue[0].is_published():
+        queue.popleft()
+    return len(queue)
@@ -0,0 +1,59 @@
+"""
+Snapshots of the live state of the trains, so the gateway can pick up where it left off after a restart, instead of
+starting with no trains until each of them reports again.
+
+A snapshot is a dict, pickled and compressed with gzip. It is only read back by the same version of the gateway with
+the same track network: the motion state of the trains refers to the segments and edges of the track model.
+"""
+import gzip
+import hashlib
+import logging
+import pickle
+
+from .output import write_if_changed
+from .tracksmodel import TracksModel
+
+logger = logging.getLogger(__name__)
+
+# incremented whenever the contents of snapshots change
+VERSION = 1
+
+
+def fingerprint(tracksmodel: TracksModel) -> str:
+    """
+    Return a hash of the track network, which changes whenever a track or one of its points does.
+    """
+    key = hashlib.sha256()
+    for name, track in sorted(tracksmodel.tracks.items()):
+        key.update(name.encode('utf-8'))
+        key.update(track.lats.tobytes())
+        key.update(track.lons.tobytes())
+    return key.hexdigest()
+
+
+def write_snapshot(filename: str, state: dict) -> bool:
+    """
+    Atomically replace the snapshot, unless it has not changed.
+    :return: True if the file has been written
+    """
+    data = pickle.dumps(dict(state, version=VERSION), protocol=pickle.HIGHEST_PROTOCOL)
+    return write_if_changed(filename, gzip.compress(data, compresslevel=1, mtime=0))
+
+
+def read_snapshot(filename: str) -> dict | None:
+    """
+    Read a snapshot.
+    :return: the state, or None if there is no snapshot, or it cannot be read, or is of another version
+    """
+    try:
+        with gzip.open(filename, 'rb') as f:
+            state = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError) as e:
+        logger.warning('Unable to read snapshot %s: %s', filename, e)
+        return None
+    if not isinstance(state, dict) or state.get('version') != VERSION:
+        logger.warning('Ignoring snapshot %s of another version', filename)
+        return None
+    return state
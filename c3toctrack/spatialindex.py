@@ -0,0 +1,268 @@
+from math import floor, sqrt
+from typing import NamedTuple
+
+import numpy as np
+
+from .point import Point
+
+
+def _concatenate(parts: list, dtype=np.float64) -> np.ndarray:
+    if len(parts) == 0:
+        return np.empty(0, dtype=dtype)
+    return np.concatenate(parts)
+
+
+class Snap(NamedTuple):
+    """
+    The result of snapping a position onto the tracks.
+    """
+    trackname: str
+    trackmarker: float
+    segment: int
+    distance: float
+
+
+class SnapBatch(NamedTuple):
+    """
+    The result of snapping many positions at once; each field is an array with one entry per position.
+    """
+    trackname: np.ndarray
+    trackmarker: np.ndarray
+    segment: np.ndarray
+    distance: np.ndarray
+
+
+class SegmentIndex:
+    """
+    A uniform grid over the segments of all tracks. Each segment (the line between two consecutive points of a track)
+    is entered into every grid cell its bounding box touches, so finding the closest segment to a position only needs
+    to look at the cells around that position instead of every point of every track.
+
+    The segments are kept in contiguous NumPy arrays, and positions are projected onto them in batches. Snapping a
+    single position goes through the same code as a batch, so both give identical results.
+
+    Coordinates are converted to meters using the same factors as Point.distance, so distances computed here match the
+    rest of the model.
+    """
+
+    # number of positions projected onto the candidate segments at once, to bound memory use
+    CHUNK = 4096
+
+    def __init__(self, tracks: dict, cell_size: float = 25.0):
+        """
+        Build the index.
+        :param tracks: the tracks to index, as in TracksModel.tracks
+        :param cell_size: edge length of a grid cell, in meters
+        """
+        self.cell_size = cell_size
+        self.tracknames = []
+        # number of the first segment of each track, in the order of tracknames
+        self.offsets = []
+        lats0, lons0, lats1, lons1, markers0, markers1, owners = [], [], [], [], [], [], []
+        count = 0
+        for track in tracks.values():
+            lats = np.frombuffer(track.lats, dtype=np.float64)
+            lons = np.frombuffer(track.lons, dtype=np.float64)
+            markers = np.frombuffer(track.trackmarkers, dtype=np.float64)
+            if len(lats) == 1:
+                # a track with a single point becomes a segment of length zero
+                (lats, lons, markers) = (np.repeat(lats, 2), np.repeat(lons, 2), np.repeat(markers, 2))
+            lats0.append(lats[:-1])
+            lons0.append(lons[:-1])
+            lats1.append(lats[1:])
+            lons1.append(lons[1:])
+            markers0.append(markers[:-1])
+            markers1.append(markers[1:])
+            self.offsets.append(count)
+            count += max(len(lats) - 1, 0)
+            owners.append(np.full(max(len(lats) - 1, 0), len(self.tracknames), dtype=np.int64))
+            self.tracknames.append(track.name)
+        self.ax, self.ay = self.to_meters(_concatenate(lats0), _concatenate(lons0))
+        self.bx, self.by = self.to_meters(_concatenate(lats1), _concatenate(lons1))
+        self.am = _concatenate(markers0)
+        self.bm = _concatenate(markers1)
+        self.track = _concatenate(owners, np.int64)
+        self.dx = self.bx - self.ax
+        self.dy = self.by - self.ay
+        self.dm = self.bm - self.am
+        l2 = self.dx * self.dx + self.dy * self.dy
+        self.inv_l2 = np.divide(1, l2, out=np.zeros_like(l2), where=l2 > 0)
+        # everything project needs, in one array so a single take gathers it for all candidate segments
+        self.geometry = np.stack((self.ax, self.ay, self.dx, self.dy, self.inv_l2, self.am, self.dm))
+        self._names = np.array(self.tracknames + [None], dtype=object)
+
+        cells = {}
+        lo_x = np.floor(np.minimum(self.ax, self.bx) / cell_size).astype(np.int64)
+        hi_x = np.floor(np.maximum(self.ax, self.bx) / cell_size).astype(np.int64)
+        lo_y = np.floor(np.minimum(self.ay, self.by) / cell_size).astype(np.int64)
+        hi_y = np.floor(np.maximum(self.ay, self.by) / cell_size).astype(np.int64)
+        for n in range(0, len(self.am)):
+            for cx in range(int(lo_x[n]), int(hi_x[n]) + 1):
+                for cy in range(int(lo_y[n]), int(hi_y[n]) + 1):
+                    cells.setdefault((cx, cy), []).append(n)
+        self.cells = {cell: np.array(segments, dtype=np.int64) for cell, segments in cells.items()}
+        if len(self.cells) > 0:
+            self.min_x = min(x for x, y in self.cells)
+            self.max_x = max(x for x, y in self.cells)
+            self.min_y = min(y for x, y in self.cells)
+            self.max_y = max(y for x, y in self.cells)
+
+    def __len__(self):
+        return len(self.am)
+
+    @staticmethod
+    def to_meters(lat, lon) -> tuple:
+        return lon / Point.degree_per_meter_lon, lat / Point.degree_per_meter_lat
+
+    def _ring(self, cx: int, cy: int, k: int) -> list:
+        """
+        Return the segment arrays of all cells that are exactly k cells away from (cx, cy).
+        """
+        if k == 0:
+            return [self.cells[(cx, cy)]] if (cx, cy) in self.cells else []
+        if 8 * k > len(self.cells):
+            # the ring is larger than the occupied part of the grid, just look at all occupied cells
+            return [segments for (x, y), segments in self.cells.items() if max(abs(x - cx), abs(y - cy)) == k]
+        keys = [(x, cy - k) for x in range(cx - k, cx + k + 1)]
+        keys += [(x, cy + k) for x in range(cx - k, cx + k + 1)]
+        keys += [(cx - k, y) for y in range(cy - k + 1, cy + k)]
+        keys += [(cx + k, y) for y in range(cy - k + 1, cy + k)]
+        return [self.cells[key] for key in keys if key in self.cells]
+
+    def project(self, segments: np.ndarray, px: np.ndarray, py: np.ndarray) -> tuple:
+        """
+        Project positions onto segments.
+        :param segments: the segment numbers, as a 1-d array
+        :param px: x coordinates of the positions in meters, as a 1-d array
+        :param py: y coordinates of the positions in meters, as a 1-d array
+        :return: a tuple of two arrays with one row per position and one column per segment, the distance between
+                 position and segment, and the trackmarker of the projection
+        """
+        (ax, ay, dx, dy, inv_l2, am, dm) = self.geometry.take(segments, axis=1)
+        rx = px[:, None] - ax
+        ry = py[:, None] - ay
+        t = np.clip((rx * dx + ry * dy) * inv_l2, 0, 1)
+        qx = t * dx - rx
+        qy = t * dy - ry
+        return np.sqrt(qx * qx + qy * qy), am + t * dm
+
+    def _nearest(self, segments: np.ndarray, px: np.ndarray, py: np.ndarray) -> tuple:
+        """
+        For each position, find the closest of the given segments. segments must be sorted, so that ties are resolved
+        in favour of the lowest segment number.
+        :return: a tuple of arrays of the closest segment, the distance to it, and the trackmarker of the projection
+        """
+        if len(px) <= self.CHUNK:
+            d, m = self.project(segments, px, py)
+            j = d.argmin(axis=1)
+            rows = np.arange(0, len(px))
+            return segments[j], d[rows, j], m[rows, j]
+        best = np.empty(len(px), dtype=np.int64)
+        distance = np.empty(len(px), dtype=np.float64)
+        trackmarker = np.empty(len(px), dtype=np.float64)
+        for i in range(0, len(px), self.CHUNK):
+            best[i:i + self.CHUNK], distance[i:i + self.CHUNK], trackmarker[i:i + self.CHUNK] = \
+                self._nearest(segments, px[i:i + self.CHUNK], py[i:i + self.CHUNK])
+        return best, distance, trackmarker
+
+    def nearest_many(self, lats, lons) -> SnapBatch:
+        """
+        Find the closest segment for each of the given positions, and project the positions onto them.
+        :param lats: latitudes, as a sequence or array
+        :param lons: longitudes, as a sequence or array of the same length
+        :return: the snapped positions. If the index is empty, the track names are None and all other values are -1.
+        """
+        px, py = self.to_meters(np.asarray(lats, dtype=np.float64), np.asarray(lons, dtype=np.float64))
+        px = np.atleast_1d(px)
+        py = np.atleast_1d(py)
+        segment = np.full(len(px), -1, dtype=np.int64)
+        distance = np.full(len(px), -1, dtype=np.float64)
+        trackmarker = np.full(len(px), -1, dtype=np.float64)
+        if len(self) > 0 and len(px) == 1:
+            self._nearest_in_cell(floor(px[0] / self.cell_size), floor(py[0] / self.cell_size), np.zeros(1, np.int64),
+                                  px, py, segment, distance, trackmarker)
+        elif len(self) > 0 and len(px) > 0:
+            cx = np.floor(px / self.cell_size).astype(np.int64)
+            cy = np.floor(py / self.cell_size).astype(np.int64)
+            # handle all positions falling into the same cell together
+            cells, inverse = np.unique(np.stack((cx, cy), axis=1), axis=0, return_inverse=True)
+            inverse = inverse.reshape(-1)
+            order = np.argsort(inverse, kind='stable')
+            groups = np.split(order, np.cumsum(np.bincount(inverse, minlength=len(cells)))[:-1])
+            for (gx, gy), group in zip(cells.tolist(), groups):
+                self._nearest_in_cell(gx, gy, group, px, py, segment, distance, trackmarker)
+        owner = np.full(len(px), len(self.tracknames), dtype=np.int64)
+        if len(self) > 0:
+            owner = np.where(segment >= 0, self.track[segment], owner)
+        names = self._names[owner]
+        return SnapBatch(names, trackmarker, segment, distance)
+
+    def _nearest_in_cell(self, cx: int, cy: int, group: np.ndarray, px: np.ndarray, py: np.ndarray,
+                         segment: np.ndarray, distance: np.ndarray, trackmarker: np.ndarray):
+        """
+        Snap the positions in group, which all lie in cell (cx, cy), by searching rings of cells around that cell.
+        The search stops as soon as no unvisited cell can hold a segment closer than the closest one found so far.
+        """
+        max_k = max(abs(cx - self.min_x), abs(cx - self.max_x), abs(cy - self.min_y), abs(cy - self.max_y))
+        gx = px[group]
+        gy = py[group]
+        # ring 0 alone hardly ever settles the search, so start with the rings 0 and 1
+        found = self._ring(cx, cy, 0) + self._ring(cx, cy, 1)
+        candidates = np.unique(np.concatenate(found)) if len(found) > 0 else np.empty(0, dtype=np.int64)
+        k = 1
+        while True:
+            if len(candidates) > 0:
+                best, d, m = self._nearest(candidates, gx, gy)
+                # anything in a cell further out than ring k is at least k cells away from the position
+                if k >= max_k or d.max() <= k * self.cell_size:
+                    break
+            k += 1
+            ring = self._ring(cx, cy, k)
+            if len(ring) > 0:
+                candidates = np.unique(np.concatenate([candidates] + ring))
+        segment[group] = best
+        distance[group] = d
+        trackmarker[group] = m
+
+    def nearest(self, lat: float, lon: float) -> Snap | None:
+        """
+        Find the segment closest to the given position, and project the position onto it.
+        :return: the snapped position, or None if the index is empty
+        """
+        batch = self.nearest_many((lat,), (lon,))
+        if batch.segment[0] < 0:
+            return None
+        return Snap(batch.trackname[0], float(batch.trackmarker[0]), int(batch.segment[0]), float(batch.distance[0]))
+
+    def nearest_of(self, segments: np.ndarray, lat: float, lon: float) -> Snap | None:
+        """
+        Find the closest of the given segments to a position, without looking at any other segment.
+        :param segments: the segment numbers to consider, sorted
+        :return: the snapped position, or None if segments is empty
+        """
+        if len(segments) == 0:
+            return None
+        px, py = self.to_meters(np.array((lat,), dtype=np.float64), np.array((lon,), dtype=np.float64))
+        best, d, m = self._nearest(segments, px, py)
+        return Snap(self.tracknames[self.track[best[0]]], float(m[0]), int(best[0]), float(d[0]))
+
+    def nearest_in_range(self, first: int, stop: int, lat: float, lon: float) -> Snap | None:
+        """
+        Find the closest of the segments first to stop - 1 to a position. This does the same computation as project,
+        in plain Python, which is much faster than NumPy for a handful of segments.
+        :return: the snapped position, or None if the range is empty
+        """
+        (px, py) = self.to_meters(lat, lon)
+        best = None
+        for i, (ax, ay, dx, dy, inv_l2, am, dm) in enumerate(zip(*self.geometry[:, first:stop].tolist())):
+            rx = px - ax
+            ry = py - ay
+            t = min(max((rx * dx + ry * dy) * inv_l2, 0.0), 1.0)
+            qx = t * dx - rx
+            qy = t * dy - ry
+            d = sqrt(qx * qx + qy * qy)
+            if best is None or d < best[1]:
+                best = (first + i, d, am + t * dm)
+        if best is None:
+            return None
+        return Snap(self.tracknames[self.track[best[0]]], best[2], best[0], best[1])
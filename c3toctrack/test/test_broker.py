@@ -0,0 +1,40 @@
+import queue
+import time
+
+import paho.mqtt.client as mqtt
+
+from c3toctrack.broker import LocalBroker, topic_matches
+
+
+def test_topic_matches() -> None:
+    assert topic_matches('c3toc/train/#', 'c3toc/train/demo/pos')
+    assert topic_matches('c3toc/train/+/pos', 'c3toc/train/demo/pos')
+    assert not topic_matches('c3toc/train/+/pos', 'c3toc/train/demo/status')
+    assert not topic_matches('c3toc/train/+', 'c3toc/train/demo/pos')
+    assert topic_matches('c3toc/train/demo/pos', 'c3toc/train/demo/pos')
+
+
+def test_publish_and_subscribe() -> None:
+    broker = LocalBroker()
+    broker.start_thread()
+    received = queue.Queue()
+    subscriber = mqtt.Client()
+    subscriber.on_message = lambda client, userdata, msg: received.put((msg.topic, msg.payload))
+    subscriber.connect(broker.host, broker.port)
+    subscriber.subscribe('c3toc/train/+/pos')
+    subscriber.loop_start()
+    publisher = mqtt.Client()
+    publisher.connect(broker.host, broker.port)
+    publisher.loop_start()
+    try:
+        while broker.subscribers('c3toc/train/demo/pos') == 0:
+            time.sleep(0.01)
+        publisher.publish('c3toc/train/demo/status', b'ignored')
+        publisher.publish('c3toc/train/demo/pos', b'{}', qos=1).wait_for_publish()
+        assert received.get(timeout=5) == ('c3toc/train/demo/pos', b'{}')
+        assert received.empty()
+        assert broker.published == 2
+    finally:
+        publisher.loop_stop()
+        subscriber.loop_stop()
+        broker.stop_thread()
@@ -0,0 +1,61 @@
+import time
+
+import paho.mqtt.client as mqtt
+
+from c3toctrack import MqttTrainReporterClient, TracksModel
+from c3toctrack.broker import LocalBroker
+
+POSITION = b'{"lat": 53.0305331, "lon": 13.3042594, "sat": 9, "speed": 0, "ts": "2023-08-15T12:00:00Z"}'
+
+
+def wait_for(condition, timeout: float = 10) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def publish(broker: LocalBroker, topic: str, payload: bytes) -> None:
+    publisher = mqtt.Client()
+    publisher.connect(broker.host, broker.port)
+    publisher.loop_start()
+    publisher.publish(topic, payload, qos=1).wait_for_publish()
+    publisher.disconnect()
+    publisher.loop_stop()
+
+
+def test_reconnect_and_resubscribe() -> None:
+    broker = LocalBroker()
+    broker.start_thread()
+    client = MqttTrainReporterClient('localhost', 'user', 'secret', 'c3toc/train/#',
+                                     TracksModel('data/trainlines.gpx', {}), None, None, max_flush_rate=0,
+                                     port=broker.port)
+    client.connection.first_delay = 0.05
+    assert client.trains['stale']
+    client.start()
+    try:
+        wait_for(lambda: broker.subscribers('c3toc/train/demo/pos') == 1)
+        assert not client.trains['stale']
+        publish(broker, 'c3toc/train/demo/pos', POSITION)
+        wait_for(lambda: client.processed == 1)
+
+        # the connection drops, and the client resubscribes on the new one
+        broker.drop_connections()
+        wait_for(lambda: broker.connections == 3 and broker.subscribers('c3toc/train/demo/pos') == 1)
+        publish(broker, 'c3toc/train/other/pos', POSITION)
+        wait_for(lambda: client.processed == 2)
+
+        # the broker goes away for a while; the last known positions are kept, marked as stale
+        port = broker.port
+        broker.stop_thread()
+        wait_for(lambda: client.trains['stale'])
+        assert sorted(client.trains['trains']) == ['demo', 'other']
+        time.sleep(0.3)
+        assert client.connection.attempts > 1
+        broker = LocalBroker(port=port)
+        broker.start_thread()
+        wait_for(lambda: not client.trains['stale'] and broker.subscribers('c3toc/train/demo/pos') == 1)
+        assert client.connections == 3
+    finally:
+        client.stop()
+        broker.stop_thread()
@@ -0,0 +1,94 @@
+import json
+import random
+
+from c3toctrack import MqttTrainReporterClient, TracksModel
+from c3toctrack.crossings import CrossingMonitor, IntervalIndex
+from c3toctrack.replay import position_on
+from c3toctrack.utils import format_timestamp
+
+tracksmodel = TracksModel('data/trainlines.gpx', {})
+
+
+def states(events: list) -> list:
+    return [(event['train'], event['crossing'], event['state']) for event in events]
+
+
+def run(monitor: CrossingMonitor, train: str, trackname: str, trackmarkers) -> list:
+    events = []
+    for trackmarker in trackmarkers:
+        events += monitor.update(train, trackname, trackmarker)
+    return events
+
+
+def test_interval_index() -> None:
+    rnd = random.Random(23)
+    intervals = []
+    for i in range(0, 200):
+        start = rnd.uniform(0, 1000)
+        intervals.append((start, start + rnd.uniform(0, 50), i))
+    index = IntervalIndex(intervals)
+    for x in [rnd.uniform(-10, 1060) for i in range(0, 500)] + [intervals[0][0], intervals[0][1]]:
+        expected = sorted(value for start, end, value in intervals if start <= x <= end)
+        assert sorted(index.at(x)) == expected
+    assert IntervalIndex([]).at(0) == []
+
+
+def test_passing_train() -> None:
+    monitor = CrossingMonitor(tracksmodel)
+    assert monitor.crossings['Schrankenposten Laumann']['tracks'] == {'Bäderbahn': 63}
+    events = run(monitor, 'demo', 'Bäderbahn', range(-150, 300, 2))
+    assert states(events) == [('demo', 'Schrankenposten Laumann', 'approaching'),
+                              ('demo', 'Schrankenposten Laumann', 'occupying'),
+                              ('demo', 'Schrankenposten Laumann', 'cleared')]
+    assert [event['distance'] for event in events] == [-199, -15, 21]
+    assert [event['seq'] for event in events] == [1, 2, 3]
+    # cleared, and out of the zone: nothing left to keep
+    assert monitor.states == {}
+    # on another track, with the same trackmarkers
+    assert run(monitor, 'demo', 'Gotthardbahn', range(0, 229, 2)) == []
+
+
+def test_hysteresis() -> None:
+    monitor = CrossingMonitor(tracksmodel)
+    events = run(monitor, 'demo', 'Bäderbahn', [0, 63, 79, 77, 80, 78, 84, 81, 79])
+    assert states(events)[1:] == [('demo', 'Schrankenposten Laumann', 'occupying'),
+                                  ('demo', 'Schrankenposten Laumann', 'cleared')]
+    # backing up onto the crossing again
+    events = run(monitor, 'demo', 'Bäderbahn', [70, 400])
+    assert [event['state'] for event in events] == ['occupying', 'cleared']
+
+
+def test_turning_back_and_forget() -> None:
+    monitor = CrossingMonitor(tracksmodel)
+    events = run(monitor, 'demo', 'Bäderbahn', [-140, -100, -50, -100, -140])
+    assert [event['state'] for event in events] == ['approaching', 'cleared']
+    run(monitor, 'a', 'Bäderbahn', [60])
+    run(monitor, 'b', 'Marschbahn', [200])
+    assert monitor.feed()['crossings']['Moorweg']['trains'] == {'b': {'state': 'approaching', 'distance': -56,
+                                                                      'since': None}}
+    assert states(monitor.forget('b')) == [('b', 'Moorweg', 'cleared')]
+    assert monitor.forget('b') == []
+    feed = monitor.feed(since=3)
+    assert feed['seq'] == 5
+    assert states(feed['events']) == [('b', 'Moorweg', 'approaching'), ('b', 'Moorweg', 'cleared')]
+    assert list(feed['crossings']['Schrankenposten Laumann']['trains'].keys()) == ['a']
+
+
+def test_client(tmp_path) -> None:
+    crossings = CrossingMonitor(tracksmodel)
+    filename = str(tmp_path / 'crossings.json')
+    client = MqttTrainReporterClient(None, None, None, None, tracksmodel, None, None, max_flush_rate=0,
+                                     crossings=crossings, crossings_json=filename)
+    track = tracksmodel.tracks['Marschbahn']
+    for i, trackmarker in enumerate(range(0, 280, 3)):
+        (lat, lon) = position_on(track, trackmarker)
+        payload = {'lat': lat, 'lon': lon, 'ts': format_timestamp(1692000000 + i)}
+        client.handle_message('c3toc/train/demo/pos', json.dumps(payload).encode('utf-8'))
+    client.writer.stop()
+    with open(filename) as f:
+        feed = json.load(f)
+    assert states(feed['events']) == [('demo', 'Moorweg', 'approaching'), ('demo', 'Moorweg', 'occupying'),
+                                      ('demo', 'Moorweg', 'cleared')]
+    assert feed['events'][1]['timestamp'] == format_timestamp(1692000000 + 81)
+    # at the end of the track, still in the zone
+    assert feed['crossings']['Moorweg']['trains']['demo']['state'] == 'cleared'
@@ -0,0 +1,44 @@
+from c3toctrack.deltafeed import DeltaFeed
+
+
+def test_since() -> None:
+    feed = DeltaFeed(window=30)
+    trains = {'a': {'lat': 1}, 'b': {'lat': 2}}
+    feed.changed('a')
+    feed.changed('b')
+    assert feed.commit(trains, now=0)
+    trains['a'] = {'lat': 3}
+    feed.changed('a')
+    assert feed.commit(trains, now=1)
+    assert not feed.commit(trains, now=2)
+    assert feed.seq == 2
+
+    delta = feed.since(1)
+    assert delta['trains'] == {'a': {'lat': 3}}
+    assert delta['removed'] == []
+    assert not delta['reset']
+    assert feed.since(2)['trains'] == {}
+    assert feed.since(0)['trains'] == {'a': {'lat': 3}, 'b': {'lat': 2}}
+
+    del trains['b']
+    feed.removed('b')
+    feed.commit(trains, now=3)
+    delta = feed.since(2)
+    assert delta['trains'] == {}
+    assert delta['removed'] == ['b']
+
+
+def test_window() -> None:
+    feed = DeltaFeed(window=10)
+    trains = {'a': {'lat': 1}, 'b': {'lat': 2}}
+    for now in range(0, 30):
+        feed.changed('a' if now % 2 == 0 else 'b')
+        feed.commit(trains, now=now)
+    assert feed.seq == 30
+    assert feed.first == 20
+    assert feed.since(18)['reset']
+    assert not feed.since(19)['reset']
+    assert feed.since(28)['trains'] == {'a': {'lat': 1}, 'b': {'lat': 2}}
+    assert feed.since(29)['trains'] == {'b': {'lat': 2}}
+    # a cursor from the future, for example after a restart of the gateway
+    assert feed.since(31)['reset']
@@ -0,0 +1,62 @@
+from datetime import datetime
+
+from c3toctrack import TracksModel
+from c3toctrack.eta import EtaEngine, TravelTimes
+from c3toctrack.motion import TrainState
+from c3toctrack.replay import position_on
+
+
+class FixedTravelTimes(TravelTimes):
+    def leg(self, origin, destination):
+        return 100.0
+
+    def dwell(self, stop):
+        return 20.0
+
+
+def epoch(eta: str) -> float:
+    return datetime.fromisoformat(eta).timestamp()
+
+
+def train_at(model: TracksModel, trackname: str, trackmarker: float, speed: float) -> TrainState:
+    (lat, lon) = position_on(model.tracks[trackname], trackmarker)
+    state = TrainState(model, model.snap(lat, lon), 1692000000.0)
+    state.direction = 1
+    state.speed = speed
+    return state
+
+
+def test_stop_index_wraps_around() -> None:
+    model = TracksModel('data/trainlines.gpx', {'Marschbahn': 1704})
+    stops = model.stops
+    assert stops.next_stop(-1) is stops.stops[0]
+    assert stops.next_stop(stops.markers[0]) is stops.stops[1]
+    assert stops.next_stop(stops.markers[-1]) is stops.stops[0]
+
+
+def test_all_upcoming_stops() -> None:
+    model = TracksModel('data/trainlines.gpx', {})
+    state = train_at(model, 'Berliner Außenring', 100, 3.0)
+    upcoming = EtaEngine(model).upcoming(state)
+    assert [stop['name'] for stop in upcoming[:2]] == ['Ständeamt', 'Hafen']
+    assert len(upcoming) == len(model.stops)
+    assert abs(epoch(upcoming[0]['eta']) - (state.timestamp + upcoming[0]['distance'] / 3.0)) <= 1
+    assert abs(epoch(upcoming[1]['eta']) - (state.timestamp + upcoming[1]['distance'] / 3.0)) <= 1
+    assert all(a['distance'] < b['distance'] for a, b in zip(upcoming, upcoming[1:]))
+
+
+def test_historical_travel_times() -> None:
+    model = TracksModel('data/trainlines.gpx', {})
+    state = train_at(model, 'Berliner Außenring', 100, 3.0)
+    upcoming = EtaEngine(model, FixedTravelTimes(), limit=4).upcoming(state)
+    assert len(upcoming) == 4
+    etas = [epoch(stop['eta']) for stop in upcoming]
+    assert [b - a for a, b in zip(etas, etas[1:])] == [120, 120, 120]
+
+
+def test_standing_train_has_no_eta() -> None:
+    model = TracksModel('data/trainlines.gpx', {})
+    state = train_at(model, 'Berliner Außenring', 100, 0.0)
+    upcoming = EtaEngine(model).upcoming(state)
+    assert upcoming[0]['name'] == 'Ständeamt'
+    assert all(stop['eta'] is None for stop in upcoming)
@@ -0,0 +1,47 @@
+import os
+
+from c3toctrack import HistoryReader, HistoryWriter
+from c3toctrack.history import RECORD
+
+
+def write_history(directory: str) -> None:
+    writer = HistoryWriter(directory, rotate_bytes=RECORD.itemsize * 100, buffer_size=RECORD.itemsize * 10)
+    for i in range(0, 1000):
+        writer.append(f'train{i % 4}', 1000.0 + i, 53.03 + i * 1e-6, 13.30, i, 12.5)
+    writer.close()
+
+
+def test_roundtrip(tmp_path) -> None:
+    write_history(str(tmp_path))
+    reader = HistoryReader(str(tmp_path))
+    assert len(reader.segments()) > 5
+    records = reader.read()
+    assert len(records) == 1000
+    assert list(records['timestamp'][:3]) == [1000.0, 1001.0, 1002.0]
+    assert records['train'][1] == b'train1'
+    assert records['speed'][0] == 12.5
+
+
+def test_filter(tmp_path) -> None:
+    write_history(str(tmp_path))
+    reader = HistoryReader(str(tmp_path))
+    records = reader.read(train='train2', start=1100, end=1200)
+    assert len(records) == 25
+    assert all(records['train'] == b'train2')
+    assert records['timestamp'].min() >= 1100
+    assert records['timestamp'].max() < 1200
+
+
+def test_partial_segment(tmp_path) -> None:
+    """
+    A segment that is still being written can end in a partial record, which is ignored.
+    """
+    writer = HistoryWriter(str(tmp_path), buffer_size=1)
+    writer.append('demo', 1000.0, 53.03, 13.30, 10, 0)
+    writer.append('demo', 1001.0, 53.03, 13.30, 11, 0)
+    (segment,) = HistoryReader(str(tmp_path)).segments()
+    with open(segment, 'ab') as f:
+        f.write(b'\0' * 7)
+    records = HistoryReader(str(tmp_path)).read(train='demo')
+    assert list(records['trackmarker']) == [10, 11]
+    assert os.path.getsize(segment) % RECORD.itemsize != 0
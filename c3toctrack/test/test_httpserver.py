@@ -0,0 +1,109 @@
+import http.client
+import json
+import socket
+
+from c3toctrack import MqttTrainReporterClient, TracksModel
+from c3toctrack.httpserver import TrainServer
+from c3toctrack.metrics import Metrics
+from c3toctrack.replay import FakeMessage
+
+POSITION = b'{"lat": 53.0305331, "lon": 13.3042594, "sat": 9, "speed": 0, "ts": "2023-08-15T12:00:00Z"}'
+
+
+def start(**kwargs):
+    tracksmodel = TracksModel('data/trainlines.gpx', {})
+    client = MqttTrainReporterClient(None, None, None, None, tracksmodel, None, None, max_flush_rate=0, **kwargs)
+    server = TrainServer(client, tracksmodel, static_dir='data', port=0)
+    server.start_thread()
+    return client, server
+
+
+def get(server: TrainServer, path: str, headers: dict | None = None) -> http.client.HTTPResponse:
+    connection = http.client.HTTPConnection('localhost', server.port, timeout=5)
+    connection.request('GET', path, headers=headers or {})
+    return connection.getresponse()
+
+
+def test_etag() -> None:
+    client, server = start()
+    try:
+        response = get(server, '/tracks.json')
+        assert response.status == 200
+        assert 'Rollbahn' in json.loads(response.read())['tracks']
+        etag = response.getheader('ETag')
+        response = get(server, '/tracks.json', {'If-None-Match': etag})
+        assert response.status == 304
+        assert response.read() == b''
+        assert get(server, '/map.html').status == 200
+        assert get(server, '/../pyproject.toml').status == 404
+        assert get(server, '/nothing').status == 404
+    finally:
+        server.stop_thread()
+
+
+def test_trains() -> None:
+    client, server = start()
+    try:
+        response = get(server, '/trains.json')
+        etag = response.getheader('ETag')
+        assert json.loads(response.read())['trains'] == {}
+        client.handle_message('c3toc/train/demo/pos', POSITION)
+        response = get(server, '/trains.json', {'If-None-Match': etag})
+        assert response.status == 200
+        assert json.loads(response.read())['trains']['demo']['trackname'] == 'Rollbahn'
+        response = get(server, '/trains-delta.json?since=0')
+        assert list(json.loads(response.read())['trains']) == ['demo']
+    finally:
+        server.stop_thread()
+
+
+def test_method_not_allowed() -> None:
+    client, server = start()
+    try:
+        with socket.create_connection(('localhost', server.port), timeout=5) as s:
+            s.sendall(b'POST /trains.json HTTP/1.1\r\nHost: localhost\r\nContent-Length: 20\r\n\r\n'
+                      b'GET / HTTP/1.1\r\n\r\n'
+                      b'GET /trains.json HTTP/1.1\r\nHost: localhost\r\n\r\n')
+            received = b''
+            while data := s.recv(65536):
+                received += data
+        assert received.startswith(b'HTTP/1.1 405 ')
+        assert received.count(b'HTTP/1.1 ') == 1
+    finally:
+        server.stop_thread()
+
+
+def test_metrics() -> None:
+    client, server = start()
+    try:
+        assert get(server, '/metrics').status == 404
+    finally:
+        server.stop_thread()
+    client, server = start(metrics=Metrics())
+    try:
+        client.on_message(None, None, FakeMessage('c3toc/train/demo/pos', POSITION))
+        response = get(server, '/metrics')
+        assert response.getheader('Content-Type').startswith('text/plain; version=0.0.4')
+        assert 'c3toctrack_messages_processed_total{train="demo"} 1' in response.read().decode('utf-8')
+    finally:
+        server.stop_thread()
+
+
+def test_events() -> None:
+    client, server = start()
+    try:
+        with socket.create_connection(('localhost', server.port), timeout=5) as s:
+            s.sendall(b'GET /events HTTP/1.1\r\nHost: localhost\r\n\r\n')
+            received = b''
+            while b': connected\n\n' not in received:
+                received += s.recv(4096)
+            assert b'text/event-stream' in received
+            client.handle_message('c3toc/train/demo/pos', POSITION)
+            received = b''
+            while not received.endswith(b'\n\n'):
+                received += s.recv(4096)
+            (event, data) = received.decode('utf-8').strip().split('\n')
+            assert event == 'event: position'
+            assert json.loads(data[len('data: '):])['name'] == 'demo'
+    finally:
+        server.stop_thread()
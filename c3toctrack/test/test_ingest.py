@@ -0,0 +1,56 @@
+import threading
+
+from c3toctrack.ingest import IngestQueue
+
+
+def test_per_key_order() -> None:
+    seen = {}
+    lock = threading.Lock()
+
+    def handler(key, n):
+        with lock:
+            seen.setdefault(key, []).append(n)
+
+    queue = IngestQueue(handler, maxsize=10000, workers=4)
+    queue.start()
+    for n in range(0, 1000):
+        key = f'train{n % 7}'
+        queue.put(key, key, n)
+    queue.stop()
+    assert sum(len(v) for v in seen.values()) == 1000
+    for key, numbers in seen.items():
+        assert numbers == sorted(numbers)
+    assert queue.stats()['processed'] == 1000
+    assert queue.depth == 0
+
+
+def test_supersede_when_full() -> None:
+    seen = []
+    release = threading.Event()
+    started = threading.Event()
+
+    def handler(key, n):
+        started.set()
+        release.wait()
+        seen.append((key, n))
+
+    queue = IngestQueue(handler, maxsize=2, workers=1)
+    queue.start()
+    assert queue.put('a', 'a', 0, supersede=True)
+    started.wait()
+    # the worker is now blocked on the first item, fill the queue
+    assert queue.put('a', 'a', 1, supersede=True)
+    assert queue.put('b', 'b', 1, supersede=True)
+    assert queue.depth == 2
+    # full: newer positions replace the pending ones, anything else is dropped
+    assert queue.put('a', 'a', 2, supersede=True)
+    assert queue.put('b', 'b', 2, supersede=True)
+    assert not queue.put('c', 'c', 1, supersede=True)
+    assert not queue.put('a', 'a', 'status')
+    release.set()
+    queue.stop()
+    assert seen == [('a', 0), ('a', 2), ('b', 2)]
+    stats = queue.stats()
+    assert stats['superseded'] == 2
+    assert stats['dropped'] == 2
+    assert stats['received'] == 7
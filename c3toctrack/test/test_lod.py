@@ -0,0 +1,42 @@
+from c3toctrack.lod import simplify, tile, tile_bounds, tiles, tolerance
+from c3toctrack.point import Point
+
+
+def test_simplify() -> None:
+    # a straight line along a meridian, with a bump of 5 m at the middle point
+    lats = [53.03 + i * 10 * Point.degree_per_meter_lat for i in range(0, 11)]
+    lons = [13.30] * 11
+    lons[5] += 5 * Point.degree_per_meter_lon
+    assert simplify(lats, lons, 1.0) == [0, 4, 5, 6, 10]
+    assert simplify(lats, lons, 10.0) == [0, 10]
+    assert simplify(lats, lons, 10.0, keep=[3]) == [0, 3, 10]
+    assert simplify(lats, lons, 0.0) == list(range(0, 11))
+    # a loop back to the start keeps its far end
+    assert simplify([53.0, 53.001, 53.0], [13.3, 13.3, 13.3], 1.0) == [0, 1, 2]
+
+
+def test_tolerance() -> None:
+    # about 5.8 m per pixel at zoom 14 at the camp
+    assert 2.8 < tolerance(14, 53.03) < 3.0
+    assert tolerance(12, 53.03) == 4 * tolerance(14, 53.03)
+
+
+def test_tiles() -> None:
+    (x, y) = tile(15, 53.0317, 13.3060)
+    (west, south, east, north) = tile_bounds(15, x, y)
+    assert west <= 13.3060 < east and south <= 53.0317 < north
+    assert tile(15, south - 1e-6, west - 1e-6) == (x - 1, y + 1)
+
+    # a line from the middle of one tile, through the tile to the east, and back
+    lat = (south + north) / 2
+    line = {'type': 'Feature', 'properties': {'name': 'Strecke'}, 'geometry': {
+        'type': 'LineString',
+        'coordinates': [[(west + east) / 2, lat], [east + (east - west) / 2, lat], [west + (east - west) / 4, lat]]}}
+    stop = {'type': 'Feature', 'properties': {'name': 'Halt'},
+            'geometry': {'type': 'Point', 'coordinates': [13.3060, 53.0317]}}
+    cut = tiles([line, stop], 15)
+    assert sorted(cut) == [(x, y), (x + 1, y)]
+    assert cut[(x, y)][0]['geometry'] == line['geometry']
+    assert cut[(x, y)][1] is stop
+    assert cut[(x + 1, y)][0]['geometry'] == line['geometry']
+    assert cut[(x + 1, y)][0]['properties'] == {'name': 'Strecke'}
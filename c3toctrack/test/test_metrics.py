@@ -0,0 +1,59 @@
+from c3toctrack import MqttTrainReporterClient, TracksModel
+from c3toctrack.metrics import Metrics, NullMetrics
+from c3toctrack.replay import Replay, synthetic_stream
+
+
+def test_render() -> None:
+    metrics = Metrics()
+    received = metrics.counter('received_total', 'Messages received', 'train')
+    received.inc('demo')
+    received.inc('demo')
+    received.inc('a"b')
+    assert metrics.counter('received_total', 'Messages received', 'train') is received
+    seconds = metrics.histogram('seconds', 'Time taken', buckets=(0.1, 1.0))
+    seconds.observe(0.05)
+    seconds.observe(0.5)
+    seconds.observe(5)
+    metrics.gauge('depth', 'Queue depth', function=lambda: 3)
+    assert metrics.render().split('\n') == [
+        '# HELP c3toctrack_received_total Messages received',
+        '# TYPE c3toctrack_received_total counter',
+        'c3toctrack_received_total{train="demo"} 2',
+        'c3toctrack_received_total{train="a\\"b"} 1',
+        '# HELP c3toctrack_seconds Time taken',
+        '# TYPE c3toctrack_seconds histogram',
+        'c3toctrack_seconds_bucket{le="0.1"} 1',
+        'c3toctrack_seconds_bucket{le="1"} 2',
+        'c3toctrack_seconds_bucket{le="+Inf"} 3',
+        'c3toctrack_seconds_sum 5.55',
+        'c3toctrack_seconds_count 3',
+        '# HELP c3toctrack_depth Queue depth',
+        '# TYPE c3toctrack_depth gauge',
+        'c3toctrack_depth 3',
+        '',
+    ]
+    other = Metrics()
+    other.histogram('seconds', 'Time taken', buckets=(0.1, 1.0)).merge(metrics.take()['seconds'])
+    assert 'c3toctrack_seconds_count 3' in other.render()
+    assert 'c3toctrack_seconds_count' not in metrics.render()
+
+
+def test_client_metrics() -> None:
+    tracksmodel = TracksModel('data/trainlines.gpx', {})
+    for processes in (0, 2):
+        metrics = Metrics()
+        client = MqttTrainReporterClient(None, None, None, None, tracksmodel, None, None, max_flush_rate=0,
+                                         processes=processes, metrics=metrics)
+        Replay(client).run(synthetic_stream(tracksmodel, trains=2, duration=5))
+        text = metrics.render()
+        assert 'c3toctrack_messages_received_total{train="train0"} 5' in text
+        assert 'c3toctrack_messages_processed_total{train="train1"} 5' in text
+        assert 'c3toctrack_snap_seconds_count 10' in text
+        assert 'c3toctrack_trains 2' in text
+
+
+def test_disabled() -> None:
+    metrics = NullMetrics()
+    metrics.counter('received_total', 'Messages received').inc()
+    metrics.histogram('seconds', 'Time taken').observe(1)
+    assert metrics.render() == ''
@@ -0,0 +1,52 @@
+import random
+
+from c3toctrack import TracksModel
+from c3toctrack.motion import TrainState
+from c3toctrack.point import Point
+from c3toctrack.replay import position_on
+
+
+def drive(model: TracksModel, trackmarkers: list, noise: float = 3.0) -> list:
+    """
+    Feed one fix per second at the given trackmarkers of the Berliner Außenring, and return the states.
+    """
+    rnd = random.Random(5)
+    track = model.tracks['Berliner Außenring']
+    state = None
+    states = []
+    for t, trackmarker in enumerate(trackmarkers):
+        (lat, lon) = position_on(track, trackmarker)
+        lat += rnd.uniform(-noise, noise) * Point.degree_per_meter_lat
+        lon += rnd.uniform(-noise, noise) * Point.degree_per_meter_lon
+        snap = model.snap(lat, lon, None if state is None else state.snap)
+        if state is None:
+            state = TrainState(model, snap, t)
+        else:
+            state.update(model, snap, t)
+        states.append((state.kmh, state.direction, state.heading))
+    return states
+
+
+def test_speed_and_direction() -> None:
+    model = TracksModel('data/trainlines.gpx', {})
+    # 3 m/s forward for a minute
+    states = drive(model, [100 + 3 * t for t in range(0, 60)])
+    speeds = [speed for speed, direction, heading in states[20:]]
+    assert all(8 < speed < 14 for speed in speeds)
+    assert all(direction == 1 for speed, direction, heading in states[1:])
+
+
+def test_standing_train_keeps_direction() -> None:
+    model = TracksModel('data/trainlines.gpx', {})
+    states = drive(model, [100 + 3 * t for t in range(0, 20)] + [160] * 60)
+    assert all(direction == 1 for speed, direction, heading in states[1:])
+    assert states[-1][0] < 2
+
+
+def test_reversing_train() -> None:
+    model = TracksModel('data/trainlines.gpx', {})
+    states = drive(model, [100 + 3 * t for t in range(0, 30)] + [190 - 3 * t for t in range(0, 30)])
+    assert states[25][1] == 1
+    assert states[-1][1] == -1
+    # back where it was at the second fix, now heading the other way
+    assert abs((states[1][2] - states[-1][2]) % 360 - 180) < 30
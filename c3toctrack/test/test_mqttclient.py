@@ -0,0 +1,40 @@
+import time
+
+from c3toctrack import HistoryReader, HistoryWriter, MqttTrainReporterClient, TracksModel
+from c3toctrack.processor import decode
+from c3toctrack.utils import format_timestamp
+
+
+def test_decode() -> None:
+    assert decode('c3toc/train/demo/pos', b'{"lat": 53.0, "lon": 13.3}') == ('demo', {'lat': 53.0, 'lon': 13.3})
+    assert decode('c3toc/train/demo/status', b'online') is None
+
+
+def test_cleanup_drops_stale_trains() -> None:
+    client = MqttTrainReporterClient(None, None, None, None, TracksModel('data/trainlines.gpx', {}), None, None,
+                                     max_flush_rate=0)
+    now = time.time()
+    for name, t in (('old', now - 700), ('new', now - 60)):
+        payload = f'{{"lat": 53.0305331, "lon": 13.3042594, "ts": "{format_timestamp(t)}"}}'
+        client.handle_message(f'c3toc/train/{name}/pos', payload.encode('utf-8'))
+    client.handle_message('c3toc/train/broken/pos', b'{')
+    assert client.stats()['messages'] == {'received': 0, 'processed': 2, 'errors': 1}
+    client.cleanup()
+    client.writer.stop()
+    assert list(client.trains['trains'].keys()) == ['new']
+    assert list(client.timestamps.keys()) == ['new']
+
+
+def test_stop_writes_history(tmp_path) -> None:
+    history = HistoryWriter(str(tmp_path))
+    client = MqttTrainReporterClient(None, None, None, None, TracksModel('data/trainlines.gpx', {}), None, None,
+                                     max_flush_rate=0, history=history)
+    now = time.time()
+    for t in (now - 20, now - 10):
+        payload = f'{{"lat": 53.0305331, "lon": 13.3042594, "ts": "{format_timestamp(t)}"}}'
+        client.handle_message('c3toc/train/demo/pos', payload.encode('utf-8'))
+    # the first position is written right away, the second one is buffered
+    assert len(HistoryReader(str(tmp_path)).read()) == 1
+    client.stop()
+    records = HistoryReader(str(tmp_path)).read()
+    assert list(records['train']) == [b'demo', b'demo']
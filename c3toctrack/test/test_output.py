@@ -0,0 +1,43 @@
+import gzip
+import json
+import os
+
+import pytest
+
+from c3toctrack.output import COMPRESSORS, OutputFormat
+
+DATA = {'trains': {'Zug': {'lat': 53.0305, 'lon': 13.3042, 'name': 'Hp GH Himmel'}}, 'seq': 3}
+
+
+def test_dumps() -> None:
+    assert OutputFormat().dumps(DATA) == json.dumps(DATA, ensure_ascii=False, sort_keys=True, indent=2)
+    assert OutputFormat(pretty=False).dumps(DATA) == \
+           json.dumps(DATA, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    # keys that are not strings, like the trackmarkers of the waypoints
+    waypoints = {918: 'b', 1704: 'a'}
+    assert OutputFormat().dumps(waypoints) == json.dumps(waypoints, sort_keys=True, indent=2)
+
+
+def test_write(tmp_path) -> None:
+    filename = str(tmp_path / 'trains.json')
+    output_format = OutputFormat(pretty=False, gzip=True)
+    data = output_format.dumps(DATA)
+    assert output_format.write(filename, data)
+    with gzip.open(filename + '.gz') as f:
+        assert json.load(f) == DATA
+    assert json.loads((tmp_path / 'trains.json').read_text()) == DATA
+    mtime = os.stat(filename).st_mtime_ns
+    assert not output_format.write(filename, data, only_if_changed=True)
+    assert os.stat(filename).st_mtime_ns == mtime
+    # the copy is no longer written, and removed so it cannot be served with old contents
+    assert OutputFormat(pretty=False).write(filename, data, only_if_changed=True)
+    assert not os.path.exists(filename + '.gz')
+    # and written again if missing
+    assert output_format.write(filename, data, only_if_changed=True)
+    assert os.path.exists(filename + '.gz')
+
+
+@pytest.mark.skipif(COMPRESSORS['.br'] is not None, reason='brotli is installed')
+def test_brotli_missing() -> None:
+    with pytest.raises(ValueError):
+        OutputFormat(brotli=True)
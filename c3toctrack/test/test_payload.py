@@ -0,0 +1,76 @@
+import json
+import time
+from datetime import datetime
+
+import pytest
+
+from c3toctrack import MqttTrainReporterClient, TracksModel
+from c3toctrack.payload import HEADER, FIX, decode, encode
+from c3toctrack.processor import decode_batch, position_times
+from c3toctrack.replay import position_on
+
+fixes = [(1692000000, 53.0305331, 13.3042594, 9, 10.8), (1692000002, 53.0305872, 13.3043011, 10, 11.3)]
+
+
+def test_round_trip() -> None:
+    payload = encode(fixes, vbat=4.12, vbus=5.03, rssi=-67, bssid='a4:2b:b0:01:02:ff')
+    assert len(payload) == HEADER.size + 2 * FIX.size == 43
+    positions = decode(payload)
+    assert positions[1] == {'lat': 53.0305872, 'lon': 13.3043011, 'sat': 10, 'speed': 11.3, 'time': 1692000002,
+                            'Vbat': 4.12, 'Vbus': 5.03, 'rssi': -67, 'bssid': 'A4:2B:B0:01:02:FF'}
+    assert [pos['time'] for pos in positions] == [1692000000, 1692000002]
+    assert decode_batch('c3toc/train/demo/fixes', payload) == ('demo', positions)
+    assert decode_batch('c3toc/train/demo/pos', b'{"lat": 53.0}') == ('demo', [{'lat': 53.0}])
+    assert decode_batch('c3toc/train/demo/status', b'online') is None
+
+
+def test_position_times() -> None:
+    positions = [{'time': 1692000058}, {'time': 1692000061}, {'ts': '2023-08-14T08:01:03Z'}, {'time': 1692000064}]
+    assert position_times(positions) == [('2023-08-14T08:00:58Z', 1692000058), ('2023-08-14T08:01:01Z', 1692000061),
+                                         ('2023-08-14T08:01:03Z', 1692000063.0), ('2023-08-14T08:01:04Z', 1692000064)]
+    assert positions == [{}, {}, {}, {}]
+    # without an offset, the time is in UTC; a time that cannot be parsed is replaced by the time it is processed
+    ((formatted, t),) = position_times([{'ts': '2023-08-14T08:01:03'}])
+    assert (formatted, t) == ('2023-08-14T08:01:03', 1692000063.0)
+    ((formatted, t),) = position_times([{'ts': 'yesterday'}])
+    assert abs(t - time.time()) < 5
+    assert datetime.fromisoformat(formatted).timestamp() == t
+
+
+def test_invalid() -> None:
+    payload = encode(fixes)
+    with pytest.raises(ValueError):
+        decode(payload[:-1])
+    with pytest.raises(ValueError):
+        decode(payload[:5])
+    with pytest.raises(ValueError):
+        decode(b'\x02' + payload[1:])
+    with pytest.raises(ValueError):
+        encode([])
+
+
+def test_client_processes_batches() -> None:
+    tracksmodel = TracksModel('data/trainlines.gpx', {})
+    track = tracksmodel.tracks['Marschbahn']
+    binary = MqttTrainReporterClient(None, None, None, None, tracksmodel, None, None, max_flush_rate=0)
+    single = MqttTrainReporterClient(None, None, None, None, tracksmodel, None, None, max_flush_rate=0)
+    seen = []
+    binary.add_listener(lambda name, pos: seen.append(pos['timestamp']))
+    batch = []
+    for i in range(0, 10):
+        (lat, lon) = position_on(track, 10.0 + 5 * i)
+        batch.append((1692000000 + 2 * i, lat, lon, 9, 9.0))
+        if len(batch) == 5:
+            binary.handle_message('c3toc/train/demo/fixes', encode(batch))
+            batch = []
+        pos = {'lat': round(lat, 7), 'lon': round(lon, 7), 'sat': 9, 'speed': 9.0,
+               'ts': f'2023-08-14T08:00:{2 * i:02d}Z'}
+        single.handle_message('c3toc/train/demo/pos', json.dumps(pos).encode('utf-8'))
+    binary.handle_message('c3toc/train/demo/fixes', b'\x01\x05')
+    binary.writer.stop()
+    single.writer.stop()
+    assert binary.stats()['messages'] == {'received': 0, 'processed': 10, 'errors': 1}
+    assert seen == [f'2023-08-14T08:00:{2 * i:02d}Z' for i in range(0, 10)]
+    train = binary.trains['trains']['demo']
+    for key in ('trackmarker', 'trackname', 'speed', 'dir', 'timestamp', 'next_stop'):
+        assert train[key] == single.trains['trains']['demo'][key]
@@ -0,0 +1,39 @@
+import json
+
+from c3toctrack import HistoryWriter, MqttTrainReporterClient, TracksModel
+from c3toctrack.replay import Replay, history_stream, synthetic_stream
+
+
+def make_client(tmp_path, tracksmodel: TracksModel, **kwargs) -> MqttTrainReporterClient:
+    return MqttTrainReporterClient(None, None, None, None, tracksmodel, str(tmp_path / 'trains.json'),
+                                   str(tmp_path / 'trains.geojson'), **kwargs)
+
+
+def test_synthetic_replay(tmp_path) -> None:
+    tracksmodel = TracksModel('data/trainlines.gpx', {})
+    client = make_client(tmp_path, tracksmodel, max_flush_rate=0)
+    report = Replay(client).run(synthetic_stream(tracksmodel, trains=5, duration=20))
+    assert report['messages'] == 100
+    assert report['stages']['snap']['calls'] == 100
+    assert report['stages']['eta']['calls'] == 100
+    assert report['stages']['serialize']['calls'] == 200
+    assert report['rate'] > 20
+    assert report['latency']['p50'] <= report['latency']['p99'] <= report['latency']['max']
+    with open(tmp_path / 'trains.json') as f:
+        assert len(json.load(f)['trains']) == 5
+    # the stages are no longer timed after the replay
+    assert 'snap' not in vars(tracksmodel)
+
+
+def test_history_replay(tmp_path) -> None:
+    tracksmodel = TracksModel('data/trainlines.gpx', {})
+    history = HistoryWriter(str(tmp_path / 'history'))
+    client = make_client(tmp_path, tracksmodel, history=history)
+    Replay(client).run(synthetic_stream(tracksmodel, trains=3, duration=10))
+    history.close()
+
+    replayed = make_client(tmp_path, tracksmodel, ingest_workers=2)
+    report = Replay(replayed).run(history_stream(str(tmp_path / 'history')))
+    assert report['messages'] == 30
+    assert report['client']['ingest']['received'] == 30
+    assert sorted(replayed.trains['trains'].keys()) == ['train0', 'train1', 'train2']
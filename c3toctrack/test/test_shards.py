@@ -0,0 +1,36 @@
+from c3toctrack import MqttTrainReporterClient, TracksModel
+from c3toctrack.replay import Replay, synthetic_stream
+from c3toctrack.shards import ShardPool
+
+
+def test_same_results_as_one_process() -> None:
+    tracksmodel = TracksModel('data/trainlines.gpx', {})
+    messages = list(synthetic_stream(tracksmodel, trains=6, duration=20, start=1692000000))
+    single = MqttTrainReporterClient(None, None, None, None, tracksmodel, None, None, max_flush_rate=0)
+    Replay(single).run(messages)
+    sharded = MqttTrainReporterClient(None, None, None, None, tracksmodel, None, None, max_flush_rate=0,
+                                      processes=3)
+    report = Replay(sharded).run(messages)
+    assert report['client']['shards'] == {'processes': 3, 'received': 120, 'processed': 120, 'errors': 0}
+    assert report['client']['messages']['processed'] == 120
+    assert sharded.trains['trains'] == single.trains['trains']
+
+
+def test_errors_and_order() -> None:
+    results = []
+    errors = []
+    pool = ShardPool(TracksModel('data/trainlines.gpx', {}), 2,
+                     lambda name, batch: results.extend((name, pos) for pos, timestamp in batch),
+                     lambda topic, message: errors.append(topic), batch_size=4)
+    pool.start()
+    for n in range(0, 10):
+        for name in ('a', 'b', 'c'):
+            payload = f'{{"lat": 53.0305331, "lon": 13.3042594, "ts": "2023-08-15T12:00:{n:02d}Z"}}'
+            pool.put(name, f'c3toc/train/{name}/pos', payload.encode('utf-8'))
+    pool.put('d', 'c3toc/train/d/pos', b'not json')
+    pool.stop()
+    assert errors == ['c3toc/train/d/pos']
+    assert pool.stats() == {'processes': 2, 'received': 31, 'processed': 31, 'errors': 1}
+    for name in ('a', 'b', 'c'):
+        timestamps = [pos['timestamp'] for n, pos in results if n == name]
+        assert timestamps == sorted(timestamps) and len(timestamps) == 10
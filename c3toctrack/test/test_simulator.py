@@ -0,0 +1,75 @@
+import json
+import time
+
+from c3toctrack import MqttTrainReporterClient, TracksModel
+from c3toctrack.broker import LocalBroker
+from c3toctrack.processor import decode_batch
+from c3toctrack.simulator import FleetSimulator, publish
+
+tracksmodel = TracksModel('data/trainlines.gpx', {})
+
+
+def test_messages() -> None:
+    simulator = FleetSimulator(tracksmodel, trains=20, interval=5.0, noise=0.0, dropout=0.0)
+    messages = list(simulator.messages(600, start=1692000000))
+    assert [t for t, topic, payload in messages] == sorted(t for t, topic, payload in messages)
+    positions = {}
+    for t, topic, payload in messages:
+        decoded = decode_batch(topic, payload)
+        if decoded is not None:
+            positions.setdefault(decoded[0], []).extend(decoded[1])
+        else:
+            assert payload.startswith(b'alive ')
+    assert len(positions) == 20
+    assert all(len(fixes) == 120 for fixes in positions.values())
+    for train in simulator.trains:
+        fixes = positions[train.name]
+        for pos in fixes:
+            assert tracksmodel.snap(pos['lat'], pos['lon']).distance < 1.0
+        # standing at the stops on its track for a few fixes each
+        standing = [pos for pos in fixes if pos['speed'] == 0]
+        assert (len(standing) > 0) == (len(train.stops) > 0)
+        assert all(8.0 <= pos['speed'] <= 15.0 for pos in fixes if pos['speed'] > 0)
+
+
+def test_dropouts_and_binary() -> None:
+    def positions(**kwargs) -> int:
+        simulator = FleetSimulator(tracksmodel, trains=10, status=False, **kwargs)
+        return sum(len(decode_batch(topic, payload)[1]) for t, topic, payload in simulator.messages(300))
+
+    assert positions(dropout=0.0) == 300
+    assert positions(dropout=1.0) == 0
+    assert 150 < positions(dropout=0.1) < 300
+    simulator = FleetSimulator(tracksmodel, trains=10, status=False, dropout=0.0, fixes_per_message=5)
+    messages = list(simulator.messages(300))
+    assert len(messages) == 60
+    assert all(topic.endswith('/fixes') and len(decode_batch(topic, payload)[1]) == 5
+               for t, topic, payload in messages)
+
+
+def test_publish() -> None:
+    broker = LocalBroker()
+    broker.start_thread()
+    client = MqttTrainReporterClient(broker.host, None, None, 'c3toc/train/#', tracksmodel, None, None,
+                                     max_flush_rate=0, port=broker.port)
+    client.start()
+    try:
+        while broker.subscribers('c3toc/train/x/pos') == 0:
+            time.sleep(0.01)
+        simulator = FleetSimulator(tracksmodel, trains=10, dropout=0.0)
+        reports = []
+        stats = publish(simulator.messages(60), broker.host, broker.port, connections=3, rate=200,
+                        report=reports.append, max_backlog=5)
+        assert stats['sent'] == 120
+        assert stats['backlog'] == 0
+        assert all(0 <= report['backlog'] <= 15 for report in reports)
+        assert 0.4 < stats['seconds'] < 5
+        deadline = time.time() + 10
+        while client.processed < 60 and time.time() < deadline:
+            time.sleep(0.01)
+        assert client.processed == 60
+        assert len(client.trains['trains']) == 10
+    finally:
+        client.stop()
+        broker.stop_thread()
+    assert json.loads(client.trains_to_json())['trains'].keys() == client.trains['trains'].keys()
@@ -0,0 +1,56 @@
+import time
+
+from c3toctrack import MqttTrainReporterClient, TracksModel
+from c3toctrack.crossings import CrossingMonitor
+from c3toctrack.replay import Replay, synthetic_stream
+from c3toctrack.snapshot import read_snapshot
+
+tracksmodel = TracksModel('data/trainlines.gpx', {})
+
+
+def client(filename: str, **kwargs) -> MqttTrainReporterClient:
+    return MqttTrainReporterClient(None, None, None, None, tracksmodel, None, None, max_flush_rate=0,
+                                   snapshot=filename, **kwargs)
+
+
+def test_restore(tmp_path) -> None:
+    filename = str(tmp_path / 'trains.snapshot')
+    before = client(filename, crossings=CrossingMonitor(tracksmodel))
+    assert before.trains['trains'] == {}
+    Replay(before).run(synthetic_stream(tracksmodel, trains=5, duration=30, start=time.time() - 60))
+    before.stop()
+    assert read_snapshot(filename)['trains'] == before.trains['trains']
+
+    after = client(filename, crossings=CrossingMonitor(tracksmodel))
+    after.writer.stop()
+    assert after.trains['trains'].keys() == before.trains['trains'].keys()
+    for name, pos in after.trains['trains'].items():
+        assert pos == dict(before.trains['trains'][name], stale=True)
+        assert after.timestamps[name] == before.timestamps[name]
+        assert after.processor.tracking[name].direction == before.processor.tracking[name].direction
+        assert after.processor.tracking[name].heading == pos['dir']
+    assert after.crossings.snapshot() == before.crossings.snapshot()
+    # written out right away
+    assert after.delta.since(0)['trains'].keys() == after.trains['trains'].keys()
+
+    # the next position replaces the restored one
+    name = next(iter(after.trains['trains']))
+    after.process_position(name, {'lat': 53.0305331, 'lon': 13.3042594})
+    assert 'stale' not in after.trains['trains'][name]
+
+
+def test_expired_and_broken(tmp_path) -> None:
+    filename = str(tmp_path / 'trains.snapshot')
+    before = client(filename)
+    Replay(before).run(synthetic_stream(tracksmodel, trains=3, duration=10, start=time.time() - 1000))
+    before.stop()
+    assert len(read_snapshot(filename)['trains']) == 3
+    after = client(filename)
+    after.writer.stop()
+    assert after.trains['trains'] == {}
+
+    with open(filename, 'wb') as f:
+        f.write(b'not a snapshot')
+    assert read_snapshot(filename) is None
+    assert client(filename).restore_snapshot() == 0
+    assert read_snapshot(str(tmp_path / 'missing')) is None
@@ -0,0 +1,58 @@
+import random
+
+import numpy as np
+
+from c3toctrack import TracksModel
+
+
+def random_positions(n: int) -> tuple:
+    rnd = random.Random(1)
+    lats = [53.0290 + rnd.random() * 0.0050 for i in range(0, n)]
+    lons = [13.3020 + rnd.random() * 0.0110 for i in range(0, n)]
+    return lats, lons
+
+
+def test_snap_matches_exhaustive_search() -> None:
+    """
+    The grid must find the same segment as looking at every segment.
+    """
+    model = TracksModel('data/trainlines.gpx', {})
+    index = model.index
+    lats, lons = random_positions(500)
+    px, py = index.to_meters(np.array(lats), np.array(lons))
+    d, m = index.project(np.arange(0, len(index)), px, py)
+    for i in range(0, len(lats)):
+        snap = model.snap(lats[i], lons[i])
+        assert snap.segment == np.argmin(d[i])
+        assert snap.distance == d[i].min()
+
+
+def test_snap_many_matches_snap() -> None:
+    model = TracksModel('data/trainlines.gpx', {})
+    lats, lons = random_positions(500)
+    batch = model.snap_many(lats, lons)
+    for i in range(0, len(lats)):
+        snap = model.snap(lats[i], lons[i])
+        assert snap.trackname == batch.trackname[i]
+        assert snap.segment == batch.segment[i]
+        assert snap.trackmarker == batch.trackmarker[i]
+        assert snap.distance == batch.distance[i]
+
+
+def test_snap_far_away() -> None:
+    model = TracksModel('data/trainlines.gpx', {})
+    snap = model.snap(53.2, 13.5)
+    assert snap is not None
+    assert snap.distance > 10000
+
+
+def test_snap_waypoint() -> None:
+    model = TracksModel('data/trainlines.gpx', {})
+    for track in model.tracks.values():
+        for point in track.points:
+            if point.waypoint is not None and point.waypoint.is_stop():
+                snap = model.snap(point.lat, point.lon)
+                assert snap.distance < 0.01
+                # stops at the end of a track are also the start of the next track
+                if snap.trackname == track.name:
+                    assert int(snap.trackmarker) == point.waypoint.trackmarker
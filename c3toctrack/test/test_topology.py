@@ -0,0 +1,83 @@
+from c3toctrack import TracksModel
+from c3toctrack.replay import position_on
+
+
+def edge_on(model: TracksModel, trackname: str, trackmarker: float) -> int:
+    for edge in model.graph.edges:
+        if edge.trackname == trackname and edge.start <= trackmarker <= edge.end:
+            return edge.id
+    raise KeyError(trackname)
+
+
+def test_tracks_are_split_at_turnouts() -> None:
+    model = TracksModel('data/trainlines.gpx', {})
+    graph = model.graph
+    rollbahn = [edge for edge in graph.edges if edge.trackname == 'Rollbahn']
+    assert [(edge.first, edge.last) for edge in rollbahn] == [(0, 32), (32, 39)]
+    assert graph.node_names[rollbahn[0].nodes[1]] == 'W201'
+    # every segment belongs to exactly one edge
+    assert (graph.edge_of_segment >= 0).all()
+
+
+def test_next_stop_in_both_directions() -> None:
+    model = TracksModel('data/trainlines.gpx', {})
+    graph = model.graph
+    edge = edge_on(model, 'Berliner Außenring', 100)
+    (stop, distance) = graph.next_stop(edge, 100, 1)
+    assert stop.name == 'Ständeamt'
+    assert abs(distance - (model.tracks['Berliner Außenring'].trackmarkers[16] - 100)) < 1e-6
+    (stop, distance) = graph.next_stop(edge, 100, -1)
+    assert stop.name == 'Ziegeleimuseum'
+    # past the last stop of a track, the search continues on the next track instead of wrapping to the first stop
+    (stop, distance) = graph.next_stop(edge, 700, 1)
+    assert stop.name == 'Milliways'
+    assert graph.distance_to(edge, 700, 1, stop) == distance
+    stops = [stop.name for stop, distance in graph.upcoming(edge, 700, 1)]
+    assert stops[:3] == ['Milliways', 'Spielplatz', 'Chillfloor']
+    assert len(stops) == len(set(stops))
+
+
+def test_end_of_line() -> None:
+    model = TracksModel('data/trainlines.gpx', {})
+    graph = model.graph
+    edge = edge_on(model, 'Werkstatt', 50)
+    # the Werkstatt is a dead end, the train has to come back to the Rollbahn
+    (stop, distance) = graph.next_stop(edge, 50, 1)
+    assert stop.name == 'Alte Werkstätten'
+    assert distance > (graph.edges[edge].end - 50) * 2
+
+
+def test_advance() -> None:
+    model = TracksModel('data/trainlines.gpx', {})
+    graph = model.graph
+    baederbahn = edge_on(model, 'Bäderbahn', 200)
+    length = graph.edges[baederbahn].end
+    ring = edge_on(model, 'Berliner Außenring', 10)
+    y = edge_on(model, 'Y-Trasse', 10)
+    assert graph.advance(ring, 10, 1, ring, 20) == (10, 1)
+    assert graph.advance(ring, 20, 1, ring, 10) == (-10, 1)
+    assert graph.advance(ring, 20, -1, ring, 10) == (10, -1)
+    (moved, direction) = graph.advance(baederbahn, 220, 1, ring, 5)
+    assert abs(moved - (length - 220 + 5)) < 1e-6 and direction == 1
+    (moved, direction) = graph.advance(ring, 5, -1, baederbahn, 220)
+    assert abs(moved - (length - 220 + 5)) < 1e-6 and direction == -1
+    # backwards over the node behind the train
+    (moved, direction) = graph.advance(ring, 5, 1, baederbahn, 220)
+    assert abs(moved + (length - 220 + 5)) < 1e-6 and direction == 1
+    # parallel edges share both nodes; the train continues through the node it was heading for
+    (moved, direction) = graph.advance(ring, 780, 1, y, 135)
+    assert direction == -1 and 0 < moved < 20
+    assert graph.advance(ring, 10, 1, edge_on(model, 'Werkstatt', 10), 10) is None
+
+
+def test_snap_near_previous_position() -> None:
+    model = TracksModel('data/trainlines.gpx', {})
+    track = model.tracks['Berliner Außenring']
+    (lat, lon) = position_on(track, 300)
+    previous = model.snap(lat, lon)
+    (lat, lon) = position_on(track, 310)
+    snap = model.snap(lat, lon, previous)
+    assert snap == model.snap(lat, lon)
+    # a position far away from the edges near the previous one falls back to searching everything
+    (lat, lon) = position_on(model.tracks['Rollbahn'], 300)
+    assert model.snap(lat, lon, previous) == model.snap(lat, lon)
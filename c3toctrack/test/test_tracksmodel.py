@@ -0,0 +1,118 @@
+import gzip
+import json
+import os
+
+from c3toctrack import TracksModel
+from c3toctrack import output
+from c3toctrack.output import OutputFormat
+
+
+def test_cache(tmp_path) -> None:
+    cache = str(tmp_path / 'cache')
+    model = TracksModel.cached('data/trainlines.gpx', {'Marschbahn': 1704}, cache)
+    (snapshot,) = os.listdir(cache)
+    cached = TracksModel.cached('data/trainlines.gpx', {'Marschbahn': 1704}, cache)
+    assert os.listdir(cache) == [snapshot]
+    assert sorted(cached.waypoints) == sorted(model.waypoints)
+    assert cached.snap(53.0305, 13.3042) == model.snap(53.0305, 13.3042)
+    # different starts make a new snapshot, and replace the old one
+    TracksModel.cached('data/trainlines.gpx', {'Marschbahn': 1700}, cache)
+    assert len(os.listdir(cache)) == 1
+    assert os.listdir(cache) != [snapshot]
+
+
+def test_write_only_when_changed(tmp_path) -> None:
+    model = TracksModel('data/trainlines.gpx', {})
+    for write, name in ((model.write_json, 'tracks.json'), (model.write_geojson, 'tracks.geojson'),
+                        (model.write_station_table, 'stations.dokuwiki')):
+        filename = str(tmp_path / name)
+        assert write(filename)
+        mtime = os.stat(filename).st_mtime_ns
+        assert not write(filename)
+        assert os.stat(filename).st_mtime_ns == mtime
+
+
+def test_track_points() -> None:
+    model = TracksModel('data/trainlines.gpx', {'Marschbahn': 1704})
+    track = model.tracks['Marschbahn']
+    points = track.points
+    assert len(points) == len(track) > 1
+    assert points[0].trackmarker == 1704
+    assert points[-1].trackmarker == track.trackmarkers[-1]
+    assert points[1].trackmarker == points[0].trackmarker + points[1].step
+    stops = [point.waypoint for point in points if point.waypoint is not None]
+    assert stops == [waypoint for i, waypoint in sorted(track.waypoints.items())]
+
+
+def test_to_json_keys() -> None:
+    model = TracksModel('data/trainlines.gpx', {})
+    tracks = json.loads(model.to_json())['tracks']
+    point = tracks['Marschbahn']['points'][0]
+    assert sorted(point) == ['distance', 'lat', 'lon', 'trackmarker', 'waypoint']
+    waypoint = next(point['waypoint'] for point in tracks['Marschbahn']['points'] if point['waypoint'] is not None)
+    assert sorted(waypoint) == ['ds100', 'lat', 'lon', 'name', 'trackmarker', 'type']
+
+
+def test_load_osm(tmp_path, caplog) -> None:
+    gpx = TracksModel('data/trainlines.gpx', {'Marschbahn': 1704})
+    osm = TracksModel('data/trainlines.osm', {'Marschbahn': 1704})
+    assert list(osm.tracks) == list(gpx.tracks)
+    for name, track in gpx.tracks.items():
+        assert len(osm.tracks[name]) == len(track)
+        assert abs(osm.tracks[name].trackmarkers[-1] - track.trackmarkers[-1]) < 0.01
+    assert [(w.type, w.ds100, w.name) for w in osm.waypoints.values()] == \
+           [(w.type, w.ds100, w.name) for w in gpx.waypoints.values()]
+    # names without type, with the type in the railway tag
+    filename = tmp_path / 'tagged.osm'
+    filename.write_text("""<?xml version='1.0' encoding='UTF-8'?>
+<osm version='0.6'>
+  <node id='1' lat='53.0300' lon='13.3030'><tag k='name' v='Himmel' /><tag k='railway' v='halt' />
+    <tag k='railway:ref' v='GH' /></node>
+  <node id='2' lat='53.0301' lon='13.3030'><tag k='name' v='W1' /><tag k='railway' v='switch' /></node>
+  <node id='3' lat='53.0302' lon='13.3030'><tag k='railway' v='level_crossing' /></node>
+  <node id='4' lat='53.0300' lon='13.3040'><tag k='name' v='Bäckerei' /><tag k='shop' v='bakery' /></node>
+  <way id='1'><nd ref='1' /><nd ref='2' /><nd ref='3' /><tag k='name' v='Strecke' />
+    <tag k='railway' v='narrow_gauge' /></way>
+  <way id='2'><nd ref='3' /><nd ref='4' /><tag k='name' v='Straße' /><tag k='highway' v='service' /></way>
+  <node id='6' lat='53.0310' lon='13.3030' />
+  <way id='3'><nd ref='6' /><nd ref='5' /><tag k='name' v='Abgeschnitten' /><tag k='railway' v='narrow_gauge' /></way>
+</osm>
+""", encoding='utf-8')
+    model = TracksModel(str(filename), {})
+    assert list(model.tracks) == ['Strecke', 'Abgeschnitten']
+    # node 5 is outside of the exported area
+    assert len(model.tracks['Abgeschnitten']) == 1
+    assert 'references node 5' in caplog.text
+    assert [(w.type, w.ds100, w.name) for w in model.waypoints.values()] == [('Hp', 'GH', 'Himmel'), ('W', None, 'W1')]
+
+
+def test_write_lod(tmp_path) -> None:
+    model = TracksModel('data/trainlines.gpx', {})
+    assert model.write_lod(str(tmp_path), tiles=True) > 5
+    assert json.loads((tmp_path / 'tracks.min.json').read_text()) == json.loads(model.to_json())
+    with gzip.open(tmp_path / 'tracks.min.geojson.gz') as f:
+        assert json.load(f) == json.loads(model.to_geojson())
+    full = json.loads(model.to_geojson())['features']
+    simplified = json.loads((tmp_path / 'tracks-z14.geojson').read_text())['features']
+    assert len(simplified) == len(full)
+    assert sum(len(f['geometry']['coordinates']) for f in simplified if f['geometry']['type'] == 'LineString') < \
+           sum(len(f['geometry']['coordinates']) for f in full if f['geometry']['type'] == 'LineString')
+    tiles = sorted(str(p.relative_to(tmp_path)) for p in tmp_path.glob('tiles/*/*/*.geojson'))
+    assert [t.split('/')[1] for t in tiles].count('15') > 1
+    # nothing is written again, and tiles that are no longer needed are removed
+    (tmp_path / 'tiles' / '15' / '0').mkdir()
+    (tmp_path / 'tiles' / '15' / '0' / '0.geojson').write_text('{}')
+    assert model.write_lod(str(tmp_path), tiles=True) == 0
+    assert sorted(str(p.relative_to(tmp_path)) for p in tmp_path.glob('tiles/*/*/*.geojson')) == tiles
+
+
+def test_write_lod_brotli(tmp_path, monkeypatch) -> None:
+    # a stand-in for the brotli package, which may not be installed
+    monkeypatch.setitem(output.COMPRESSORS, '.br', lambda data: b'br' + data)
+    model = TracksModel('data/trainlines.gpx', {})
+    output_format = OutputFormat(pretty=False, gzip=True, brotli=True)
+    assert model.write_lod(str(tmp_path), tiles=True, output_format=output_format) > 5
+    tiles = list(tmp_path.glob('tiles/*/*/*.geojson'))
+    assert len(tiles) > 1
+    assert all(os.path.exists(f'{tile}.br') and os.path.exists(f'{tile}.gz') for tile in tiles)
+    assert model.write_lod(str(tmp_path), tiles=True, output_format=output_format) == 0
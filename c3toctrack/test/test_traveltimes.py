@@ -0,0 +1,101 @@
+from datetime import datetime
+
+from c3toctrack import HistoryReader, HistoryWriter, TracksModel
+from c3toctrack.eta import EtaEngine
+from c3toctrack.motion import TrainState
+from c3toctrack.replay import position_on
+from c3toctrack.traveltimes import RollingQuantiles, SegmentStatistics
+
+
+def trip(stops: list, start: float = 1692000000.0) -> list:
+    """
+    Positions of a train that stays at each stop for 30 s, and takes 100 s in a straight line from one stop to the
+    next, one per second.
+    :return: a list of tuples of timestamp, latitude and longitude
+    """
+    positions = []
+    t = start
+    for a, b in zip(stops, stops[1:]):
+        for i in range(0, 30):
+            positions.append((t, a.lat, a.lon))
+            t += 1
+        for i in range(0, 100):
+            positions.append((t, a.lat + (b.lat - a.lat) * i / 100, a.lon + (b.lon - a.lon) * i / 100))
+            t += 1
+    positions.append((t, stops[-1].lat, stops[-1].lon))
+    return positions
+
+
+def standing_train(model: TracksModel, trackname: str, trackmarker: float) -> TrainState:
+    (lat, lon) = position_on(model.tracks[trackname], trackmarker)
+    state = TrainState(model, model.snap(lat, lon), 1692000000.0)
+    state.direction = 1
+    return state
+
+
+def test_rolling_quantiles() -> None:
+    q = RollingQuantiles(half_life=10)
+    assert q.median is None
+    for value in range(100, 201):
+        q.add(value)
+    assert 145 < q.quantile(0.1) < 195 < q.quantile(0.9) < 205
+    # the recent values count more, so the quantiles follow a change quickly
+    for i in range(0, 50):
+        q.add(60)
+    assert 57 < q.median < 63
+    many = RollingQuantiles(half_life=10)
+    many.add_many(list(range(100, 201)) + [60] * 50)
+    assert abs(many.median - q.median) < 1e-6
+    assert many.count == q.count == 151
+
+
+def test_legs_and_dwells() -> None:
+    model = TracksModel('data/trainlines.gpx', {})
+    (a, b, c) = model.stops.stops[:3]
+    statistics = SegmentStatistics(model)
+    for t, lat, lon in trip([a, b, c]):
+        statistics.record('demo', t, lat, lon, 1.0)
+    # from the last position within 15 m of a to the first within 15 m of b
+    assert 80 < statistics.leg(a, b) < 95
+    assert statistics.leg(b, a) is None
+    assert 33 < statistics.dwell(b) < 45
+    assert 0.95 < statistics.speed() < 1.05
+    rows = statistics.summary()
+    assert [(row['kind'], row['origin'], row['destination']) for row in rows] == \
+           [('leg', a.name, b.name), ('leg', b.name, c.name), ('dwell', a.name, a.name), ('dwell', b.name, b.name)]
+
+    # nothing is measured across a gap in the positions
+    statistics = SegmentStatistics(model, max_gap=60)
+    for t, lat, lon in trip([a, b]):
+        if not 1692000040 < t < 1692000120:
+            statistics.record('demo', t, lat, lon, 1.0)
+    assert statistics.legs == {}
+
+
+def test_from_history(tmp_path) -> None:
+    model = TracksModel('data/trainlines.gpx', {})
+    stops = model.stops.stops[:5]
+    live = SegmentStatistics(model)
+    writer = HistoryWriter(str(tmp_path))
+    for n, train in enumerate(('one', 'two', 'three')):
+        for t, lat, lon in trip(stops if n != 1 else stops[::-1], 1692000000.0 + n * 7):
+            live.record(train, t, lat, lon, 12.0 / 3.6)
+            writer.append(train, t, lat, lon, 0, 12.0)
+    writer.close()
+    batch = SegmentStatistics.from_history(model, HistoryReader(str(tmp_path)))
+    assert len(batch.legs) == len(live.legs) == 8
+    for key, q in live.legs.items():
+        assert abs(batch.legs[key].median - q.median) < 1e-6
+    for key, q in live.dwells.items():
+        assert abs(batch.dwells[key].median - q.median) < 1e-6
+    assert abs(batch.speed() - live.speed()) < 1e-6
+
+
+def test_standing_train_eta() -> None:
+    model = TracksModel('data/trainlines.gpx', {})
+    statistics = SegmentStatistics(model)
+    statistics.speeds.add_many([2.0] * 10)
+    state = standing_train(model, 'Berliner Außenring', 100)
+    upcoming = EtaEngine(model, statistics).upcoming(state)
+    eta = datetime.fromisoformat(upcoming[0]['eta']).timestamp()
+    assert abs(eta - (state.timestamp + upcoming[0]['distance'] / 2.0)) <= 1.5
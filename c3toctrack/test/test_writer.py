@@ -0,0 +1,55 @@
+import time
+
+from c3toctrack.writer import CoalescingWriter
+
+
+def test_immediate() -> None:
+    calls = []
+    writer = CoalescingWriter(lambda: calls.append(1), max_rate=0)
+    writer.start()
+    for i in range(0, 5):
+        writer.mark_dirty()
+    assert len(calls) == 5
+    assert writer.stats() == {'changes': 5, 'flushes': 5, 'coalesced': 0, 'errors': 0}
+
+
+def test_burst_is_coalesced() -> None:
+    calls = []
+    writer = CoalescingWriter(lambda: calls.append(1), max_rate=2, debounce=0.05)
+    writer.start()
+    for i in range(0, 100):
+        writer.mark_dirty()
+    time.sleep(0.2)
+    assert len(calls) == 1
+    writer.stop()
+    assert len(calls) == 1
+    assert writer.changes == 100
+    assert writer.coalesced == 99
+
+
+def test_rate_limit() -> None:
+    calls = []
+    writer = CoalescingWriter(lambda: calls.append(time.monotonic()), max_rate=10)
+    writer.start()
+    end = time.monotonic() + 0.5
+    while time.monotonic() < end:
+        writer.mark_dirty()
+        time.sleep(0.001)
+    writer.stop()
+    assert 4 <= len(calls) <= 7
+    for a, b in zip(calls, calls[1:]):
+        assert b - a >= 0.09
+
+
+def test_stop_writes_pending_changes() -> None:
+    calls = []
+    writer = CoalescingWriter(lambda: calls.append(1), max_rate=0.1)
+    writer.start()
+    writer.mark_dirty()
+    time.sleep(0.1)
+    assert len(calls) == 1
+    writer.mark_dirty()
+    time.sleep(0.1)
+    assert len(calls) == 1
+    writer.stop()
+    assert len(calls) == 2
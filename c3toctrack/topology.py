@@ -0,0 +1,421 @@
+import heapq
+from bisect import bisect_left, bisect_right
+from math import floor, sqrt
+
+import numpy as np
+
+from .spatialindex import SegmentIndex
+from .waypoint import Turnout, Waypoint
+
+
+class Edge:
+    """
+    A piece of a track between two nodes of the graph, and the stops on it.
+
+    Trains travel along an edge in direction 1, towards increasing trackmarkers, from nodes[0] to nodes[1], or in
+    direction -1 the other way round.
+    """
+
+    __slots__ = ('id', 'trackname', 'first', 'last', 'start', 'end', 'nodes', 'segment', 'stops', 'markers')
+
+    def __init__(self, id: int, trackname: str, first: int, last: int, start: float, end: float, nodes: tuple,
+                 segment: int):
+        """
+        :param first: index of the first point of the edge in the track
+        :param last: index of the last point of the edge in the track
+        :param start: trackmarker of the first point
+        :param end: trackmarker of the last point
+        :param nodes: the nodes at the first and at the last point
+        :param segment: number of the first segment of the edge in the SegmentIndex
+        """
+        self.id = id
+        self.trackname = trackname
+        self.first = first
+        self.last = last
+        self.start = start
+        self.end = end
+        self.nodes = nodes
+        self.segment = segment
+        # the stops on the edge, ordered by trackmarker, and their trackmarkers
+        self.stops = []
+        self.markers = []
+
+    @property
+    def length(self) -> float:
+        return self.end - self.start
+
+    @property
+    def segments(self) -> np.ndarray:
+        return np.arange(self.segment, self.segment + self.last - self.first, dtype=np.int64)
+
+    def offset(self, trackmarker: float, direction: int) -> float:
+        """
+        Return how far a train travelling in direction has come along the edge when it is at trackmarker.
+        """
+        if direction > 0:
+            return trackmarker - self.start
+        return self.end - trackmarker
+
+
+class StopIndex:
+    """
+    All stops ordered by trackmarker, to find the next stop from the trackmarker alone, for positions that are not on
+    the track graph. After the last stop, the search wraps around to the first.
+    """
+
+    def __init__(self, waypoints: dict):
+        """
+        :param waypoints: the waypoints by trackmarker, as in TracksModel.waypoints
+        """
+        self.stops = [waypoint for trackmarker, waypoint in sorted(waypoints.items()) if waypoint.is_stop()]
+        self.markers = [stop.trackmarker for stop in self.stops]
+
+    def __len__(self) -> int:
+        return len(self.stops)
+
+    def next_stop(self, trackmarker: float) -> Waypoint | None:
+        if len(self.stops) == 0:
+            return None
+        return self.stops[bisect_right(self.markers, trackmarker) % len(self.stops)]
+
+
+def dart(edge: int, direction: int) -> int:
+    """
+    Number an edge together with a direction of travel along it.
+    """
+    return 2 * edge + (0 if direction > 0 else 1)
+
+
+class TrackGraph:
+    """
+    The network formed by the tracks. Tracks are split into edges wherever they meet another track: at their ends,
+    and at turnouts. Points closer than tolerance meters, and turnouts with the same name, are the same node.
+
+    When a train reaches a node, it can continue on any edge leaving the node in roughly the same direction (less than
+    90° from its heading), so it cannot reverse at a turnout, but it does reverse at the end of a line. For every edge
+    and direction, the distances along the graph to all stops that can be reached from its end are computed up front,
+    so finding the next stop, or the distance to any stop, is a bisect on the current edge and a lookup.
+    """
+
+    # how far from a node the heading of an edge is measured, in meters, to smooth out short kinks in the tracks
+    HEADING_DISTANCE = 5.0
+
+    def __init__(self, tracks: dict, index: SegmentIndex, tolerance: float = 1.0):
+        """
+        Build the graph.
+        :param tracks: the tracks, as in TracksModel.tracks
+        :param index: the SegmentIndex built from the same tracks
+        :param tolerance: distance in meters below which points are considered to be the same node
+        """
+        self.tolerance = tolerance
+        # position in meters and name of the turnout, if any, of each node
+        self.nodes = []
+        self.node_names = []
+        self.node_edges = []
+        self.edges = []
+        self.edge_of_segment = np.full(len(index), -1, dtype=np.int64)
+        self._cells = {}
+        self._by_name = {}
+        self._near = {}
+
+        coordinates = {}
+        for track in tracks.values():
+            if len(track) < 2:
+                continue
+            x, y = index.to_meters(np.frombuffer(track.lats, dtype=np.float64),
+                                   np.frombuffer(track.lons, dtype=np.float64))
+            coordinates[track.name] = (x, y)
+            for i in (0, len(track) - 1):
+                self._node(x[i], y[i], None)
+            for i, waypoint in track.waypoints.items():
+                if isinstance(waypoint, Turnout):
+                    self._node(x[i], y[i], waypoint.name)
+
+        leave = {}
+        offsets = dict(zip(index.tracknames, index.offsets))
+        for name, (x, y) in coordinates.items():
+            track = tracks[name]
+            splits = self._splits(x, y)
+            for i, waypoint in track.waypoints.items():
+                if isinstance(waypoint, Turnout):
+                    splits[i] = self._by_name[waypoint.name]
+            indices = self._merge(track, splits)
+            for first, last in zip(indices, indices[1:]):
+                edge = Edge(len(self.edges), name, first, last, track.trackmarkers[first], track.trackmarkers[last],
+                            (splits[first], splits[last]), offsets[name] + first)
+                self.edges.append(edge)
+                self.node_edges[edge.nodes[0]].append(edge.id)
+                self.node_edges[edge.nodes[1]].append(edge.id)
+                self.edge_of_segment[edge.segments] = edge.id
+                leave[dart(edge.id, 1)] = self._heading(x, y, first, last)
+                leave[dart(edge.id, -1)] = self._heading(x, y, last, first)
+            for i, waypoint in sorted(track.waypoints.items()):
+                if not waypoint.is_stop():
+                    continue
+                for first, last in zip(indices, indices[1:]):
+                    if first < i <= last or i == first == 0:
+                        edge = self.edges[self.edge_of_segment[offsets[name] + first]]
+                        edge.stops.append(waypoint)
+                        edge.markers.append(track.trackmarkers[i])
+                        break
+
+        self.successors = [self._successors(d, leave) for d in range(0, 2 * len(self.edges))]
+        # for each dart, the distance from its end to every stop that can be reached from there, nearest first
+        self.ahead = [self._ahead(d) for d in range(0, 2 * len(self.edges))]
+        self._cells = None
+
+    def _node(self, x: float, y: float, name: str | None) -> int:
+        """
+        Return the node at a position, creating it if there is none yet.
+        """
+        node = self._by_name.get(name) if name is not None else None
+        if node is None:
+            node = self._find(x, y)
+        if node is None:
+            node = len(self.nodes)
+            self.nodes.append((float(x), float(y)))
+            self.node_names.append(name)
+            self.node_edges.append([])
+            self._cells.setdefault((floor(x / self.tolerance), floor(y / self.tolerance)), []).append(node)
+        if name is not None:
+            self._by_name.setdefault(name, node)
+            if self.node_names[node] is None:
+                self.node_names[node] = name
+        return node
+
+    def _find(self, x: float, y: float) -> int | None:
+        cx = floor(x / self.tolerance)
+        cy = floor(y / self.tolerance)
+        for key in ((cx + i, cy + j) for i in (-1, 0, 1) for j in (-1, 0, 1)):
+            for node in self._cells.get(key, ()):
+                (nx, ny) = self.nodes[node]
+                if sqrt((nx - x) ** 2 + (ny - y) ** 2) <= self.tolerance:
+                    return node
+        return None
+
+    def _splits(self, x: np.ndarray, y: np.ndarray) -> dict:
+        """
+        Return the points of a track that are nodes, by index.
+        """
+        cx = np.floor(x / self.tolerance).astype(np.int64)
+        cy = np.floor(y / self.tolerance).astype(np.int64)
+        cells = np.array([(key[0] << 32) + key[1] for key in self._cells], dtype=np.int64)
+        near = np.zeros(len(x), dtype=bool)
+        for i in (-1, 0, 1):
+            for j in (-1, 0, 1):
+                near |= np.isin(((cx + i) << 32) + (cy + j), cells)
+        splits = {}
+        for i in np.flatnonzero(near).tolist():
+            node = self._find(x[i], y[i])
+            if node is not None:
+                splits[i] = node
+        return splits
+
+    def _merge(self, track, splits: dict) -> list:
+        """
+        Return the indices of the points at which the track is split into edges. Where consecutive points are the
+        same node, only one of them is kept, so there are no edges of length zero.
+        """
+        indices = []
+        for i in sorted(splits):
+            if len(indices) > 0 and splits[indices[-1]] == splits[i] and \
+                    track.trackmarkers[i] - track.trackmarkers[indices[-1]] <= 2 * self.tolerance:
+                if indices[-1] == 0:
+                    continue
+                indices.pop()
+            indices.append(i)
+        return indices
+
+    def _heading(self, x: np.ndarray, y: np.ndarray, i: int, stop: int) -> tuple:
+        """
+        Return the direction, as a unit vector, in which the track leaves point i towards point stop.
+        """
+        step = 1 if stop > i else -1
+        j = i
+        while j != stop:
+            j += step
+            if (x[j] - x[i]) ** 2 + (y[j] - y[i]) ** 2 >= self.HEADING_DISTANCE ** 2:
+                break
+        (dx, dy) = (x[j] - x[i], y[j] - y[i])
+        length = sqrt(dx * dx + dy * dy)
+        if length == 0:
+            return 0.0, 0.0
+        return dx / length, dy / length
+
+    def exit_node(self, d: int) -> int:
+        return self.edges[d // 2].nodes[1 - d % 2]
+
+    def _successors(self, d: int, leave: dict) -> list:
+        """
+        Return the darts a train can continue on after reaching the end of dart d.
+        """
+        node = self.exit_node(d)
+        reverse = d ^ 1
+        candidates = []
+        for edge in dict.fromkeys(self.node_edges[node]):
+            for direction, start in ((1, self.edges[edge].nodes[0]), (-1, self.edges[edge].nodes[1])):
+                if start == node and dart(edge, direction) != reverse:
+                    candidates.append(dart(edge, direction))
+        if len(candidates) == 0:
+            # end of the line, the train has to go back
+            return [reverse]
+        if len(candidates) == 1:
+            return candidates
+        # arriving at the node, the train is heading opposite to where the reverse dart leaves it
+        (ax, ay) = leave[reverse]
+        straight = [c for c in candidates if leave[c][0] * -ax + leave[c][1] * -ay > 0]
+        return straight if len(straight) > 0 else candidates
+
+    def _stops(self, d: int) -> list:
+        """
+        Return the offsets along dart d and the stops on it, in the order a train passes them.
+        """
+        edge = self.edges[d // 2]
+        direction = 1 if d % 2 == 0 else -1
+        stops = [(edge.offset(marker, direction), stop) for marker, stop in zip(edge.markers, edge.stops)]
+        return stops if direction > 0 else stops[::-1]
+
+    def _ahead(self, source: int) -> dict:
+        """
+        Find the distances from the end of dart source to all stops that can be reached from there.
+        """
+        ahead = {}
+        visited = set()
+        queue = [(0.0, d) for d in self.successors[source]]
+        heapq.heapify(queue)
+        while len(queue) > 0:
+            (x, d) = heapq.heappop(queue)
+            if d in visited:
+                continue
+            visited.add(d)
+            for offset, stop in self._stops(d):
+                if stop not in ahead or x + offset < ahead[stop]:
+                    ahead[stop] = x + offset
+            length = self.edges[d // 2].length
+            for s in self.successors[d]:
+                if s not in visited:
+                    heapq.heappush(queue, (x + length, s))
+        return dict(sorted(ahead.items(), key=lambda item: item[1]))
+
+    def edge_of(self, segment: int) -> int:
+        """
+        Return the edge a segment of the SegmentIndex belongs to, or -1 if it is not part of the graph.
+        """
+        if segment < 0:
+            return -1
+        return int(self.edge_of_segment[segment])
+
+    def upcoming(self, edge: int, trackmarker: float, direction: int):
+        """
+        Generate the stops ahead of a train in the order it reaches them, as tuples of the stop and the distance to
+        it along the graph. Where the line branches, each stop is reached on the shortest path.
+        :param edge: the edge the train is on
+        :param trackmarker: where the train is on the edge
+        :param direction: the direction the train is travelling in
+        """
+        e = self.edges[edge]
+        if direction > 0:
+            first = bisect_right(e.markers, trackmarker)
+            here = [(e.stops[i], e.markers[i] - trackmarker) for i in range(first, len(e.markers))]
+        else:
+            last = bisect_left(e.markers, trackmarker)
+            here = [(e.stops[i], trackmarker - e.markers[i]) for i in range(last - 1, -1, -1)]
+        yield from here
+        seen = set(stop for stop, distance in here)
+        remaining = e.length - e.offset(trackmarker, direction)
+        for stop, distance in self.ahead[dart(edge, direction)].items():
+            if stop not in seen:
+                yield stop, remaining + distance
+
+    def next_stop(self, edge: int, trackmarker: float, direction: int) -> tuple | None:
+        """
+        Return the next stop ahead of a train and the distance to it along the graph, or None if there is none.
+        """
+        e = self.edges[edge]
+        if direction > 0:
+            i = bisect_right(e.markers, trackmarker)
+            if i < len(e.markers):
+                return e.stops[i], e.markers[i] - trackmarker
+        else:
+            i = bisect_left(e.markers, trackmarker) - 1
+            if i >= 0:
+                return e.stops[i], trackmarker - e.markers[i]
+        for stop, distance in self.ahead[dart(edge, direction)].items():
+            return stop, e.length - e.offset(trackmarker, direction) + distance
+        return None
+
+    def distance_to(self, edge: int, trackmarker: float, direction: int, stop: Waypoint) -> float | None:
+        """
+        Return the distance along the graph from a train to a stop ahead of it, or None if it cannot reach the stop.
+        """
+        e = self.edges[edge]
+        for marker, s in zip(e.markers, e.stops):
+            if s is stop and (marker - trackmarker) * direction > 0:
+                return (marker - trackmarker) * direction
+        distance = self.ahead[dart(edge, direction)].get(stop)
+        if distance is None:
+            return None
+        return e.length - e.offset(trackmarker, direction) + distance
+
+    def window(self, segment: int, size: int) -> tuple:
+        """
+        Return the range of segments of the same edge at most size segments before or after segment, as the first
+        segment and the one after the last.
+        """
+        e = self.edges[self.edge_of(segment)]
+        return max(e.segment, segment - size), min(e.segment + e.last - e.first, segment + size + 1)
+
+    def advance(self, previous: int, previous_trackmarker: float, direction: int, edge: int,
+                trackmarker: float) -> tuple | None:
+        """
+        Work out how far a train travelling in direction has moved between two positions on the same or on adjacent
+        edges.
+        :return: the distance along the tracks, negative if the train has moved backwards, and the direction along
+                 edge that is forward for the train; or None if the edges are not adjacent
+        """
+        if previous < 0 or edge < 0:
+            return None
+        if previous == edge:
+            return (trackmarker - previous_trackmarker) * direction, direction
+        p = self.edges[previous]
+        e = self.edges[edge]
+        ahead = self.exit_node(dart(previous, direction))
+        best = None
+        for node, behind in ((p.nodes[0], previous_trackmarker - p.start), (p.nodes[1], p.end - previous_trackmarker)):
+            for forward, beyond in ((1, trackmarker - e.start), (-1, e.end - trackmarker)):
+                if node != e.nodes[0 if forward > 0 else 1]:
+                    continue
+                if node == ahead:
+                    # through the node the train was heading for, and on along edge away from it
+                    candidate = (behind + beyond, forward)
+                else:
+                    # backwards through the node behind the train; forward on edge is towards that node
+                    candidate = (-(behind + beyond), -forward)
+                if best is None or abs(candidate[0]) < abs(best[0]):
+                    best = candidate
+        return best
+
+    def near(self, edge: int, trackmarker: float, reach: float) -> np.ndarray:
+        """
+        Return the segments of all edges a train at trackmarker on edge can reach within reach meters, in either
+        direction, as a sorted array.
+        """
+        e = self.edges[edge]
+        found = {edge}
+        budget = {}
+        pending = [(e.nodes[0], reach - (trackmarker - e.start)), (e.nodes[1], reach - (e.end - trackmarker))]
+        while len(pending) > 0:
+            (node, left) = pending.pop()
+            if left <= 0 or left <= budget.get(node, 0):
+                continue
+            budget[node] = left
+            for i in self.node_edges[node]:
+                found.add(i)
+                other = self.edges[i].nodes[1] if self.edges[i].nodes[0] == node else self.edges[i].nodes[0]
+                pending.append((other, left - self.edges[i].length))
+        key = tuple(sorted(found))
+        segments = self._near.get(key)
+        if segments is None:
+            segments = np.sort(np.concatenate([self.edges[i].segments for i in key]))
+            self._near[key] = segments
+        return segments
@@ -1,4 +1,6 @@
-from math import sqrt
+from array import array
+from collections.abc import Sequence
+
 from .point import Point
 from .waypoint import makeWaypoint
 
@@ -9,19 +11,85 @@ from .waypoint import makeWaypoint
 class Track:
     """
     A track combines multiple Points.
+
+    The coordinates, distances and trackmarkers of the points are kept in flat arrays, and the waypoints in a dict by
+    the index of their point, which takes a fraction of the memory of one object per point. points and point() return
+    Point objects made from the arrays on demand; changing them does not change the track.
     """
 
+    __slots__ = ('name', 'lats', 'lons', 'steps', 'trackmarkers', 'waypoints')
+
     def __init__(self, name):
         self.name = name
-        self.points = []
+        self.lats = array('d')
+        self.lons = array('d')
+        # distance of each point from the previous one
+        self.steps = array('d')
+        self.trackmarkers = array('d')
+        # index of the point -> waypoint at that point
+        self.waypoints = {}
+
+    def __len__(self) -> int:
+        return len(self.lats)
+
+    @property
+    def points(self) -> 'PointsView':
+        return PointsView(self)
+
+    def point(self, i: int) -> Point:
+        point = Point(self.lats[i], self.lons[i])
+        point.step = self.steps[i]
+        point.trackmarker = self.trackmarkers[i]
+        point.waypoint = self.waypoints.get(i)
+        return point
 
     def add(self, lat: float, lon: float, name: str, start: float):
         point = Point(lat, lon)
-        if len(self.points) > 0:
-            previous = self.points[len(self.points) - 1]
+        if len(self) > 0:
+            previous = self.point(len(self) - 1)
             start = previous.trackmarker
-            point.distance = Point.distance(previous, point)
-        point.trackmarker = start + point.distance
+            point.step = Point.distance(previous, point)
+        point.trackmarker = start + point.step
         if name is not None:
-            point.waypoint = makeWaypoint(point.lat, point.lon, int(point.trackmarker), name)
-        self.points.append(point)
+            self.waypoints[len(self)] = makeWaypoint(point.lat, point.lon, int(point.trackmarker), name)
+        self.lats.append(point.lat)
+        self.lons.append(point.lon)
+        self.steps.append(point.step)
+        self.trackmarkers.append(point.trackmarker)
+
+    def to_dict(self) -> dict:
+        """
+        Return the track in the form used in tracks.json.
+        """
+        return {
+            'name': self.name,
+            'points': [point.to_dict() for point in self.points],
+        }
+
+
+class PointsView(Sequence):
+    """
+    The points of a track as a read-only sequence of Point objects.
+    """
+
+    __slots__ = ('track',)
+
+    def __init__(self, track: Track):
+        self.track = track
+
+    def __len__(self) -> int:
+        return len(self.track)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.track.point(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('point index out of range')
+        return self.track.point(i)
+
+    def __iter__(self):
+        track = self.track
+        for i in range(0, len(track)):
+            yield track.point(i)
@@ -1,59 +1,146 @@
+import glob
+import hashlib
 import json
 import os
+import pickle
 
 import geojson
-import gpxpy
 from atomicwrites import atomic_write
 
+from .loader import read_gpx, read_osm
+from .lod import ZOOMS, simplify, tiles as cut_tiles, tolerance
+from .output import COMPACT, PRETTY, OutputFormat, write_if_changed
+from .spatialindex import SegmentIndex, Snap, SnapBatch
+from .topology import StopIndex, TrackGraph
 from .track import Track
 
 
+def _feature_collection(features: list, output_format: OutputFormat) -> str:
+    """
+    Return GeoJSON features as a feature collection. The features are not validated again, which takes longer than
+    serializing them.
+    """
+    return output_format.dumps({'features': features, 'type': 'FeatureCollection'})
+
+
 class TracksModel:
+    # change this whenever the structure of the model changes, to invalidate existing caches
+    CACHE_VERSION = 4
+    # how many segments before and after the previous one snap tries first
+    HINT_SEGMENTS = 3
+
     def __init__(self, filename: str, starts: dict):
+        """
+        Load the tracks from a GPX file, or from an OSM XML file if its name ends in .osm.
+        :param starts: the trackmarker of the first point of some tracks, by track name; the others start at 0
+        """
         self.tracks = {}
         self.waypoints = {}
 
-        gpx_file = open(filename, 'r')
+        reader = read_osm if filename.endswith('.osm') else read_gpx
+        for (trackname, lat, lon, label) in reader(filename):
+            t = self.tracks.get(trackname)
+            if t is None:
+                t = self.tracks[trackname] = Track(trackname)
+            t.add(lat, lon, label, starts.get(trackname, 0))
 
-        gpx = gpxpy.parse(gpx_file)
+        for n, t in self.tracks.items():
+            for i, waypoint in sorted(t.waypoints.items()):
+                self.waypoints[waypoint.trackmarker] = waypoint
 
-        for track in gpx.tracks:
-            # print(f'Track {track.name}')
-            if track.name is None:
-                continue
-            if track.name in self.tracks:
-                t = self.tracks[track.name]
-            else:
-                t = Track(track.name)
-                self.tracks[track.name] = t
+        self.index = SegmentIndex(self.tracks)
+        self.graph = TrackGraph(self.tracks, self.index)
+        self.stops = StopIndex(self.waypoints)
 
-            start = 0
-            if track.name in starts:
-                start = starts[track.name]
+    @classmethod
+    def cached(cls, filename: str, starts: dict, cache_dir: str) -> 'TracksModel':
+        """
+        Load the model from a compiled snapshot in cache_dir, or build it from the GPX file and store a snapshot there.
+        The snapshot is keyed by a hash of the GPX file and the starts, so any change to either builds a new one.
+        """
+        key = hashlib.sha256()
+        key.update(f'{cls.CACHE_VERSION} {json.dumps(starts, sort_keys=True)}\n'.encode('utf-8'))
+        with open(filename, 'rb') as f:
+            key.update(f.read())
+        cache = os.path.join(cache_dir, f'tracksmodel-{key.hexdigest()}.pickle')
+        try:
+            with open(cache, 'rb') as f:
+                return pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            pass
+        model = cls(filename, starts)
+        os.makedirs(cache_dir, exist_ok=True)
+        for old in glob.glob(os.path.join(cache_dir, 'tracksmodel-*.pickle')):
+            os.unlink(old)
+        with atomic_write(cache, mode='wb', overwrite=True) as f:
+            pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return model
 
-            for segment in track.segments:
-                for point in segment.points:
-                    t.add(point.latitude, point.longitude, point.name, start)
+    def snap(self, lat: float, lon: float, previous: Snap | None = None, reach: float = 100.0,
+             max_distance: float = 15.0) -> Snap | None:
+        """
+        Find the track closest to the given position, and the trackmarker of the position projected onto that track.
+        :param previous: where the train was last. If set, the segments next to the previous one are tried first,
+                         then the edges of the graph that can be reached from there within reach meters, and all
+                         tracks only if the position is more than max_distance meters away from those. This is
+                         faster, and keeps trains from jumping to a parallel track.
+        :return: the snapped position, or None if there are no tracks
+        """
+        if previous is not None:
+            edge = self.graph.edge_of(previous.segment)
+            if edge >= 0:
+                (first, stop) = self.graph.window(previous.segment, self.HINT_SEGMENTS)
+                snap = self.index.nearest_in_range(first, stop, lat, lon)
+                # at the first or last segment of the window, the closest segment may lie beyond it
+                if snap.distance <= max_distance and first < snap.segment < stop - 1:
+                    return snap
+                snap = self.index.nearest_of(self.graph.near(edge, previous.trackmarker, reach), lat, lon)
+                if snap is not None and snap.distance <= max_distance:
+                    return snap
+        return self.index.nearest(lat, lon)
 
-        for n, t in self.tracks.items():
-            for point in t.points:
-                if point.waypoint is not None:
-                    self.waypoints[point.waypoint.trackmarker] = point.waypoint
-
-    def write_json(self, filename: str):
-        with atomic_write(filename, overwrite=True, encoding='utf8') as f:
-            os.fchmod(f.fileno(), 0o664)
-            json.dump({
-                'tracks': self.tracks,
-                'waypoints': self.waypoints
-            }, f, default=vars, ensure_ascii=False, sort_keys=True, indent=2)
-
-    def write_geojson(self, filename: str):
+    def snap_many(self, lats, lons) -> SnapBatch:
+        """
+        Snap many positions at once. This uses the same computation as snap, but is much faster than calling snap for
+        each position, for example when replaying recorded positions.
+        :param lats: latitudes, as a sequence or NumPy array
+        :param lons: longitudes, as a sequence or NumPy array of the same length
+        :return: arrays of track names, trackmarkers, segment numbers and distances, with one entry per position
+        """
+        return self.index.nearest_many(lats, lons)
+
+    def to_json(self, output_format: OutputFormat = PRETTY) -> str:
+        """
+        Return tracks and waypoints as JSON.
+        :param output_format: indented or compact, see OutputFormat
+        """
+        return output_format.dumps({
+            'tracks': {name: track.to_dict() for name, track in self.tracks.items()},
+            'waypoints': {trackmarker: waypoint.to_dict() for trackmarker, waypoint in self.waypoints.items()}
+        })
+
+    def write_json(self, filename: str, output_format: OutputFormat = PRETTY) -> bool:
+        """
+        Write tracks and waypoints as JSON, unless the file already has the same contents.
+        :param output_format: indented or compact, and which compressed copies to write, see OutputFormat
+        :return: True if the file has been written
+        """
+        return output_format.write(filename, self.to_json(output_format), only_if_changed=True)
+
+    def features(self, tolerance: float = 0.0) -> list:
+        """
+        Return tracks and waypoints as GeoJSON features.
+        :param tolerance: simplify the tracks, dropping points that are at most this many meters from the simplified
+                          track, see lod.simplify(); the points of waypoints are always kept
+        """
         features = []
         for name, track in self.tracks.items():
-            points = []
-            for point in track.points:
-                points.append((point.lon, point.lat))
+            if tolerance > 0:
+                kept = simplify(track.lats, track.lons, tolerance, track.waypoints.keys())
+                # a precision of about 10 cm is plenty for a simplified track
+                points = [(round(track.lons[i], 6), round(track.lats[i], 6)) for i in kept]
+            else:
+                points = list(zip(track.lons, track.lats))
             features.append(geojson.Feature(geometry=geojson.LineString(points), properties={
                 'name': track.name,
                 'stroke': '#ff0000',
@@ -93,16 +180,79 @@ class TracksModel:
                     })
             features.append(
                 geojson.Feature(geometry=geojson.Point((waypoint.lon, waypoint.lat)), properties=properties))
-        feature_collection = geojson.FeatureCollection(features)
-
-        with atomic_write(filename, overwrite=True, encoding='utf8') as f:
-            os.fchmod(f.fileno(), 0o664)
-            geojson.dump(feature_collection, f, ensure_ascii=False, sort_keys=True, indent=2)
-
-    def write_station_table(self, filename: str):
-        with atomic_write(filename, overwrite=True, encoding='utf8') as f:
-            os.fchmod(f.fileno(), 0o664)
-            print("^ DS100 ^ km    ^ Name                 ^", file=f)
-            for name, waypoint in sorted(self.waypoints.items()):
-                if waypoint.is_stop():
-                    print(f'| {waypoint.ds100:5s} | {waypoint.trackmarker / 1000.0:0.3f} | {waypoint.name:20s} |', file=f)
+        return features
+
+    def to_geojson(self, tolerance: float = 0.0, output_format: OutputFormat = PRETTY) -> str:
+        """
+        Return tracks and waypoints as GeoJSON.
+        :param tolerance: simplify the tracks, see features()
+        :param output_format: indented or compact, see OutputFormat
+        """
+        return _feature_collection(self.features(tolerance), output_format)
+
+    def write_geojson(self, filename: str, output_format: OutputFormat = PRETTY) -> bool:
+        """
+        Write tracks and waypoints as GeoJSON, unless the file already has the same contents.
+        :param output_format: indented or compact, and which compressed copies to write, see OutputFormat
+        :return: True if the file has been written
+        """
+        return output_format.write(filename, self.to_geojson(output_format=output_format), only_if_changed=True)
+
+    def write_lod(self, directory: str, zooms: tuple = ZOOMS, tiles: bool = False,
+                  output_format: OutputFormat = COMPACT) -> int:
+        """
+        Write variants of tracks.json and tracks.geojson that are quicker to load, by default with gzip-compressed
+        copies (.gz), unless they already have the same contents:
+
+        * tracks.min.json and tracks.min.geojson, minified
+        * tracks-z{zoom}.geojson, with the tracks simplified to what can be seen at each of the zoom levels
+        * with tiles, tiles/{zoom}/{x}/{y}.geojson, the simplified tracks and the waypoints cut into the tiles of each
+          zoom level, and of the zoom level after the last one, with all points. Tiles that are no longer needed are
+          removed.
+
+        :param directory: where to write the files, usually next to tracks.json
+        :param zooms: the zoom levels of the simplified tracks, see lod.tolerance()
+        :param output_format: how to write the variants; by default compact, with gzip copies
+        :return: the number of files that have been written, not counting the compressed copies
+        """
+        written = 0
+        written += self.write_json(os.path.join(directory, 'tracks.min.json'), output_format)
+        written += self.write_geojson(os.path.join(directory, 'tracks.min.geojson'), output_format)
+        # the latitude the tolerances are computed for; the networks are small enough for one to do
+        lat = sum(track.lats[0] for track in self.tracks.values() if len(track) > 0) / max(len(self.tracks), 1)
+        current = set()
+        for zoom in zooms + ((zooms[-1] + 1,) if tiles else ()):
+            features = self.features(tolerance(zoom, lat) if zoom in zooms else 0.0)
+            if zoom in zooms:
+                written += output_format.write(os.path.join(directory, f'tracks-z{zoom}.geojson'),
+                                               _feature_collection(features, output_format), only_if_changed=True)
+            if not tiles:
+                continue
+            for (x, y), tile_features in cut_tiles(features, zoom).items():
+                filename = os.path.join(directory, 'tiles', str(zoom), str(x), f'{y}.geojson')
+                os.makedirs(os.path.dirname(filename), exist_ok=True)
+                current.update(filename + suffix for suffix in ('',) + tuple(output_format.compressors))
+                written += output_format.write(filename, _feature_collection(tile_features, output_format),
+                                               only_if_changed=True)
+        if tiles:
+            for old in glob.glob(os.path.join(directory, 'tiles', '*', '*', '*.geojson*')):
+                if old not in current:
+                    os.unlink(old)
+        return written
+
+    def to_station_table(self) -> str:
+        """
+        Return the stops as a DokuWiki table.
+        """
+        lines = ["^ DS100 ^ km    ^ Name                 ^\n"]
+        for name, waypoint in sorted(self.waypoints.items()):
+            if waypoint.is_stop():
+                lines.append(f'| {waypoint.ds100:5s} | {waypoint.trackmarker / 1000.0:0.3f} | {waypoint.name:20s} |\n')
+        return ''.join(lines)
+
+    def write_station_table(self, filename: str) -> bool:
+        """
+        Write the stops as a DokuWiki table, unless the file already has the same contents.
+        :return: True if the file has been written
+        """
+        return write_if_changed(filename, self.to_station_table())
@@ -0,0 +1,346 @@
+import threading
+from bisect import bisect_left
+from math import log
+
+import numpy as np
+
+from .eta import TravelTimes
+from .history import HistoryReader
+from .point import Point
+from .tracksmodel import TracksModel
+from .waypoint import Waypoint
+
+
+class RollingQuantiles:
+    """
+    Quantiles of a series of values, like travel times, weighted towards the recent ones: every value counts half as
+    much as the one half_life values after it, so the quantiles follow changes, like a new timetable, without keeping
+    the values themselves.
+
+    The values are counted in bins that are a fixed factor wide, by default 5%, so adding a value takes constant time,
+    and the quantiles are exact to within that factor. Values outside of low to high are counted in the first or the
+    last bin.
+    """
+
+    def __init__(self, half_life: float = 20, low: float = 1.0, high: float = 4 * 3600, factor: float = 1.05):
+        """
+        :param half_life: the number of values after which a value counts half
+        :param low: the lower end of the first bin
+        :param high: the upper end of the last bin
+        :param factor: how much larger the upper end of a bin is than its lower end
+        """
+        self.half_life = half_life
+        self.low = low
+        self._log_low = log(low)
+        self._log_factor = log(factor)
+        self.bins = np.zeros(int(np.ceil(log(high / low) / self._log_factor)), dtype=np.float64)
+        # number of values added, without weights
+        self.count = 0
+        # weight of the most recent value; the bins are rescaled before this overflows
+        self._weight = 1.0
+        self._growth = 2.0 ** (1.0 / half_life)
+        # q -> quantile, until the next value is added
+        self._cache = {}
+
+    def _bin(self, value: float) -> int:
+        if value <= self.low:
+            return 0
+        return min(int((log(value) - self._log_low) / self._log_factor), len(self.bins) - 1)
+
+    def _rescale(self):
+        self.bins /= self._weight
+        self._weight = 1.0
+
+    def add(self, value: float):
+        self._weight *= self._growth
+        if self._weight > 1e100:
+            self._rescale()
+        self.bins[self._bin(value)] += self._weight
+        self.count += 1
+        self._cache.clear()
+
+    def add_many(self, values):
+        """
+        Add many values at once, in the order they were observed. This is the same as calling add() for each, but
+        much faster.
+        :param values: a sequence or NumPy array of values
+        """
+        values = np.asarray(values, dtype=np.float64)
+        n = len(values)
+        if n == 0:
+            return
+        self._rescale()
+        bins = np.zeros(len(values), dtype=np.int64)
+        above = values > self.low
+        bins[above] = np.minimum(((np.log(values[above]) - self._log_low) / self._log_factor).astype(np.int64),
+                                 len(self.bins) - 1)
+        # the most recent value gets weight 1, and everything before it less
+        weights = np.exp2((np.arange(1, n + 1) - n) / self.half_life)
+        self.bins *= 2.0 ** (-n / self.half_life)
+        self.bins += np.bincount(bins, weights, minlength=len(self.bins))
+        self.count += n
+        self._cache.clear()
+
+    def quantile(self, q: float) -> float | None:
+        """
+        Return the value below which the fraction q of the values lies, or None if there are no values yet.
+        """
+        if self.count == 0:
+            return None
+        value = self._cache.get(q)
+        if value is None:
+            cumulative = np.cumsum(self.bins)
+            target = q * cumulative[-1]
+            i = min(int(np.searchsorted(cumulative, target)), len(self.bins) - 1)
+            below = cumulative[i - 1] if i > 0 else 0.0
+            fraction = (target - below) / self.bins[i] if self.bins[i] > 0 else 0.5
+            value = self._cache[q] = float(np.exp(self._log_low + (i + fraction) * self._log_factor))
+        return value
+
+    @property
+    def median(self) -> float | None:
+        return self.quantile(0.5)
+
+
+class SegmentStatistics(TravelTimes):
+    """
+    Travel times between consecutive stops, and dwell times at the stops, learned from the positions of the trains,
+    for EtaEngine.
+
+    A train is at a stop while its position is within radius meters of the stop; trackmarkers are not used, as those
+    of different tracks can overlap. The dwell time is the time from the first to the last position at the stop, and
+    the travel time of a leg the time from the last position at one stop to the first position at the next, different
+    stop. Nothing is measured across gaps of more than max_gap seconds in the positions of a train.
+
+    Positions are added one at a time with record(), which takes constant time, or all at once from the position
+    history with from_history(). Every leg and stop keeps RollingQuantiles of its times, and the ETAs use their
+    medians. For trains that are standing, the ETAs use the median speed of moving trains instead of their own.
+    """
+
+    # how close to a stop a train has to be to be at the stop, in meters
+    RADIUS = 15.0
+    # trains slower than this, in m/s, are standing, and their speed is not counted
+    MIN_SPEED = 0.3
+    # the number of traversals of a leg or stop, and of positions of moving trains, after which they count half
+    HALF_LIFE = 20
+    SPEED_HALF_LIFE = 10000
+
+    def __init__(self, tracksmodel: TracksModel, radius: float = RADIUS, max_gap: float = 300.0):
+        """
+        :param radius: how close to a stop a train has to be to be at the stop, in meters
+        :param max_gap: the longest time between two positions of a train that legs and dwell times are measured over
+        """
+        self.radius = radius
+        self.max_gap = max_gap
+        # the stops, ordered by latitude, to find the stops near a position with a bisect
+        self.stops = sorted(tracksmodel.stops.stops, key=lambda stop: stop.lat)
+        self.lats = np.array([stop.lat for stop in self.stops], dtype=np.float64)
+        self.lons = np.array([stop.lon for stop in self.stops], dtype=np.float64)
+        self._lats = self.lats.tolist()
+        self._lons = self.lons.tolist()
+        self._radius_lat = radius * Point.degree_per_meter_lat
+        # (trackmarker of the origin, trackmarker of the destination) -> RollingQuantiles of the travel times
+        self.legs = {}
+        # trackmarker of the stop -> RollingQuantiles of the dwell times
+        self.dwells = {}
+        self.speeds = RollingQuantiles(self.SPEED_HALF_LIFE, low=0.1, high=100.0)
+        # train -> [number of the stop or -1, time of the first and last position there, number of the stop before
+        # or -1, time of the last position there]
+        self._trains = {}
+        # the travel and dwell times found while reading the history, see add_history()
+        self._pending = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def stop_at(self, lat: float, lon: float) -> int:
+        """
+        Return the number of the closest stop in self.stops within radius of the position, or -1.
+        """
+        best = -1
+        closest = self.radius ** 2
+        i = bisect_left(self._lats, lat - self._radius_lat)
+        while i < len(self._lats) and self._lats[i] <= lat + self._radius_lat:
+            dy = (self._lats[i] - lat) / Point.degree_per_meter_lat
+            dx = (self._lons[i] - lon) / Point.degree_per_meter_lon
+            if dx * dx + dy * dy <= closest:
+                best = i
+                closest = dx * dx + dy * dy
+            i += 1
+        return best
+
+    def stops_at(self, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+        """
+        Like stop_at(), for many positions at once.
+        """
+        best = np.full(len(lats), -1, dtype=np.int64)
+        closest = np.full(len(lats), self.radius ** 2)
+        first = np.searchsorted(self.lats, lats - self._radius_lat)
+        stop = np.searchsorted(self.lats, lats + self._radius_lat, side='right')
+        # the stops close enough in latitude are first to stop - 1; look at the first of them for all positions, then
+        # at the second, and so on
+        for k in range(0, int((stop - first).max(initial=0))):
+            i = first + k
+            candidates = np.flatnonzero(i < stop)
+            j = i[candidates]
+            dy = (self.lats[j] - lats[candidates]) / Point.degree_per_meter_lat
+            dx = (self.lons[j] - lons[candidates]) / Point.degree_per_meter_lon
+            distance = dx * dx + dy * dy
+            closer = distance <= closest[candidates]
+            best[candidates[closer]] = j[closer]
+            closest[candidates[closer]] = distance[closer]
+        return best
+
+    def record(self, train: str, timestamp: float, lat: float, lon: float, speed: float):
+        """
+        Learn from a position of a train.
+        :param timestamp: time of the position, in seconds since the epoch
+        :param speed: the speed of the train, in m/s
+        """
+        if speed >= self.MIN_SPEED:
+            with self._lock:
+                self.speeds.add(speed)
+        self._visit(train, timestamp, self.stop_at(lat, lon))
+
+    def _visit(self, train: str, timestamp: float, stop: int):
+        state = self._trains.get(train)
+        if state is None:
+            self._trains[train] = [stop, timestamp, timestamp, -1, 0.0]
+            return
+        (current, first, last, previous, left) = state
+        if timestamp < last:
+            return
+        if timestamp - last > self.max_gap:
+            self._trains[train] = [stop, timestamp, timestamp, -1, 0.0]
+            return
+        if stop == current:
+            state[2] = timestamp
+            return
+        if current >= 0:
+            self._add('dwell', self.stops[current].trackmarker, last - first, last)
+            (previous, left) = (current, last)
+        if stop >= 0 and previous >= 0 and stop != previous:
+            self._add('leg', (self.stops[previous].trackmarker, self.stops[stop].trackmarker), timestamp - left,
+                      timestamp)
+        self._trains[train] = [stop, timestamp, timestamp, previous, left]
+
+    def _add(self, kind: str, key, value: float, timestamp: float):
+        """
+        Add a travel or dwell time, or keep it for later while reading the history, see add_history().
+        :param kind: 'leg' or 'dwell'
+        :param timestamp: the time the travel or dwell time ended
+        """
+        if self._pending is not None:
+            self._pending.append((timestamp, kind, key, value))
+            return
+        quantiles = self.legs if kind == 'leg' else self.dwells
+        with self._lock:
+            q = quantiles.get(key)
+            if q is None:
+                q = quantiles[key] = RollingQuantiles(self.HALF_LIFE)
+            q.add(value)
+
+    def add_history(self, records: np.ndarray):
+        """
+        Learn from positions read from the history, see HistoryReader. The stops of all positions are found at once,
+        and the positions of each train are reduced to the first and last position of each stay at a stop and each
+        run between stops, so this takes seconds for days of positions.
+        :param records: the positions, as returned by HistoryReader.read()
+        """
+        if len(records) == 0:
+            return
+        # number the trains: sorting and comparing numbers is much faster than byte strings
+        halves = np.ascontiguousarray(records['train']).view('<u8').reshape(-1, 2)
+        (high, high_codes) = np.unique(halves[:, 0], return_inverse=True)
+        (low, low_codes) = np.unique(halves[:, 1], return_inverse=True)
+        codes = high_codes * len(low) + low_codes
+        order = np.lexsort((records['timestamp'], codes))
+        trains = codes[order]
+        timestamps = records['timestamp'][order]
+        # in the order they were recorded, which is the order they were processed in
+        speeds = records['speed'].astype(np.float64) / 3.6
+        with self._lock:
+            self.speeds.add_many(speeds[speeds >= self.MIN_SPEED])
+
+        # the number of the stop each position is at, or -1
+        stops = self.stops_at(records['lat'][order], records['lon'][order])
+
+        # positions that start a run: a different train, a different stop, or after a gap
+        starts = np.ones(len(stops), dtype=bool)
+        starts[1:] = (trains[1:] != trains[:-1]) | (stops[1:] != stops[:-1]) | \
+                     (timestamps[1:] - timestamps[:-1] > self.max_gap)
+        first = np.flatnonzero(starts)
+        last = np.append(first[1:] - 1, len(stops) - 1)
+        # the first and last position of each run are all that matter
+        names = {}
+        self._pending = pending = []
+        try:
+            for f, l, code, stop in zip(first.tolist(), last.tolist(), trains[first].tolist(), stops[first].tolist()):
+                train = names.get(code)
+                if train is None:
+                    train = names[code] = records['train'][order[f]].decode('utf-8', errors='replace')
+                self._visit(train, float(timestamps[f]), stop)
+                if l != f:
+                    self._visit(train, float(timestamps[l]), stop)
+        finally:
+            self._pending = None
+        # add the times in the order they ended, as if the positions had been recorded as they came in
+        for timestamp, kind, key, value in sorted(pending, key=lambda p: p[0]):
+            self._add(kind, key, value, timestamp)
+
+    @classmethod
+    def from_history(cls, tracksmodel: TracksModel, reader: HistoryReader, start: float | None = None,
+                     end: float | None = None, **kwargs) -> 'SegmentStatistics':
+        """
+        Build the statistics from the position history.
+        :param start: only use positions at or after this time, in seconds since the epoch
+        :param end: only use positions before this time
+        :param kwargs: passed to the constructor
+        """
+        statistics = cls(tracksmodel, **kwargs)
+        statistics.add_history(reader.read(start=start, end=end))
+        return statistics
+
+    def leg(self, origin: Waypoint, destination: Waypoint) -> float | None:
+        # the quantiles are read under the lock too: adding a value while they are computed could otherwise leave a
+        # quantile of the values before it in their cache
+        with self._lock:
+            q = self.legs.get((origin.trackmarker, destination.trackmarker))
+            return None if q is None else q.median
+
+    def dwell(self, stop: Waypoint) -> float | None:
+        with self._lock:
+            q = self.dwells.get(stop.trackmarker)
+            return None if q is None else q.median
+
+    def speed(self) -> float | None:
+        with self._lock:
+            return self.speeds.median
+
+    def summary(self, quantiles: tuple = (0.1, 0.5, 0.9)) -> list:
+        """
+        Return the statistics of all legs and stops, for reports.
+        :return: a list of dicts with the names of origin and destination (the same for dwell times), the kind, either
+                 'leg' or 'dwell', the number of times measured, and the quantiles in seconds by q
+        """
+        by_marker = {stop.trackmarker: stop for stop in self.stops}
+        rows = []
+        with self._lock:
+            for kind, times in (('leg', self.legs), ('dwell', self.dwells)):
+                for key, q in sorted(times.items()):
+                    (origin, destination) = key if kind == 'leg' else (key, key)
+                    rows.append({
+                        'origin': by_marker[origin].name,
+                        'destination': by_marker[destination].name,
+                        'kind': kind,
+                        'count': q.count,
+                        'quantiles': {p: q.quantile(p) for p in quantiles},
+                    })
+        return rows
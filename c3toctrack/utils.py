@@ -1,5 +1,15 @@
+import time
+
+
 def dms2dd(degrees, minutes, seconds, direction):
     dd = float(degrees) + float(minutes)/60 + float(seconds)/(60*60)
     if direction == 'E' or direction == 'S':
         dd *= -1
     return dd
+
+
+def format_timestamp(t: float) -> str:
+    """
+    Format a time in seconds since the epoch like the trackers do.
+    """
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(t))
@@ -3,6 +3,8 @@ class Waypoint:
     Abstract base class.
     """
 
+    __slots__ = ('lat', 'lon', 'name', 'trackmarker', 'type', 'ds100')
+
     def __init__(self, lat: float, lon: float, name: str, trackmarker: float):
         """
         Create a waypoint.
@@ -25,12 +27,24 @@ class Waypoint:
         """
         return self.type == "Hp" or self.type == "Bf"
 
+    def to_dict(self) -> dict:
+        return {
+            'ds100': self.ds100,
+            'lat': self.lat,
+            'lon': self.lon,
+            'name': self.name,
+            'trackmarker': self.trackmarker,
+            'type': self.type,
+        }
+
 
 class LevelCrossing(Waypoint):
     """
     A level crossing, in German "Bahnübergang" or "Bü".
     """
 
+    __slots__ = ()
+
     def __init__(self, lat: float, lon: float, name: str, trackmarker: float):
         super().__init__(lat, lon, name, trackmarker)
         self.type = "Bü"
@@ -41,6 +55,8 @@ class Stop(Waypoint):
     A stop, in German "Haltepunkt" or "Hp". Trains can stop here, but it is not a station.
     """
 
+    __slots__ = ()
+
     def __init__(self, lat: float, lon: float, name: str, ds100: str, trackmarker: float):
         super().__init__(lat, lon, name, trackmarker)
         self.type = "Hp"
@@ -54,6 +70,8 @@ class Station(Stop):
     not fulfill these requirements, but trains can still stop there.
     """
 
+    __slots__ = ()
+
     def __init__(self, lat: float, lon: float, name: str, ds100: str, trackmarker: float):
         super().__init__(lat, lon, name, ds100, trackmarker)
         self.type = "Bf"
@@ -64,6 +82,8 @@ class Turnout(Waypoint):
     A turnout or switch. The coordinates should be the endpoints of three track segments.
     """
 
+    __slots__ = ()
+
     def __init__(self, lat: float, lon: float, name: str, trackmarker: float):
         super().__init__(lat, lon, name, trackmarker)
         self.type = "W"
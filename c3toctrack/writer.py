@@ -0,0 +1,108 @@
+import logging
+import threading
+import time
+
+
+class CoalescingWriter:
+    """
+    Runs a flush function in a background thread whenever the state it writes out has been marked dirty, but at most
+    max_rate times per second. All changes marked while a flush is pending are merged into that one flush.
+
+    With a debounce, a flush waits at least that many seconds after the first change it covers, so bursts of updates
+    (for example many trains reporting in the same second) end up in a single write. The debounce does not restart
+    on further changes, so a steady stream of updates cannot delay writing indefinitely.
+
+    A max_rate of 0 disables the background thread, and every change is flushed immediately.
+    """
+
+    def __init__(self, flush, max_rate: float = 1.0, debounce: float = 0.0, name: str = 'writer'):
+        """
+        :param flush: function without arguments that writes the current state
+        :param max_rate: maximum number of flushes per second, or 0 to flush on every change
+        :param debounce: seconds to wait after the first change before flushing
+        :param name: name of the background thread
+        """
+        self._flush = flush
+        self.interval = 1.0 / max_rate if max_rate > 0 else 0
+        self.debounce = debounce
+        self.name = name
+        # counters
+        self.changes = 0
+        self.flushes = 0
+        self.coalesced = 0
+        self.errors = 0
+        self._dirty_since = None
+        self._last_flush = 0
+        self._running = False
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        if self.interval == 0 or self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stop the background thread, writing out any pending changes.
+        """
+        with self._condition:
+            self._running = False
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._dirty_since is not None:
+            self.flush()
+
+    def mark_dirty(self):
+        """
+        Record that the state has changed and needs to be written.
+        """
+        with self._condition:
+            self.changes += 1
+            if self._dirty_since is not None:
+                self.coalesced += 1
+                return
+            self._dirty_since = time.monotonic()
+            self._condition.notify()
+        if not self._running:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the state now, regardless of rate limit and debounce.
+        """
+        with self._condition:
+            self._dirty_since = None
+            self._last_flush = time.monotonic()
+            self.flushes += 1
+        try:
+            self._flush()
+        except Exception as e:
+            self.errors += 1
+            logging.error('%s: unable to write: %s', self.name, e)
+
+    def stats(self) -> dict:
+        return {
+            'changes': self.changes,
+            'flushes': self.flushes,
+            'coalesced': self.coalesced,
+            'errors': self.errors,
+        }
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._running and self._dirty_since is None:
+                    self._condition.wait()
+                if not self._running:
+                    return
+                due = max(self._last_flush + self.interval, self._dirty_since + self.debounce)
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+            self.flush()
@@ -18,7 +18,6 @@ var station = L.icon({
     popupAnchor: [-3, -76]
 });
 var markers = {};
-var markersToRemove = {};
 
 async function getStations() {
     let json;
@@ -42,37 +41,70 @@ async function getStations() {
     }
 }
 
+function showTrain(name, train) {
+    var marker = markers[name];
+    if (marker === undefined) {
+        marker = L.marker([train.lat, train.lon], {
+            icon: lok,
+            zIndexOffset: 1000
+        })
+            .bindTooltip(name, {
+                direction: 'bottom',
+                permanent: true,
+            })
+            .addTo(map);
+        marker._icon.style[L.DomUtil.TRANSFORM+'Origin'] = 'center bottom';
+        markers[name] = marker;
+    }
+    marker.setLatLng(new L.latLng(train.lat, train.lon));
+    marker._icon.style[L.DomUtil.TRANSFORM] += ' rotateZ(' + (train.dir+90) + 'deg)';
+}
+
+function removeTrain(name) {
+    if (markers[name] !== undefined) {
+        map.removeLayer(markers[name]);
+        delete markers[name];
+    }
+}
+
+// the last version of the trains we have seen, see trains-delta.json
+var seq = null;
+
+async function getTrainsDelta() {
+    const res = await fetch("trains-delta.json", {cache: "no-cache"});
+    const delta = await res.json();
+    if (delta.reset || delta.first > seq + 1 || delta.seq < seq) {
+        // we missed changes, or the gateway has been restarted and counts from the start again, and have to load all
+        // trains again
+        return false;
+    }
+    for (var name in delta.trains) {
+        showTrain(name, delta.trains[name]);
+    }
+    for (name of delta.removed) {
+        removeTrain(name);
+    }
+    seq = delta.seq;
+    return true;
+}
+
 async function getTrains() {
-    let json;
     try {
-        const res = await fetch("trains.json");
-        json = await res.json();
-    } catch (e) {
-        setTimeout(getTrains, 30_000);
-    }
-    for (var name in json.trains) {
-        train = json.trains[name];
-        delete markersToRemove[name];
-        var marker = markers[name];
-        if (marker === undefined) {
-            marker = L.marker([train.lat, train.lon], {
-                icon: lok,
-                zIndexOffset: 1000
-            })
-                .bindTooltip(name, {
-                    direction: 'bottom',
-                    permanent: true,
-                })
-                .addTo(map);
-            marker._icon.style[L.DomUtil.TRANSFORM+'Origin'] = 'center bottom';
-            markers[name] = marker;
+        if (seq === null || !await getTrainsDelta()) {
+            const res = await fetch("trains.json", {cache: "no-cache"});
+            const json = await res.json();
+            for (var name in markers) {
+                if (!(name in json.trains)) {
+                    removeTrain(name);
+                }
+            }
+            for (name in json.trains) {
+                showTrain(name, json.trains[name]);
+            }
+            seq = json.seq === undefined ? null : json.seq;
         }
-        marker.setLatLng(new L.latLng(train.lat, train.lon));
-        marker._icon.style[L.DomUtil.TRANSFORM] += ' rotateZ(' + (train.dir+90) + 'deg)';
-    }
-    for (name in markersToRemove) {
-        map.removeLayer(markers[name])
-        delete markers[name]
+    } catch (e) {
+        seq = null;
     }
     setTimeout(getTrains, 5_000);
 }
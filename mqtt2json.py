@@ -1,23 +1,82 @@
 #!/usr/bin/env python
 
+import argparse
+import logging
 import os
+import signal
 import sys
 import time
-from shutil import copyfileobj
 
-from c3toctrack import TracksModel, MqttTrainReporterClient
+from c3toctrack import HistoryReader, HistoryWriter, TracksModel, MqttTrainReporterClient
+from c3toctrack.crossings import CrossingMonitor
+from c3toctrack.httpserver import TrainServer
+from c3toctrack.metrics import Metrics
+from c3toctrack.output import OutputFormat, write_if_changed
+from c3toctrack.traveltimes import SegmentStatistics
 
 
 def copy(dst: str, src: str):
-    with open(src, 'rb') as input, open(dst, 'wb') as output:
-        os.fchmod(output.fileno(), 0o664)
-        copyfileobj(input, output)
+    with open(src, 'rb') as input:
+        write_if_changed(dst, input.read())
 
 
+parser = argparse.ArgumentParser(description='Convert train positions reported via MQTT into JSON files.')
+parser.add_argument('hostname', help='MQTT broker')
+parser.add_argument('username')
+parser.add_argument('password')
+parser.add_argument('--max-flush-rate', type=float, default=1.0,
+                    help='write trains.json and trains.geojson at most this many times per second (0: on every message)')
+parser.add_argument('--flush-debounce', type=float, default=0.0,
+                    help='wait this many seconds after a change before writing, to collect changes from more trains')
+parser.add_argument('--workers', type=int, default=0,
+                    help='process messages in this many threads instead of on the MQTT network thread')
+parser.add_argument('--queue-size', type=int, default=1000,
+                    help='maximum number of messages waiting for the worker threads')
+parser.add_argument('--processes', type=int, default=0,
+                    help='process messages in this many processes, to use more cores; replaces --workers. With '
+                         '--travel-times, every process learns the travel times from its own trains only')
+parser.add_argument('--history', metavar='DIRECTORY',
+                    help='record all positions in segment files in this directory')
+parser.add_argument('--travel-times', action='store_true',
+                    help='estimate arrivals from the travel times between stops, learned from the positions in the '
+                         'history (--history) and from then on from the live positions')
+parser.add_argument('--crossings', action='store_true',
+                    help='publish when trains approach, occupy and clear level crossings to c3toc/crossing/<name>, '
+                         'and write them to crossings.json')
+parser.add_argument('--tracks', default='data/trainlines.gpx',
+                    help='the track network, as GPX, or as OSM XML if the name ends in .osm')
+parser.add_argument('--compact', action='store_true',
+                    help='write the JSON files without indentation, which is faster, and makes them smaller')
+parser.add_argument('--gzip', action='store_true',
+                    help='also write gzip-compressed copies of the JSON files (.gz), for nginx gzip_static')
+parser.add_argument('--brotli', action='store_true',
+                    help='also write Brotli-compressed copies of the JSON files (.br); needs the brotli package')
+parser.add_argument('--tiles', action='store_true',
+                    help='also write the tracks cut into map tiles, to webroot/tiles/{zoom}/{x}/{y}.geojson')
+parser.add_argument('--cache-dir', default='cache',
+                    help='keep a compiled copy of the track model here, to speed up restarts')
+parser.add_argument('--snapshot', metavar='FILE',
+                    help='save the trains to this file every few seconds and on exit, and restore them from it on '
+                         'start (default: trains.snapshot in --cache-dir)')
+parser.add_argument('--no-snapshot', action='store_true', help='start without trains, and do not save them')
+parser.add_argument('--snapshot-interval', type=float, default=10.0, help='seconds between two snapshots')
+parser.add_argument('--http-port', type=int,
+                    help='also serve tracks, trains, the map, and a live event stream via HTTP on this port')
+parser.add_argument('--http-host', default='localhost', help='address for the HTTP server to listen on')
+parser.add_argument('--metrics', action='store_true',
+                    help='record counters and timings, and serve them at /metrics with --http-port')
+parser.add_argument('--metrics-file', metavar='FILE',
+                    help='record counters and timings, and write them to this file every second')
+parser.add_argument('--log-level', default='INFO', choices=('DEBUG', 'INFO', 'WARNING', 'ERROR'),
+                    help='DEBUG logs every message received and every position processed')
+args = parser.parse_args()
+
+logging.basicConfig(level=args.log_level, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
 for f in ('index.html', 'lok.png', 'map.html', 'station.png', 'updatemap.js'):
     copy(f'webroot/{f}', f'data/{f}')
 
-tracksmodel = TracksModel('data/trainlines.gpx', {
+tracksmodel = TracksModel.cached(args.tracks, {
     'Airolostrecke': 563,
     'Bäderbahn': 690,
     'Gotthard-Basistunnel': 486,
@@ -25,15 +84,61 @@ tracksmodel = TracksModel('data/trainlines.gpx', {
     'Y-Trasse': 918,
     'Berliner Außenring': 918,
     'Marschbahn': 1704
-})
-tracksmodel.write_json('webroot/tracks.json')
-tracksmodel.write_geojson('webroot/tracks.geojson')
+}, args.cache_dir)
+output_format = OutputFormat(pretty=not args.compact, gzip=args.gzip, brotli=args.brotli)
+tracksmodel.write_json('webroot/tracks.json', output_format)
+tracksmodel.write_geojson('webroot/tracks.geojson', output_format)
+tracksmodel.write_lod('webroot', tiles=args.tiles, output_format=OutputFormat(pretty=False, gzip=True,
+                                                                              brotli=args.brotli))
 tracksmodel.write_station_table('webroot/stations.dokuwiki')
 
-mqttClient = MqttTrainReporterClient(sys.argv[1], sys.argv[2], sys.argv[3], 'c3toc/train/#', tracksmodel,
-                                     'webroot/trains.json', 'webroot/trains.geojson')
-mqttClient.client.loop_start()
+metrics = None
+if args.metrics or args.metrics_file is not None:
+    metrics = Metrics()
+
+travel_times = None
+if args.travel_times:
+    t0 = time.perf_counter()
+    travel_times = SegmentStatistics(tracksmodel)
+    if args.history is not None:
+        travel_times.add_history(HistoryReader(args.history).read())
+    logging.info('Learned %d legs and %d stops in %.1f seconds', len(travel_times.legs), len(travel_times.dwells),
+                 time.perf_counter() - t0)
+
+crossings = None
+if args.crossings:
+    crossings = CrossingMonitor(tracksmodel)
+
+history = None
+if args.history is not None:
+    history = HistoryWriter(args.history)
+
+snapshot = None
+if not args.no_snapshot:
+    snapshot = args.snapshot or os.path.join(args.cache_dir, 'trains.snapshot')
+
+mqttClient = MqttTrainReporterClient(args.hostname, args.username, args.password, 'c3toc/train/#', tracksmodel,
+                                     'webroot/trains.json', 'webroot/trains.geojson',
+                                     max_flush_rate=args.max_flush_rate, flush_debounce=args.flush_debounce,
+                                     ingest_workers=args.workers, ingest_queue_size=args.queue_size,
+                                     history=history, trains_delta='webroot/trains-delta.json',
+                                     travel_times=travel_times, processes=args.processes, metrics=metrics,
+                                     output_format=output_format, crossings=crossings,
+                                     crossings_json='webroot/crossings.json' if args.crossings else None,
+                                     snapshot=snapshot, snapshot_interval=args.snapshot_interval)
+mqttClient.start()
+
+if args.http_port is not None:
+    server = TrainServer(mqttClient, tracksmodel, static_dir='data', host=args.http_host, port=args.http_port)
+    server.start_thread()
 
-while True:
-    mqttClient.cleanup()
-    time.sleep(1)
+# on deployments, the gateway is stopped with SIGTERM; save the trains before exiting
+signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+try:
+    while True:
+        mqttClient.cleanup()
+        if args.metrics_file is not None:
+            metrics.write(args.metrics_file)
+        time.sleep(1)
+finally:
+    mqttClient.stop()
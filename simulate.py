@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+Load test the gateway with a simulated fleet of trains, see c3toctrack/simulator.py.
+
+Publish 1000 trains reporting every 10 seconds, 30 times faster than real time, to a broker:
+
+    poetry run python simulate.py --trains 1000 --compression 30 mqtthostname
+
+Or to a local stand-in broker, with a gateway in this process subscribed to it, to find the rate at which the gateway
+cannot keep up any more: once it is reached, the queue of the gateway grows, and it processes fewer messages per
+second than are published.
+
+    poetry run python simulate.py --local --trains 2000 --rate 2000 --workers 2
+"""
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+from c3toctrack import MqttTrainReporterClient, TracksModel
+from c3toctrack.broker import LocalBroker
+from c3toctrack.simulator import FleetSimulator, publish
+
+parser = argparse.ArgumentParser(description='Publish the positions of a simulated fleet of trains.')
+parser.add_argument('hostname', nargs='?', help='MQTT broker; with --local, a local one is started instead')
+parser.add_argument('--port', type=int, default=1883)
+parser.add_argument('--local', action='store_true',
+                    help='start a local broker, and a gateway subscribed to it, and report how fast it keeps up')
+parser.add_argument('--tracks', default='data/trainlines.gpx')
+parser.add_argument('--trains', type=int, default=100)
+parser.add_argument('--duration', type=float, default=600, help='simulated seconds')
+parser.add_argument('--interval', type=float, default=10.0, help='seconds between two fixes of a train')
+parser.add_argument('--speed', type=float, nargs=2, default=(8.0, 15.0), metavar=('MIN', 'MAX'),
+                    help='speed of the trains, in km/h')
+parser.add_argument('--dwell', type=float, nargs=2, default=(20.0, 60.0), metavar=('MIN', 'MAX'),
+                    help='seconds the trains stay at a stop')
+parser.add_argument('--noise', type=float, default=3.0, help='GPS error, in meters')
+parser.add_argument('--dropout', type=float, default=0.01, help='probability that a tracker loses its fix')
+parser.add_argument('--fixes-per-message', type=int, default=1,
+                    help='send this many fixes per message in the binary payload; 1 sends JSON')
+parser.add_argument('--compression', type=float, default=1.0, help='run this many times faster than real time')
+parser.add_argument('--rate', type=float, help='publish this many messages per second instead')
+parser.add_argument('--connections', type=int, default=10, help='connections to the broker to publish from')
+parser.add_argument('--workers', type=int, default=0, help='with --local, worker threads of the gateway')
+parser.add_argument('--processes', type=int, default=0, help='with --local, processes of the gateway')
+args = parser.parse_args()
+if args.hostname is None and not args.local:
+    parser.error('either a broker or --local is needed')
+
+logging.basicConfig(level=logging.WARNING)
+# a full ingest queue is reported below, not for every message dropped
+logging.getLogger('c3toctrack.mqttclient').setLevel(logging.ERROR)
+
+tracksmodel = TracksModel(args.tracks, {})
+simulator = FleetSimulator(tracksmodel, trains=args.trains, speed=tuple(args.speed), dwell=tuple(args.dwell),
+                           interval=args.interval, noise=args.noise, dropout=args.dropout,
+                           fixes_per_message=args.fixes_per_message)
+hostname = args.hostname
+port = args.port
+broker = None
+client = None
+tmp = tempfile.TemporaryDirectory()
+if args.local:
+    broker = LocalBroker()
+    broker.start_thread()
+    (hostname, port) = (broker.host, broker.port)
+    client = MqttTrainReporterClient(hostname, None, None, 'c3toc/train/#', tracksmodel,
+                                     os.path.join(tmp.name, 'trains.json'), os.path.join(tmp.name, 'trains.geojson'),
+                                     ingest_workers=args.workers, processes=args.processes, port=port)
+    client.start()
+    deadline = time.perf_counter() + 10
+    while broker.subscribers('c3toc/train/x/pos') == 0:
+        if time.perf_counter() > deadline:
+            client.stop()
+            broker.stop_thread()
+            parser.exit(1, 'the gateway did not subscribe to the local broker within 10 s\n')
+        time.sleep(0.01)
+
+previous = {'seconds': 0.0, 'sent': 0, 'processed': 0}
+
+
+def report(stats: dict):
+    seconds = stats['seconds'] - previous['seconds']
+    line = (f'{stats["seconds"]:6.0f} s  sent {stats["sent"]:8d}  '
+            f'{(stats["sent"] - previous["sent"]) / seconds:7.0f}/s  lag {stats["lag"]:6.2f} s  '
+            f'backlog {stats["backlog"]:6d}')
+    if client is not None:
+        received = client.received
+        line += (f'  gateway received {received:8d}  {(received - previous["processed"]) / seconds:7.0f}/s  '
+                 f'queue {client.queue_depth():6d}')
+        ingest = client.stats().get('ingest')
+        if ingest is not None:
+            line += f'  dropped {ingest["dropped"] + ingest["superseded"]:7d}'
+        previous['processed'] = received
+    previous.update(seconds=stats['seconds'], sent=stats['sent'])
+    print(line, flush=True)
+
+
+stats = publish(simulator.messages(args.duration), hostname, port, args.connections, args.compression, args.rate,
+                report)
+print(f'sent {stats["sent"]} messages in {stats["seconds"]:.1f} s: {stats["rate"]:.0f} messages/s')
+if client is not None:
+    t0 = time.perf_counter()
+    while client.received < stats['sent'] or client.queue_depth() > 0:
+        if time.perf_counter() - t0 > 30:
+            print(f'gateway received {client.received} of {stats["sent"]} messages')
+            break
+        time.sleep(0.01)
+    caught_up = time.perf_counter() - t0
+    client.stop()
+    broker.stop_thread()
+    print(f'gateway processed {client.processed} positions, {client.errors} errors; '
+          f'{caught_up:.2f} s to catch up after the last message')
+tmp.cleanup()